@@ -1,67 +1,51 @@
 #!/usr/bin/env python3
 import os
 import json
+import queue
+import time
+import threading
 import tkinter as tk
 from tkinter import ttk, messagebox
-import psycopg2
-import psycopg2.extras
 
-EXCLUDE_DIRS = {'node_modules', '.next', 'prompts'}
-SUPABASE_CONFIG_FILENAME = "supabase_config.local"
-
-# --------------------------------------------------------------------------
-# Supabase config helpers
-# --------------------------------------------------------------------------
-def load_supabase_config(base_path):
-    config_file = os.path.join(base_path, SUPABASE_CONFIG_FILENAME)
-    if os.path.exists(config_file):
-        try:
-            with open(config_file, 'r', encoding="utf-8") as f:
-                return json.load(f)
-        except Exception as e:
-            print("Failed to load supabase_config.local:", e)
-            return {}
-    return {}
-
-def save_supabase_config(base_path, config):
-    config_file = os.path.join(base_path, SUPABASE_CONFIG_FILENAME)
-    try:
-        with open(config_file, 'w', encoding="utf-8") as f:
-            json.dump(config, f, indent=4)
-    except Exception as e:
-        print("Failed to save supabase_config.local:", e)
-
-# --------------------------------------------------------------------------
-# Generate a directory tree string with exclusions
-# --------------------------------------------------------------------------
-def get_directory_tree(base_path, excluded_paths):
-    tree_str = ""
-    excluded_paths = {os.path.normpath(p) for p in excluded_paths}
-    
-    for root, dirs, files in os.walk(base_path, topdown=True):
-        # Skip excluded directories
-        dirs[:] = [
-            d for d in dirs
-            if d not in EXCLUDE_DIRS and os.path.normpath(os.path.join(root, d)) not in excluded_paths
-        ]
-        files = [
-            f for f in files
-            if os.path.normpath(os.path.join(root, f)) not in excluded_paths
-        ]
-        
-        root_norm = os.path.normpath(root)
-        if root_norm in excluded_paths:
-            dirs[:] = []
-            continue
-
-        level = root.replace(base_path, '').count(os.sep)
-        indent = ' ' * (4 * level)
-        tree_str += f"{indent}{os.path.basename(root)}/\n"
-        
-        subindent = ' ' * (4 * (level + 1))
-        for f in files:
-            tree_str += f"{subindent}{f}\n"
-    return tree_str
+import supabase_export
+from supabase_export import load_supabase_config, save_supabase_config
+from token_cache import TokenCache
+from export_cache import ExportCache
+from token_counter import TOKENIZER_FILENAME, load_tokenizer
+from selection_model import EXCLUDE, INCLUDE, NEUTRAL, SelectionModel
+from token_totals import TokenTotals
+from fs_watcher import create_watcher
+from budget_optimizer import DEFAULT_RULES, BudgetOptimizer, format_plan_stats, rules_from_config
+from output_transform import OutputTransformer
+from output_cache import OutputCache
+from ignore_rules import IGNORE_FILENAMES
+from fs_index import FILE, FsIndex, dir_lister
+from row_refresh import RowRefresher
+from path_search import SEARCH_REVEAL_LIMIT, PathSearch
+from context_engine import (
+    SUPABASE_JSON_FILENAME,
+    load_prompts,
+    estimate_prompt_tokens,
+    count_file_tokens,
+    forced_file_tokens,
+    iter_file_tokens,
+    guard_selected_files,
+    load_ignore,
+    format_write_stats,
+    write_output,
+)
+
+# Background token scan: files per queued batch, and how often / how much the
+# Tk loop drains per tick so the window stays responsive.
+SCAN_BATCH_SIZE = 500
+SCAN_POLL_MS = 50
+SCAN_MAX_BATCHES_PER_TICK = 20
+# How often the Tk loop picks up debounced filesystem-watcher batches
+FS_POLL_MS = 200
+# How often the Supabase dialog picks up results of its background DB work
+DB_POLL_MS = 100
+# Pause in typing before the path search runs
+SEARCH_DELAY_MS = 80
 
 # --------------------------------------------------------------------------
 # Supabase Dialog
@@ -72,9 +56,17 @@ class SupabaseDialog(tk.Toplevel):
         self.parent = parent
         self.base_path = base_path
         self.title("Supabase Connection")
-        self.geometry("700x500")
+        self.geometry("700x740")
         self.resizable(True, True)
         self.conn = None
+        self.catalog = {}
+        self.db_cancel = None
+        self.db_after_id = None
+        # Results of a task that ends after the dialog closed are discarded under this lock
+        self.db_lock = threading.Lock()
+        self.db_pending = None  # (queue, on_discard) of the running task
+        self.closed = False
+        self.progress_total = 0
 
         # Make this a modal dialog
         self.grab_set()
@@ -123,6 +115,18 @@ class SupabaseDialog(tk.Toplevel):
         # Status label
         self.status_label = ttk.Label(self, text="Not connected", foreground="red")
         self.status_label.pack(pady=5)
+
+        # Progress of the running connect/export, which happens off the Tk thread
+        progress_frame = ttk.Frame(self)
+        progress_frame.pack(fill=tk.X, padx=10)
+        self.progress_bar = ttk.Progressbar(progress_frame, mode="determinate", maximum=0)
+        self.progress_bar.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        self.progress_label = ttk.Label(progress_frame, text="")
+        self.progress_label.pack(side=tk.LEFT, padx=5)
+        self.cancel_button = ttk.Button(
+            progress_frame, text="Cancel", command=self.cancel_db_task, state=tk.DISABLED
+        )
+        self.cancel_button.pack(side=tk.LEFT, padx=5)
         
         # Tables frame
         tables_frame = ttk.LabelFrame(self, text="Available Tables (public schema)")
@@ -134,7 +138,60 @@ class SupabaseDialog(tk.Toplevel):
         scrollbar = ttk.Scrollbar(tables_frame, orient="vertical", command=self.tables_listbox.yview)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.tables_listbox.config(yscrollcommand=scrollbar.set)
-        
+
+        # Row sampling (applies to every selected table)
+        sampling = self.config.get("SUPABASE_SAMPLING") or {}
+        default_sample = supabase_export.sample_spec_for(sampling, "*")
+        sample_frame = ttk.LabelFrame(self, text="Row Sampling")
+        sample_frame.pack(fill=tk.X, padx=10, pady=5)
+
+        ttk.Label(sample_frame, text="Mode:").grid(row=0, column=0, sticky=tk.E, padx=5, pady=5)
+        self.sample_mode = tk.StringVar(value=default_sample.get("mode", "all"))
+        ttk.Combobox(
+            sample_frame, textvariable=self.sample_mode, values=supabase_export.SAMPLE_MODES,
+            state="readonly", width=10
+        ).grid(row=0, column=1, sticky=tk.W, padx=5, pady=5)
+
+        ttk.Label(sample_frame, text="Rows:").grid(row=0, column=2, sticky=tk.E, padx=5, pady=5)
+        self.sample_limit_entry = ttk.Entry(sample_frame, width=8)
+        self.sample_limit_entry.grid(row=0, column=3, sticky=tk.W, padx=5, pady=5)
+        self.sample_limit_entry.insert(0, str(default_sample.get("limit", "")))
+
+        ttk.Label(sample_frame, text="Percent:").grid(row=0, column=4, sticky=tk.E, padx=5, pady=5)
+        self.sample_percent_entry = ttk.Entry(sample_frame, width=6)
+        self.sample_percent_entry.grid(row=0, column=5, sticky=tk.W, padx=5, pady=5)
+        self.sample_percent_entry.insert(0, str(default_sample.get("percent", 10)))
+
+        ttk.Label(sample_frame, text="Timestamp column:").grid(row=1, column=0, sticky=tk.E, padx=5, pady=5)
+        self.sample_column_entry = ttk.Entry(sample_frame, width=16)
+        self.sample_column_entry.grid(row=1, column=1, sticky=tk.W, padx=5, pady=5)
+        self.sample_column_entry.insert(0, default_sample.get("column", ""))
+
+        ttk.Label(sample_frame, text="Token budget:").grid(row=1, column=2, sticky=tk.E, padx=5, pady=5)
+        self.token_budget_entry = ttk.Entry(sample_frame, width=8)
+        self.token_budget_entry.grid(row=1, column=3, sticky=tk.W, padx=5, pady=5)
+        self.token_budget_entry.insert(0, str(self.config.get("SUPABASE_TOKEN_BUDGET") or ""))
+
+        ttk.Label(sample_frame, text="Parallel connections:").grid(row=1, column=4, sticky=tk.E, padx=5, pady=5)
+        self.concurrency_spinbox = ttk.Spinbox(sample_frame, from_=1, to=16, width=4)
+        self.concurrency_spinbox.grid(row=1, column=5, sticky=tk.W, padx=5, pady=5)
+        self.concurrency_spinbox.insert(0, str(
+            self.config.get("SUPABASE_EXPORT_CONCURRENCY") or supabase_export.EXPORT_CONCURRENCY
+        ))
+
+        self.use_cache_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(
+            sample_frame, text="Reuse unchanged tables from the last export", variable=self.use_cache_var
+        ).grid(row=2, column=0, columnspan=4, sticky=tk.W, padx=5, pady=5)
+
+        # json: one object per row; csv/tsv/markdown: COPY output as a header-once table
+        ttk.Label(sample_frame, text="Format:").grid(row=2, column=4, sticky=tk.E, padx=5, pady=5)
+        self.export_format = tk.StringVar(value=self.config.get("SUPABASE_EXPORT_FORMAT") or "json")
+        ttk.Combobox(
+            sample_frame, textvariable=self.export_format, values=supabase_export.EXPORT_FORMATS,
+            state="readonly", width=10
+        ).grid(row=2, column=5, sticky=tk.W, padx=5, pady=5)
+
         # Frame for Export + Skip
         bottom_buttons_frame = ttk.Frame(self)
         bottom_buttons_frame.pack(pady=5)
@@ -152,50 +209,184 @@ class SupabaseDialog(tk.Toplevel):
         self.proceed_button = ttk.Button(self, text="Proceed", command=self.destroy)
         self.proceed_button.pack(pady=5)
         
+    # ------------------------------------------------------------------
+    # Background database work
+    # ------------------------------------------------------------------
+    def run_db_task(self, status, work, on_done, on_error, on_discard=None):
+        """
+        Run work(cancel, progress) on a worker thread so the dialog stays
+        responsive; results and progress come back through a queue polled
+        with after(). If the dialog is closed before on_done could run, the
+        result goes to on_discard instead (to release what it holds).
+        """
+        self.db_cancel = supabase_export.CancelToken()
+        db_queue = queue.Queue()
+        self.db_pending = (db_queue, on_discard)
+
+        def progress(table, rows, done):
+            db_queue.put(("progress", table, rows, done))
+
+        def worker(cancel):
+            try:
+                result = work(cancel, progress)
+            except Exception as e:
+                db_queue.put(("error", e))
+                return
+            with self.db_lock:
+                if not self.closed:
+                    db_queue.put(("done", result))
+                    return
+            if on_discard is not None:
+                on_discard(result)
+
+        self.progress_rows = {}
+        self.progress_done = set()
+        self.set_busy(True, status)
+        threading.Thread(target=worker, args=(self.db_cancel,), daemon=True).start()
+        self.db_after_id = self.after(DB_POLL_MS, self.poll_db_task, db_queue, on_done, on_error)
+
+    def poll_db_task(self, db_queue, on_done, on_error):
+        self.db_after_id = None
+        try:
+            while True:
+                kind, *payload = db_queue.get_nowait()
+                if kind == "progress":
+                    table, rows, done = payload
+                    self.progress_rows[table] = rows
+                    if done:
+                        self.progress_done.add(table)
+                    continue
+                cancelled = self.db_cancel.cancelled
+                self.db_cancel = None
+                self.db_pending = None
+                self.set_busy(False)
+                if kind == "done":
+                    on_done(payload[0])
+                else:
+                    on_error(payload[0], cancelled)
+                return
+        except queue.Empty:
+            pass
+        self.update_progress()
+        self.db_after_id = self.after(DB_POLL_MS, self.poll_db_task, db_queue, on_done, on_error)
+
+    def update_progress(self):
+        total = self.progress_total
+        rows = sum(self.progress_rows.values())
+        if total:
+            self.progress_bar.config(value=len(self.progress_done))
+            self.progress_label.config(text=f"{len(self.progress_done)}/{total} tables, {rows:,} rows streamed")
+
+    def set_busy(self, busy, status=None):
+        state = tk.DISABLED if busy else tk.NORMAL
+        self.connect_button.config(state=state)
+        self.export_button.config(state=tk.DISABLED if busy or not self.conn else tk.NORMAL)
+        self.cancel_button.config(state=tk.NORMAL if busy else tk.DISABLED)
+        if status is not None:
+            self.status_label.config(text=status, foreground="black")
+
+    def cancel_db_task(self):
+        """Stop the running task; queries in flight are cancelled on the server."""
+        if self.db_cancel is not None:
+            self.status_label.config(text="Cancelling...", foreground="black")
+            self.db_cancel.cancel()
+
+    def destroy(self):
+        if self.db_cancel is not None:
+            self.db_cancel.cancel()
+        if self.db_after_id is not None:
+            self.after_cancel(self.db_after_id)
+            self.db_after_id = None
+        with self.db_lock:
+            self.closed = True
+        # A result queued before the close is never polled now
+        if self.db_pending is not None:
+            db_queue, on_discard = self.db_pending
+            self.db_pending = None
+            while on_discard is not None and not db_queue.empty():
+                kind, *payload = db_queue.get_nowait()
+                if kind == "done":
+                    on_discard(payload[0])
+        super().destroy()
+
+    # ------------------------------------------------------------------
+    # Connect / list tables
+    # ------------------------------------------------------------------
     def connect_db(self):
         host = self.host_entry.get().strip()
         port = self.port_entry.get().strip()
         db = self.db_entry.get().strip()
         user = self.user_entry.get().strip()
         password = self.password_entry.get().strip()
-        
-        try:
-            self.conn = psycopg2.connect(host=host, port=port, database=db, user=user, password=password)
+
+        def work(cancel, progress):
+            conn = supabase_export.connect(host, port, db, user, password)
+            try:
+                cancel.check()
+                with cancel.track(conn):
+                    # Columns, keys and indexes for every table in one round trip;
+                    # reused by the export so it doesn't query the catalog again
+                    catalog = supabase_export.fetch_catalog(conn)
+                    conn.rollback()
+                cancel.check()
+            except BaseException:
+                conn.close()
+                raise
+            return conn, catalog
+
+        def on_done(result):
+            if self.conn is not None:
+                self.conn.close()
+            self.conn, self.catalog = result
             self.status_label.config(text="Connected successfully!", foreground="green")
             self.export_button.config(state=tk.NORMAL)
             self.populate_tables()
-            self.config = {
+            self.config.update({
                 "SUPABASE_HOST": host,
                 "SUPABASE_PORT": port,
                 "SUPABASE_DB": db,
                 "SUPABASE_USER": user,
                 "SUPABASE_PASSWORD": password
-            }
+            })
             save_supabase_config(self.base_path, self.config)
-        except Exception as e:
-            messagebox.showerror("Connection Error", f"Failed to connect:\n{str(e)}")
+
+        def on_error(e, cancelled):
+            if not cancelled:
+                messagebox.showerror("Connection Error", f"Failed to connect:\n{str(e)}")
             self.status_label.config(text="Not connected", foreground="red")
-    
+            self.export_button.config(state=tk.NORMAL if self.conn else tk.DISABLED)
+
+        def on_discard(result):
+            # Connected after the dialog closed
+            result[0].close()
+
+        self.progress_total = 0
+        self.progress_bar.config(maximum=0, value=0)
+        self.progress_label.config(text="")
+        self.run_db_task("Connecting...", work, on_done, on_error, on_discard)
+
     def populate_tables(self):
-        if not self.conn:
-            return
-        query = """
-            SELECT table_name 
-            FROM information_schema.tables
-            WHERE table_schema = 'public'
-            ORDER BY table_name;
-        """
-        try:
-            cur = self.conn.cursor()
-            cur.execute(query)
-            tables = cur.fetchall()
-            self.tables_listbox.delete(0, tk.END)
-            for (table_name,) in tables:
-                self.tables_listbox.insert(tk.END, table_name)
-            cur.close()
-        except Exception as e:
-            messagebox.showerror("Error Retrieving Tables", str(e))
-    
+        self.tables_listbox.delete(0, tk.END)
+        for table_name in self.catalog:
+            self.tables_listbox.insert(tk.END, table_name)
+
+    def read_sampling(self):
+        """Sampling spec and token budget from the form; raises ValueError on bad numbers."""
+        spec = {"mode": self.sample_mode.get()}
+        limit = self.sample_limit_entry.get().strip()
+        if limit:
+            spec["limit"] = int(limit)
+        if spec["mode"] in ("system", "bernoulli"):
+            spec["percent"] = float(self.sample_percent_entry.get().strip() or 10)
+        column = self.sample_column_entry.get().strip()
+        if spec["mode"] == "recent" and column:
+            spec["column"] = column
+        budget = self.token_budget_entry.get().strip()
+        return spec, int(budget) if budget else None
+
+    # ------------------------------------------------------------------
+    # Export
+    # ------------------------------------------------------------------
     def export_tables(self):
         if not self.conn:
             messagebox.showwarning("Not Connected", "Please connect to Supabase first!")
@@ -207,47 +398,76 @@ class SupabaseDialog(tk.Toplevel):
             return
 
         selected_tables = [self.tables_listbox.get(i) for i in selected_indices]
-        export_data = {}
         try:
-            cur = self.conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-            for table in selected_tables:
-                # Get column schema.
-                cur.execute("""
-                    SELECT column_name, data_type, is_nullable, column_default
-                    FROM information_schema.columns
-                    WHERE table_schema = 'public' AND table_name = %s
-                    ORDER BY ordinal_position;
-                """, (table,))
-                columns = cur.fetchall()
-
-                # Get all table rows.
-                cur.execute(f"SELECT * FROM {table};")
-                rows = cur.fetchall()
-
-                export_data[table] = {"schema": columns, "rows": rows}
-            cur.close()
-            
-            json_str = json.dumps(export_data, indent=4, default=str)
-            json_file = os.path.join(self.base_path, "supabases_tables.json")
-            with open(json_file, "w", encoding="utf-8") as f:
-                f.write(json_str)
-            
-            # Replaced old text with the new instructions
-            prompt_text = (
-                "## Supabase Database Context**\n"
-                "- Don't create SQL migrations in the XML output, only return sql commands for me to run on the supabase sql editor directly.\n"
-                "- If schema updates are needed, provide the SQL commands **before** the XML output.\n\n"
-                "See the relevant tables below:\n---\n"
-                + json_str +
-                "\n---"
+            spec, token_budget = self.read_sampling()
+            concurrency = max(1, int(self.concurrency_spinbox.get().strip() or 1))
+        except ValueError as e:
+            messagebox.showwarning("Invalid Sampling", str(e))
+            return
+        # The form edits the default; per-table entries in the config file are kept
+        sampling = dict(self.config.get("SUPABASE_SAMPLING") or {})
+        sampling["*"] = spec
+        self.config["SUPABASE_SAMPLING"] = sampling
+        self.config["SUPABASE_TOKEN_BUDGET"] = token_budget
+        self.config["SUPABASE_EXPORT_CONCURRENCY"] = concurrency
+        fmt = self.export_format.get()
+        self.config["SUPABASE_EXPORT_FORMAT"] = fmt
+        save_supabase_config(self.base_path, self.config)
+
+        export_file = os.path.join(self.base_path, supabase_export.export_filename(fmt))
+        use_cache = self.use_cache_var.get()
+        conn, catalog, config, tokenizer = self.conn, self.catalog, dict(self.config), self.parent.tokenizer
+
+        def work(cancel, progress):
+            cache = ExportCache.open_for(self.base_path) if use_cache else None
+            started = time.perf_counter()
+            if concurrency > 1 and len(selected_tables) > 1:
+                # One pooled connection per table in flight; output stays in table order
+                pool = supabase_export.connect_pool(config, min(concurrency, len(selected_tables)))
+                try:
+                    stats = supabase_export.export_tables_parallel(
+                        pool, selected_tables, export_file, sampling, token_budget, tokenizer, catalog,
+                        concurrency, cache, progress=progress, cancel=cancel, fmt=fmt
+                    )
+                finally:
+                    pool.closeall()
+            else:
+                stats = supabase_export.export_tables_to_file(
+                    conn, selected_tables, export_file, sampling, token_budget, tokenizer, catalog, cache,
+                    progress=progress, cancel=cancel, fmt=fmt
+                )
+            elapsed = time.perf_counter() - started
+            # The prompt references the export file; count it here, not on the Tk thread
+            prompt = supabase_export.supabase_file_prompt(export_file)
+            return stats, elapsed, prompt, estimate_prompt_tokens(prompt, tokenizer)
+
+        def on_done(result):
+            stats, elapsed, prompt, prompt_tokens = result
+            # It is streamed into the output rather than held in memory
+            self.parent.add_supabase_prompt(SUPABASE_JSON_FILENAME, prompt, prompt_tokens)
+            messagebox.showinfo(
+                "Export Successful",
+                f"Exported {sum(s['rows'] for s in stats.values())} rows "
+                f"({sum(s['tokens'] for s in stats.values())} tokens) from {len(stats)} tables "
+                f"in {elapsed:.2f}s and prompt added.\n\n"
+                f"{supabase_export.format_export_stats(stats)}\n\n"
+                f"{fmt.upper()} saved at:\n{export_file}"
             )
-            self.parent.add_supabase_prompt("supabases_tables.json", prompt_text)
-            messagebox.showinfo("Export Successful", f"Exported data and prompt added.\nJSON saved at:\n{json_file}")
             self.destroy()
-        except Exception as e:
+
+        def on_error(e, cancelled):
+            if cancelled:
+                # The previous export (if any) is left untouched; the dialog stays open to retry
+                self.status_label.config(text="Export cancelled", foreground="red")
+                return
             messagebox.showerror("Export Error", str(e))
             self.destroy()
 
+        self.progress_total = len(selected_tables)
+        self.progress_bar.config(maximum=len(selected_tables), value=0)
+        self.progress_label.config(text=f"0/{len(selected_tables)} tables, 0 rows streamed")
+        self.run_db_task(f"Exporting {len(selected_tables)} tables...", work, on_done, on_error)
+
 # --------------------------------------------------------------------------
 # Main File Selection / AI Context Builder GUI
 # --------------------------------------------------------------------------
@@ -259,29 +479,66 @@ class FileSelectorGUI(tk.Tk):
         self.geometry("1200x900")
         
         # State dictionaries
-        self.file_token_counts = {}
-        # is_excluded -> path => BooleanVar
-        self.exclusion_vars = {}
-        # is_selected -> either file_vars or dir_vars
-        self.file_vars = {}
-        self.dir_vars = {}
+        # Per-file counts, per-directory aggregates and the selected total
+        self.token_totals = TokenTotals(self.base_path)
+        self.file_token_counts = self.token_totals.file_tokens
+        # Binary / large files found by the scan: path -> BINARY or LARGE
+        self.skipped_files = {}
+        # Include/exclude rules on a path trie; rows read their state from it
+        self.selection = SelectionModel()
 
         self.prompts_data = {}
         self.tree_item_map = {}  # item_id -> path
+        self.path_item_map = {}  # path -> item_id (loaded rows only)
+
+        # Background token scan state
+        self.scan_queue = queue.Queue()
+        self.scan_cancel = threading.Event()
+        self.scan_thread = None
+        self.scan_running = False
+        self.scanned_files = 0
+        try:
+            script_name = os.path.basename(__file__)
+        except NameError:
+            script_name = ""
+        # The tool's caches are excluded by self.ignore; these are only left out of the counts
+        self.scan_skip_names = {script_name, TOKENIZER_FILENAME}
+
+        # .gitignore-aware exclusions shared by every walk (scan, tree, output)
+        self.ignore = load_ignore(self.base_path)
+        # In-memory index of the tree, built by the scan; listings, is-dir
+        # checks and file sizes come from here once it exists
+        self.fs_index = None
+        # Path search over the index (rebuilt when files come and go)
+        self.path_search = None
+        self.search_after = None
+        self.search_opened = []  # rows the current search expanded
+
+        # Filesystem watcher (started once the initial scan completes)
+        self.fs_watcher = None
+        self.fs_queue = queue.Queue()
 
         self.context_file = os.path.join(self.base_path, 'ai_context.config')
 
+        # Token-budget optimizer; rules come from ai_context.config
+        self.budget_optimizer = BudgetOptimizer(self.base_path, {os.path.basename(self.context_file), 'output.txt'})
+        self.budget_rules = dict(DEFAULT_RULES)
+        self.budget_plan = None
+        self.tokenizer = load_tokenizer(self.base_path)
+
         # Optional: style for row lines
         style = ttk.Style(self)
         style.configure("Treeview", rowheight=22, bordercolor="black", relief="solid")
         style.map("Treeview", background=[("selected", "#cceeff")])
 
         self.setup_gui()
-        self.load_all_file_tokens()
+        # Rows are repainted once per event-loop tick, and only if they changed
+        self.rows = RowRefresher(self.tree, self.row_state, self.after_idle)
         self.setup_prompts_frame()
         self.populate_prompts()
 
         self.insert_root_node()
+        self.start_token_scan()
 
         # Open Supabase dialog
         self.after(100, self.open_supabase_dialog)
@@ -293,10 +550,28 @@ class FileSelectorGUI(tk.Tk):
         # Place the tree in a frame with scrollbars
         tree_frame = ttk.Frame(self)
         tree_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        
+
+        # Path search: matches are revealed in the tree as you type
+        search_frame = ttk.Frame(tree_frame)
+        search_frame.pack(side=tk.TOP, fill=tk.X, pady=(0, 2))
+        ttk.Label(search_frame, text="Search:").pack(side=tk.LEFT, padx=(0, 2))
+        self.search_var = tk.StringVar(value="")
+        search_entry = ttk.Entry(search_frame, textvariable=self.search_var, width=40)
+        search_entry.pack(side=tk.LEFT)
+        search_entry.bind("<Escape>", lambda e: self.search_var.set(""))
+        self.search_var.trace_add("write", lambda *args: self.schedule_search())
+        ttk.Button(search_frame, text="Add matches", command=lambda: self.apply_to_matches(INCLUDE)).pack(
+            side=tk.LEFT, padx=(5, 2)
+        )
+        ttk.Button(search_frame, text="Exclude matches", command=lambda: self.apply_to_matches(EXCLUDE)).pack(
+            side=tk.LEFT, padx=2
+        )
+        self.search_label = ttk.Label(search_frame, text="")
+        self.search_label.pack(side=tk.LEFT, padx=5)
+
         self.tree = ttk.Treeview(
             tree_frame,
-            columns=("add_code", "exclude"),
+            columns=("add_code", "exclude", "tokens"),
             show="tree headings"
         )
 
@@ -312,6 +587,11 @@ class FileSelectorGUI(tk.Tk):
         self.tree.heading("exclude", text="Exclude", anchor="center")
         self.tree.column("exclude", width=80, anchor="center", stretch=False)
 
+        # Token column: file counts and directory subtotals, filled in as the
+        # background scan reports counts
+        self.tree.heading("tokens", text="Tokens", anchor="e")
+        self.tree.column("tokens", width=80, anchor="e", stretch=False)
+
         # Vertical scrollbar
         yscroll = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview)
         self.tree.configure(yscroll=yscroll.set)
@@ -326,12 +606,14 @@ class FileSelectorGUI(tk.Tk):
 
         # Bind events
         self.tree.bind("<<TreeviewOpen>>", self.on_tree_expand)
+        self.tree.bind("<<TreeviewClose>>", self.on_tree_collapse)
         self.tree.bind("<Button-1>", self.on_tree_click)
 
         # Tags for color
         self.tree.tag_configure("excluded", foreground="red")
         self.tree.tag_configure("selected", foreground="green")
         self.tree.tag_configure("normal", foreground="black")
+        self.tree.tag_configure("skipped", foreground="gray")
 
         # Control frame
         self.control_frame = ttk.Frame(self)
@@ -346,25 +628,274 @@ class FileSelectorGUI(tk.Tk):
 
         ttk.Button(self.control_frame, text="Clear all", command=self.clear_all).pack(side=tk.LEFT, padx=5)
 
-    def load_all_file_tokens(self):
+        # Token budget: when enabled, the optimizer picks (and trims) files
+        ttk.Label(self.control_frame, text="Budget:").pack(side=tk.LEFT, padx=(10, 2))
+        self.budget_var = tk.StringVar(value="")
+        budget_entry = ttk.Entry(self.control_frame, textvariable=self.budget_var, width=8)
+        budget_entry.pack(side=tk.LEFT)
+        budget_entry.bind("<Return>", lambda e: self.update_token_count())
+        budget_entry.bind("<FocusOut>", lambda e: self.update_token_count())
+        self.fit_budget_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            self.control_frame, text="Fit to budget", variable=self.fit_budget_var, command=self.update_token_count
+        ).pack(side=tk.LEFT, padx=5)
+
+        # Output transform stage (see output_transform)
+        self.dedupe_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self.control_frame, text="Dedupe", variable=self.dedupe_var).pack(side=tk.LEFT, padx=2)
+        self.minify_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self.control_frame, text="Minify", variable=self.minify_var).pack(side=tk.LEFT, padx=2)
+        # Only the files changed since the last Generate Output (see output_cache)
+        self.changed_only_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            self.control_frame, text="Changed only", variable=self.changed_only_var
+        ).pack(side=tk.LEFT, padx=2)
+
+        # Scan progress + cancel
+        self.cancel_scan_button = ttk.Button(self.control_frame, text="Cancel Scan", command=self.cancel_token_scan)
+        self.cancel_scan_button.pack(side=tk.RIGHT, padx=5)
+        self.scan_label = ttk.Label(self.control_frame, text="")
+        self.scan_label.pack(side=tk.RIGHT, padx=5)
+
+    # ----------------------------------------------------------------------
+    # Background token scan
+    # ----------------------------------------------------------------------
+    def start_token_scan(self):
+        """Count tokens on a worker thread; results arrive via poll_token_scan."""
+        self.scan_label.config(text="Scanning files...")
+        self.scan_running = True
+        self.scan_thread = threading.Thread(target=self.token_scan_worker, daemon=True)
+        self.scan_thread.start()
+        self.after(SCAN_POLL_MS, self.poll_token_scan)
+
+    def token_scan_worker(self):
+        # Runs off the Tk thread: only talks to the GUI through scan_queue.
+        # Unchanged files are served from the on-disk cache without being reopened.
+        # sqlite connections are thread-bound, so the cache is opened here.
+        # The tree is walked once, into the index every later listing uses.
+        cache = TokenCache.open_for(self.base_path, self.tokenizer.name)
+        kinds = {}
+        batch = []
         try:
-            script_name = os.path.basename(__file__)
-        except NameError:
-            script_name = ""
+            index = FsIndex.build(self.base_path, self.ignore, self.scan_cancel)
+            if not self.scan_cancel.is_set():
+                self.fs_index = index
+                self.path_search = PathSearch.from_index(index)
+            for path, tokens in iter_file_tokens(
+                self.base_path, self.scan_skip_names, cache, self.scan_cancel, self.tokenizer, kinds, self.ignore,
+                index
+            ):
+                batch.append((path, tokens, kinds.pop(path, None)))
+                if len(batch) >= SCAN_BATCH_SIZE:
+                    self.scan_queue.put(batch)
+                    batch = []
+            self.scan_queue.put(batch)
+            if not self.scan_cancel.is_set():
+                # Keep counts (and the index) live from here on
+                self.fs_watcher = create_watcher(
+                    self.base_path, self.on_fs_changes, self.ignore, self.scan_skip_names, index
+                )
+                self.fs_watcher.start()
+        except Exception as e:
+            print("Token scan failed:", e)
+        finally:
+            if cache is not None:
+                cache.close()
+            self.scan_queue.put(None)
+
+    def poll_token_scan(self):
+        done = False
+        for _ in range(SCAN_MAX_BATCHES_PER_TICK):
+            try:
+                batch = self.scan_queue.get_nowait()
+            except queue.Empty:
+                break
+            if batch is None:
+                done = True
+                break
+            touched_dirs = set()
+            for path, tokens, kind in batch:
+                touched_dirs.update(self.token_totals.set_file_tokens(path, tokens, self.selection))
+                self.set_skipped(path, kind)
+                if kind is not None:
+                    touched_dirs.update(self.refresh_forced(path))
+            # One update per visible directory row, not per file
+            self.refresh_dir_tokens(touched_dirs)
+            self.scanned_files += len(batch)
+
+        self.scan_running = not done
+        self.update_token_count()
+        if done:
+            if self.scan_cancel.is_set():
+                self.scan_label.config(text=f"Scan cancelled ({self.scanned_files} files)")
+            else:
+                self.scan_label.config(text=f"Scanned {self.scanned_files} files")
+                self.after(FS_POLL_MS, self.poll_fs_changes)
+            self.cancel_scan_button.config(state=tk.DISABLED)
+        else:
+            self.scan_label.config(text=f"Scanning files... {self.scanned_files}")
+            self.after(SCAN_POLL_MS, self.poll_token_scan)
 
-        for root, dirs, files in os.walk(self.base_path, topdown=True):
-            dirs[:] = [d for d in dirs if d not in EXCLUDE_DIRS]
-            for f in files:
-                if f == script_name:
-                    continue
-                full_path = os.path.join(root, f)
-                try:
-                    with open(full_path, 'r', encoding='utf-8', errors='ignore') as ff:
-                        content = ff.read()
-                    # Rough estimate: 1 token ~ 4 chars
-                    self.file_token_counts[full_path] = len(content) // 4
-                except Exception:
-                    self.file_token_counts[full_path] = 0
+    def cancel_token_scan(self):
+        self.scan_cancel.set()
+        self.cancel_scan_button.config(state=tk.DISABLED)
+
+    # ----------------------------------------------------------------------
+    # Live updates from the filesystem watcher
+    # ----------------------------------------------------------------------
+    def on_fs_changes(self, paths):
+        # Runs on the watcher thread: count tokens here, apply them on the Tk thread
+        changed_rules = {os.path.dirname(p) for p in paths if os.path.basename(p) in IGNORE_FILENAMES}
+        if changed_rules:
+            # Recompile, then rescan the directories whose rules changed
+            self.ignore.reload()
+            paths = set(paths) | changed_rules
+        index = self.fs_index
+        if self.base_path in paths:
+            # A full rescan (inotify overflow, root ignore rules): swap in a new index
+            index = self.fs_index = FsIndex.build(self.base_path, self.ignore)
+        updates = {}
+        kinds = {}
+        rescanned = []
+        removed = []
+        # Whether paths were added or removed (the search must be rebuilt)
+        reshaped = self.base_path in paths
+        # Rescanned directories only reopen files whose stat changed. The cache is
+        # thread-bound, so it is opened here, and only the rows under each
+        # rescanned directory are read from it
+        cache = None
+        try:
+            for path in sorted(paths):
+                if path != self.base_path:
+                    was_indexed = index.find(path) is not None
+                    index.refresh(path)
+                node = index.find(path)
+                if path != self.base_path and (node is None) == was_indexed:
+                    reshaped = True
+                if node is None:
+                    removed.append(path)
+                elif node in index.children:
+                    reshaped = True
+                    if cache is None:
+                        cache = TokenCache.open_for(self.base_path, self.tokenizer.name, load=False)
+                    if cache is not None:
+                        cache.load_under(path)
+                    counts = dict(iter_file_tokens(
+                        path, self.scan_skip_names, cache, tokenizer=self.tokenizer, skipped=kinds, index=index
+                    ))
+                    updates.update(counts)
+                    rescanned.append((path, set(counts)))
+                elif index.kind[node] == FILE:
+                    updates[path] = count_file_tokens(path, self.tokenizer, kinds)
+                    index.set_tokens(node, updates[path])
+        finally:
+            if cache is not None:
+                cache.close()
+        if reshaped:
+            self.path_search = PathSearch.from_index(index)
+        self.fs_queue.put((paths, updates, kinds, rescanned, removed))
+
+    def poll_fs_changes(self):
+        try:
+            while True:
+                self.apply_fs_changes(*self.fs_queue.get_nowait())
+        except queue.Empty:
+            pass
+        self.after(FS_POLL_MS, self.poll_fs_changes)
+
+    def apply_fs_changes(self, paths, updates, kinds, rescanned, removed):
+        """Patch token counts and loaded tree rows for one debounced batch."""
+        touched_dirs = set()
+        stale = set()
+        for path in removed:
+            if path in self.file_token_counts:
+                stale.add(path)
+            else:
+                # A removed directory: drop every file counted under it
+                prefix = os.path.join(path, "")
+                stale.update(p for p in self.file_token_counts if p.startswith(prefix))
+        for dir_path, present in rescanned:
+            prefix = os.path.join(dir_path, "")
+            stale.update(p for p in self.file_token_counts if p.startswith(prefix) and p not in present)
+        for path in stale:
+            touched_dirs.update(self.token_totals.remove_file(path, self.selection))
+            self.skipped_files.pop(path, None)
+        self.budget_optimizer.invalidate(stale | set(updates))
+
+        for path, tokens in updates.items():
+            touched_dirs.update(self.token_totals.set_file_tokens(path, tokens, self.selection))
+            self.set_skipped(path, kinds.get(path))
+
+        # Add/remove rows only under directories that are already expanded
+        for parent in {os.path.dirname(p) for p in paths}:
+            item_id = self.path_item_map.get(parent)
+            if item_id:
+                self.sync_children(item_id, parent)
+
+        for path in updates:
+            if path in self.skipped_files:
+                touched_dirs.update(self.refresh_forced(path))
+        self.refresh_dir_tokens(touched_dirs)
+        self.update_token_count()
+
+    # ----------------------------------------------------------------------
+    # Binary / large files
+    # ----------------------------------------------------------------------
+    def set_skipped(self, path, kind):
+        """Record whether a counted file is skipped, and update its row."""
+        if kind is None:
+            self.skipped_files.pop(path, None)
+        else:
+            self.skipped_files[path] = kind
+        item_id = self.path_item_map.get(path)
+        if item_id:
+            self.rows.mark(item_id)
+
+    def refresh_forced(self, path):
+        """
+        Skipped files under path count 0 tokens unless forced; forced ones
+        are estimated from their size (never read here).
+        Returns the directories whose subtotals changed.
+        """
+        if path in self.skipped_files:
+            paths = [path]
+        else:
+            prefix = os.path.join(path, "")
+            paths = [p for p in self.skipped_files if p.startswith(prefix)]
+        touched_dirs = set()
+        for p in paths:
+            tokens = 0
+            if self.selection.is_forced(p):
+                tokens = forced_file_tokens(self.file_size(p))
+            if self.file_token_counts.get(p, 0) != tokens:
+                touched_dirs.update(self.token_totals.set_file_tokens(p, tokens, self.selection))
+        return touched_dirs
+
+    def file_size(self, path):
+        node = self.fs_index.find(path) if self.fs_index is not None else None
+        if node is not None:
+            return self.fs_index.size[node]
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    def is_dir(self, path):
+        if self.fs_index is not None:
+            return self.fs_index.is_dir(path)
+        return os.path.isdir(path)
+
+    def refresh_dir_tokens(self, dirs):
+        for d in dirs:
+            item_id = self.path_item_map.get(d)
+            if item_id:
+                self.rows.mark(item_id)
+
+    def destroy(self):
+        self.scan_cancel.set()
+        if self.fs_watcher is not None:
+            self.fs_watcher.stop()
+        super().destroy()
 
     # ----------------------------------------------------------------------
     # Prompts
@@ -396,20 +927,7 @@ class FileSelectorGUI(tk.Tk):
         self.selected_prompts_box.pack()
 
     def populate_prompts(self):
-        prompts_dir = os.path.join(self.base_path, "prompts")
-        if not os.path.exists(prompts_dir):
-            return
-        self.prompts_data = {}
-        for fname in sorted(os.listdir(prompts_dir)):
-            if fname.endswith(".txt"):
-                full_path = os.path.join(prompts_dir, fname)
-                try:
-                    with open(full_path, 'r', encoding="utf-8") as f:
-                        content = f.read()
-                    token_count = len(content) // 4
-                    self.prompts_data[fname] = {"path": full_path, "content": content, "tokens": token_count}
-                except Exception:
-                    continue
+        self.prompts_data = load_prompts(self.base_path, self.tokenizer)
         self.available_prompts_box.delete(0, tk.END)
         for fname in sorted(self.prompts_data.keys()):
             self.available_prompts_box.insert(tk.END, fname)
@@ -424,13 +942,12 @@ class FileSelectorGUI(tk.Tk):
             "",
             "end",
             text=display_name,
-            values=("Add", "Exclude"),
+            values=("Add", "Exclude", ""),
             open=False
         )
         self.tree_item_map[item_id] = base_abs
-        
-        self.exclusion_vars[base_abs] = tk.BooleanVar(value=False)
-        self.dir_vars[base_abs] = tk.BooleanVar(value=False)
+        self.path_item_map[base_abs] = item_id
+        self.rows.mark(item_id)
 
         # Add a dummy child
         self.tree.insert(item_id, "end", text="...")
@@ -451,69 +968,100 @@ class FileSelectorGUI(tk.Tk):
                 self.tree.delete(dummy)
                 self.insert_children(item_id, path)
 
-        # If parent is excluded or selected, propagate that
-        if self.exclusion_vars.get(path, tk.BooleanVar()).get():
-            self.propagate_exclusion(path, True)
-        else:
-            if os.path.isdir(path) and self.dir_vars[path].get():
-                self.propagate_selection(path, True)
+        # Rows loaded earlier may have been left stale while collapsed
+        self.rows.opened(item_id)
+        self.rows.mark_subtree(item_id)
 
-        self.refresh_subtree(item_id)
+    def on_tree_collapse(self, event):
+        item_id = self.tree.focus()
+        if item_id:
+            self.rows.closed(item_id)
+
+    def list_children(self, parent_path):
+        """Sorted (dirs, files) names of a directory, minus ignored entries."""
+        entries = dir_lister(self.ignore, self.fs_index)(parent_path)
+        if entries is None:
+            raise PermissionError(parent_path)
+        dirs = []
+        files = []
+        for name, kind in entries:
+            if kind == FILE:
+                files.append(name)
+            else:
+                dirs.append(name)
+        dirs.sort()
+        files.sort()
+        return dirs, files
+
+    def insert_row(self, parent_item, name, is_dir, index="end"):
+        full_path = os.path.join(self.tree_item_map[parent_item], name)
+        tags, values = state = self.path_state(full_path)
+        iid = self.tree.insert(
+            parent_item,
+            index,
+            text=name,
+            values=values,
+            tags=tags,
+            open=False
+        )
+        self.tree_item_map[iid] = full_path
+        self.path_item_map[full_path] = iid
+        self.rows.rendered_as(iid, state)
+
+        if is_dir:
+            # Add a dummy child so we can lazy-load its children
+            self.tree.insert(iid, "end", text="...")
+        return iid
 
     def insert_children(self, parent_item, parent_path):
         """Inserts actual child dirs/files for a given directory, if they aren't excluded."""
         try:
-            with os.scandir(parent_path) as entries:
-                dirs = []
-                files = []
-                for e in entries:
-                    if e.name in EXCLUDE_DIRS:
-                        continue
-                    if e.is_dir():
-                        dirs.append(e.name)
-                    else:
-                        files.append(e.name)
-
-            dirs.sort()
-            files.sort()
-
-            for d in dirs:
-                full_path = os.path.join(parent_path, d)
-                iid = self.tree.insert(
-                    parent_item,
-                    "end",
-                    text=d,
-                    values=("Add", "Exclude"),
-                    open=False
-                )
-                self.tree_item_map[iid] = full_path
-
-                self.exclusion_vars.setdefault(full_path, tk.BooleanVar(value=False))
-                self.dir_vars.setdefault(full_path, tk.BooleanVar(value=False))
-
-                # Add a dummy child so we can lazy-load its children
-                self.tree.insert(iid, "end", text="...")
-
-                self.update_item_appearance(iid, full_path)
-
-            for f in files:
-                full_path = os.path.join(parent_path, f)
-                iid = self.tree.insert(
-                    parent_item,
-                    "end",
-                    text=f,
-                    values=("Add", "Exclude"),
-                    open=False
-                )
-                self.tree_item_map[iid] = full_path
-
-                self.exclusion_vars.setdefault(full_path, tk.BooleanVar(value=False))
-                self.file_vars.setdefault(full_path, tk.BooleanVar(value=False))
+            dirs, files = self.list_children(parent_path)
+        except PermissionError:
+            return
+        for d in dirs:
+            self.insert_row(parent_item, d, True)
+        for f in files:
+            self.insert_row(parent_item, f, False)
 
-                self.update_item_appearance(iid, full_path)
+    def children_loaded(self, item_id):
+        children = self.tree.get_children(item_id)
+        return not (len(children) == 1 and self.tree.item(children[0], "text") == "...")
 
-        except PermissionError:
-            pass
+    def forget_rows(self, item_id):
+        """Drop item_id and its loaded descendants from the path maps."""
+        for child_id in self.tree.get_children(item_id):
+            self.forget_rows(child_id)
+        self.rows.forget(item_id)
+        path = self.tree_item_map.pop(item_id, None)
+        if path is not None and self.path_item_map.get(path) == item_id:
+            del self.path_item_map[path]
+
+    def sync_children(self, parent_item, parent_path):
+        """Bring an already-loaded directory row in line with the disk."""
+        if not self.children_loaded(parent_item):
+            return
+        try:
+            dirs, files = self.list_children(parent_path)
+        except OSError:
+            dirs, files = [], []
+        wanted = [(d, True) for d in dirs] + [(f, False) for f in files]
+        existing = {
+            os.path.basename(self.tree_item_map[c]): c
+            for c in self.tree.get_children(parent_item)
+            if c in self.tree_item_map
+        }
+        wanted_names = {name for name, _ in wanted}
+        for name, iid in existing.items():
+            if name not in wanted_names:
+                self.forget_rows(iid)
+                self.tree.delete(iid)
+        for index, (name, is_dir) in enumerate(wanted):
+            iid = existing.get(name)
+            if iid is None:
+                self.insert_row(parent_item, name, is_dir, index)
+            else:
+                self.tree.move(iid, parent_item, index)
 
     # ----------------------------------------------------------------------
     # Expand only one level: the root directory and its immediate children
@@ -528,6 +1076,7 @@ class FileSelectorGUI(tk.Tk):
         for item_id in root_items:
             # Expand the root item itself
             self.tree.item(item_id, open=True)
+            self.rows.opened(item_id)
             path = self.tree_item_map.get(item_id)
             if path:
                 # If the root has a dummy child, remove it and insert real children
@@ -543,15 +1092,103 @@ class FileSelectorGUI(tk.Tk):
                     cpath = self.tree_item_map.get(cid)
                     if not cpath:
                         continue
-                    if os.path.isdir(cpath):
+                    if self.is_dir(cpath):
                         # Expand this child folder to load its sub-children (one more level).
                         self.tree.item(cid, open=True)
+                        self.rows.opened(cid)
                         # If that child folder has a dummy child, remove it
                         cc = self.tree.get_children(cid)
                         if len(cc) == 1 and self.tree.item(cc[0], "text") == "...":
                             self.tree.delete(cc[0])
                             self.insert_children(cid, cpath)
 
+    # ----------------------------------------------------------------------
+    # Path search
+    # ----------------------------------------------------------------------
+    def schedule_search(self):
+        """Run the search once typing pauses."""
+        if self.search_after is not None:
+            self.after_cancel(self.search_after)
+        self.search_after = self.after(SEARCH_DELAY_MS, self.run_search)
+
+    def run_search(self):
+        self.search_after = None
+        self.collapse_search()
+        query = self.search_var.get().strip()
+        if not query:
+            self.search_label.config(text="")
+            self.tree.selection_set(())
+            return
+        if self.path_search is None:
+            self.search_label.config(text="Index not ready yet")
+            return
+        start = time.perf_counter()
+        matches, complete = self.path_search.search(query, SEARCH_REVEAL_LIMIT)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        items = [iid for iid in (self.reveal_path(p) for p in matches) if iid]
+        self.tree.selection_set(items)
+        if items:
+            self.tree.see(items[0])
+        count = f"{len(matches)}" if complete else f"{SEARCH_REVEAL_LIMIT}+"
+        self.search_label.config(text=f"{count} matches ({elapsed_ms:.0f} ms)")
+
+    def reveal_path(self, path):
+        """Expand the rows leading to path (loading them if needed); returns its row."""
+        base_abs = os.path.abspath(self.base_path)
+        rel = os.path.relpath(path, base_abs)
+        if rel.startswith(os.pardir):
+            return None
+        current = base_abs
+        item_id = self.path_item_map.get(current)
+        for part in rel.split(os.sep):
+            if not item_id:
+                return None
+            if not self.tree.item(item_id, "open"):
+                if not self.children_loaded(item_id):
+                    self.tree.delete(self.tree.get_children(item_id)[0])
+                    self.insert_children(item_id, current)
+                self.tree.item(item_id, open=True)
+                self.rows.opened(item_id)
+                self.rows.mark_subtree(item_id)
+                self.search_opened.append(item_id)
+            current = os.path.join(current, part)
+            item_id = self.path_item_map.get(current)
+        return item_id
+
+    def collapse_search(self):
+        """Close the rows the previous search opened, innermost first."""
+        for item_id in reversed(self.search_opened):
+            if item_id in self.tree_item_map:
+                self.tree.item(item_id, open=False)
+                self.rows.closed(item_id)
+        self.search_opened = []
+
+    def apply_to_matches(self, rule):
+        """Add (INCLUDE) or exclude (EXCLUDE) every match of the current search."""
+        query = self.search_var.get().strip()
+        if not query or self.path_search is None:
+            return
+        matches, _ = self.path_search.search(query)
+        if not matches:
+            return
+        verb = "Add" if rule == INCLUDE else "Exclude"
+        if len(matches) > SEARCH_REVEAL_LIMIT and not messagebox.askyesno(
+            "Search", f"{verb} all {len(matches)} matches of '{query}'?"
+        ):
+            return
+        # Parents first: matches inside a matched directory then already
+        # carry its rule and are skipped
+        for path in sorted(matches, key=len):
+            if rule == EXCLUDE:
+                self.selection.set_forced(path, False)
+            if self.selection.effective_rule(path) != rule:
+                self.token_totals.apply_rule(self.selection, path, rule)
+        self.refresh_dir_tokens(self.refresh_forced(self.base_path))
+        self.rows.mark_subtree("")
+        self.update_token_count()
+        done = "Added" if rule == INCLUDE else "Excluded"
+        self.search_label.config(text=f"{done} {len(matches)} matches")
+
     # ----------------------------------------------------------------------
     # Single-click toggles
     # ----------------------------------------------------------------------
@@ -568,96 +1205,61 @@ class FileSelectorGUI(tk.Tk):
         # #1 => add_code, #2 => exclude, #0 => Name
         if col_str == "#1":
             self.handle_add_code(path)
-            self.refresh_subtree(item_id)
+            self.refresh_dir_tokens(self.refresh_forced(path))
+            self.rows.mark_subtree(item_id)
         elif col_str == "#2":
             self.handle_exclude(path)
-            self.refresh_subtree(item_id)
+            self.refresh_dir_tokens(self.refresh_forced(path))
+            self.rows.mark_subtree(item_id)
 
         self.update_token_count()
 
     def handle_add_code(self, path):
         """Toggle between selected/unselected (also clears exclusion)."""
-        if os.path.isdir(path):
-            currently_selected = self.dir_vars[path].get()
-            if currently_selected:
-                self.dir_vars[path].set(False)
-                self.propagate_selection(path, False)
+        if path in self.skipped_files:
+            # A click on a binary / large file itself forces it in (or back out)
+            if self.selection.is_forced(path):
+                self.selection.set_forced(path, False)
+                self.token_totals.apply_rule(self.selection, path, NEUTRAL)
             else:
-                self.exclusion_vars[path].set(False)
-                self.dir_vars[path].set(True)
-                self.propagate_selection(path, True)
+                self.selection.set_forced(path, True)
+                if not self.selection.is_selected(path):
+                    self.token_totals.apply_rule(self.selection, path, INCLUDE)
+            return
+        if self.selection.is_selected(path):
+            self.token_totals.apply_rule(self.selection, path, NEUTRAL)
         else:
-            currently_selected = self.file_vars[path].get()
-            if currently_selected:
-                self.file_vars[path].set(False)
-            else:
-                self.exclusion_vars[path].set(False)
-                self.file_vars[path].set(True)
+            self.token_totals.apply_rule(self.selection, path, INCLUDE)
 
     def handle_exclude(self, path):
         """Toggle between excluded/not-excluded (also unselect if excluded)."""
-        currently_excluded = self.exclusion_vars[path].get()
-        self.propagate_exclusion(path, not currently_excluded)
-
-    # ----------------------------------------------------------------------
-    # Propagation & Refresh
-    # ----------------------------------------------------------------------
-    def propagate_exclusion(self, path, new_state):
-        self.exclusion_vars[path].set(new_state)
-        if os.path.isdir(path):
-            if new_state:
-                self.dir_vars[path].set(False)
-            for root, dirs, files in os.walk(path, topdown=True):
-                dirs[:] = [d for d in dirs if d not in EXCLUDE_DIRS]
-                for d in dirs:
-                    fp = os.path.join(root, d)
-                    self.exclusion_vars.setdefault(fp, tk.BooleanVar(value=False)).set(new_state)
-                    self.dir_vars.setdefault(fp, tk.BooleanVar(value=False)).set(False)
-                for f in files:
-                    fp = os.path.join(root, f)
-                    self.exclusion_vars.setdefault(fp, tk.BooleanVar(value=False)).set(new_state)
-                    self.file_vars.setdefault(fp, tk.BooleanVar(value=False)).set(False)
-        else:
-            self.file_vars[path].set(False)
-
-    def propagate_selection(self, path, new_state):
-        if os.path.isdir(path):
-            self.dir_vars[path].set(new_state)
-            self.exclusion_vars[path].set(False)
-            for root, dirs, files in os.walk(path, topdown=True):
-                dirs[:] = [d for d in dirs if d not in EXCLUDE_DIRS]
-                for d in dirs:
-                    fp = os.path.join(root, d)
-                    self.dir_vars.setdefault(fp, tk.BooleanVar(value=False)).set(new_state)
-                    self.exclusion_vars.setdefault(fp, tk.BooleanVar(value=False)).set(False)
-                for f in files:
-                    fp = os.path.join(root, f)
-                    self.file_vars.setdefault(fp, tk.BooleanVar(value=False)).set(new_state)
-                    self.exclusion_vars.setdefault(fp, tk.BooleanVar(value=False)).set(False)
+        if self.selection.is_excluded(path):
+            self.token_totals.apply_rule(self.selection, path, NEUTRAL)
         else:
-            self.file_vars[path].set(new_state)
-            self.exclusion_vars[path].set(False)
+            self.selection.set_forced(path, False)
+            self.token_totals.apply_rule(self.selection, path, EXCLUDE)
 
-    def refresh_subtree(self, item_id):
+    # ----------------------------------------------------------------------
+    # Refresh
+    # ----------------------------------------------------------------------
+    def row_state(self, item_id):
         path = self.tree_item_map.get(item_id)
-        if path:
-            self.update_item_appearance(item_id, path)
-        for child_id in self.tree.get_children(item_id):
-            self.refresh_subtree(child_id)
-
-    def update_item_appearance(self, item_id, path):
-        excluded = self.exclusion_vars.get(path, tk.BooleanVar()).get()
-        if os.path.isdir(path):
-            selected = self.dir_vars[path].get()
-        else:
-            selected = self.file_vars[path].get()
+        return self.path_state(path) if path is not None else None
 
-        if excluded:
+    def path_state(self, path):
+        """(tags, values) a row shows for path; see RowRefresher."""
+        rule = self.selection.effective_rule(path)
+        if rule == EXCLUDE:
             color_tag = "excluded"
             add_code_text = "Add"
             exclude_text = "X"
+        elif path in self.skipped_files and not self.selection.is_forced(path):
+            # Binary / large: left out of output unless forced
+            color_tag = "skipped"
+            add_code_text = "Skip" if rule == INCLUDE else "Add"
+            exclude_text = "Exclude"
         else:
-            if selected:
+            if rule == INCLUDE:
                 color_tag = "selected"
                 add_code_text = "Yes"
                 exclude_text = "Exclude"
@@ -666,35 +1268,44 @@ class FileSelectorGUI(tk.Tk):
                 add_code_text = "Add"
                 exclude_text = "Exclude"
 
-        self.tree.item(item_id, tags=(color_tag,))
-        self.tree.set(item_id, "add_code", add_code_text)
-        self.tree.set(item_id, "exclude", exclude_text)
+        if path in self.skipped_files:
+            tokens = self.skipped_files[path]
+        elif path in self.file_token_counts:
+            tokens = self.file_token_counts[path]
+        else:
+            tokens = self.token_totals.dir_totals.get(path, "")
+        return (color_tag,), (add_code_text, exclude_text, tokens)
 
     # ----------------------------------------------------------------------
     # Query states
     # ----------------------------------------------------------------------
     @property
     def excluded_paths(self):
-        return {p for p, var in self.exclusion_vars.items() if var.get()}
+        return self.selection.excluded_paths()
 
     def get_selected_files(self):
-        return sorted(
-            p
-            for p, var in self.file_vars.items()
-            if var.get() and not self.exclusion_vars[p].get()
-        )
+        if self.budget_plan is not None:
+            return self.budget_plan["files"]
+        selected_files = self.selection.selected_files(self.ignore, self.fs_index)
+        # Files the scan hasn't reached yet are sniffed here, so binaries never slip through
+        known = self.file_token_counts if self.scan_running else None
+        return guard_selected_files(selected_files, self.selection, self.skipped_files, known)[0]
+
+    def read_budget(self):
+        try:
+            budget = int(self.budget_var.get())
+        except ValueError:
+            return None
+        return budget if budget > 0 else None
 
     # ----------------------------------------------------------------------
     # Clear all
     # ----------------------------------------------------------------------
     def clear_all(self):
         """Resets all selections, exclusions, and prompts."""
-        for p in self.exclusion_vars:
-            self.exclusion_vars[p].set(False)
-        for p in self.dir_vars:
-            self.dir_vars[p].set(False)
-        for p in self.file_vars:
-            self.file_vars[p].set(False)
+        self.selection.clear()
+        self.refresh_forced(self.base_path)
+        self.token_totals.recompute(self.selection)
 
         self.selected_prompts_box.delete(0, tk.END)
         self.available_prompts_box.delete(0, tk.END)
@@ -703,9 +1314,8 @@ class FileSelectorGUI(tk.Tk):
         for fname in sorted(self.prompts_data.keys()):
             self.available_prompts_box.insert(tk.END, fname)
 
-        # Refresh the visible portion
-        for item_id in self.tree.get_children():
-            self.refresh_subtree(item_id)
+        # Repaint the visible rows that changed
+        self.rows.mark_subtree("")
 
         self.update_token_count()
 
@@ -717,9 +1327,10 @@ class FileSelectorGUI(tk.Tk):
         self.wait_window(dialog)
         self.update_token_count()
 
-    def add_supabase_prompt(self, prompt_key, prompt_text):
-        token_count = len(prompt_text) // 4
-        self.prompts_data[prompt_key] = {"path": None, "content": prompt_text, "tokens": token_count}
+    def add_supabase_prompt(self, prompt_key, prompt, token_count=None):
+        if token_count is None:
+            token_count = estimate_prompt_tokens(prompt, self.tokenizer)
+        self.prompts_data[prompt_key] = {"path": getattr(prompt, "path", None), "content": prompt, "tokens": token_count}
         # If not in either list, add to "available" 
         if prompt_key not in self.available_prompts_box.get(0, tk.END) \
            and prompt_key not in self.selected_prompts_box.get(0, tk.END):
@@ -779,8 +1390,8 @@ class FileSelectorGUI(tk.Tk):
         self.update_token_count()
 
     def update_token_count(self):
-        selected_files = self.get_selected_files()
-        total_file_tokens = sum(self.file_token_counts.get(fp, 0) for fp in selected_files)
+        # Maintained incrementally by token_totals as rules and counts change
+        total_file_tokens = self.token_totals.selected_total
 
         total_prompt_tokens = 0
         if hasattr(self, "selected_prompts_box"):
@@ -789,19 +1400,34 @@ class FileSelectorGUI(tk.Tk):
                 if pd:
                     total_prompt_tokens += pd["tokens"]
 
+        # Re-plan on every change once counts are complete (prompts use budget first)
+        budget = self.read_budget() if hasattr(self, "fit_budget_var") and self.fit_budget_var.get() else None
+        if budget is None or self.scan_running:
+            self.budget_plan = None
+        else:
+            self.budget_plan = self.budget_optimizer.plan(
+                self.file_token_counts, self.selection, max(0, budget - total_prompt_tokens), self.budget_rules,
+                self.fs_index, self.token_totals.version
+            )
+            total_file_tokens = self.budget_plan["tokens"]
+
         total = total_file_tokens + total_prompt_tokens
-        self.token_label.config(text=f"Estimated Tokens: {total}")
+        text = f"Estimated Tokens: {total}"
+        if self.budget_plan is not None:
+            text += f" (budget plan: {format_plan_stats(self.budget_plan)})"
+        self.token_label.config(text=text)
 
     # ----------------------------------------------------------------------
     # Save / Load configuration
     # ----------------------------------------------------------------------
     def save_configuration(self):
-        config = {
-            'excluded_paths': list(self.excluded_paths),
-            'selected_files': [p for p, var in self.file_vars.items() if var.get()],
-            'selected_dirs': [p for p, var in self.dir_vars.items() if var.get()],
-            'selected_prompts': list(self.selected_prompts_box.get(0, tk.END)),
-        }
+        config = self.selection.to_config(self.is_dir)
+        config['selected_prompts'] = list(self.selected_prompts_box.get(0, tk.END))
+        config['token_budget'] = self.read_budget() if self.fit_budget_var.get() else None
+        config.update(self.budget_rules)
+        config['dedupe'] = self.dedupe_var.get()
+        config['minify'] = self.minify_var.get()
+        config['changed_only'] = self.changed_only_var.get()
         try:
             with open(self.context_file, 'w', encoding='utf-8') as f:
                 json.dump(config, f, indent=4)
@@ -820,18 +1446,16 @@ class FileSelectorGUI(tk.Tk):
             # 2) Expand one level so we can see root + immediate children
             self.expand_root_one_level()
 
-            # 3) Now set states from the config
-            for p in config.get('excluded_paths', []):
-                if p in self.exclusion_vars:
-                    self.exclusion_vars[p].set(True)
-
-            for d in config.get('selected_dirs', []):
-                if d in self.dir_vars:
-                    self.dir_vars[d].set(True)
-
-            for fpath in config.get('selected_files', []):
-                if fpath in self.file_vars:
-                    self.file_vars[fpath].set(True)
+            # 3) Now set rules from the config (applies to unloaded paths too)
+            self.selection.load_config(config)
+            self.refresh_forced(self.base_path)
+            self.token_totals.recompute(self.selection)
+            token_budget, self.budget_rules = rules_from_config(config)
+            self.budget_var.set(str(token_budget) if token_budget else "")
+            self.fit_budget_var.set(bool(token_budget))
+            self.dedupe_var.set(bool(config.get('dedupe', False)))
+            self.minify_var.set(bool(config.get('minify', False)))
+            self.changed_only_var.set(bool(config.get('changed_only', False)))
 
             # 4) Restore selected prompts
             for sp in config.get('selected_prompts', []):
@@ -842,9 +1466,8 @@ class FileSelectorGUI(tk.Tk):
                     if sp not in self.selected_prompts_box.get(0, tk.END):
                         self.selected_prompts_box.insert(tk.END, sp)
 
-            # 5) Refresh so appearance matches
-            for item_id in self.tree.get_children():
-                self.refresh_subtree(item_id)
+            # 5) Repaint so appearance matches
+            self.rows.mark_subtree("")
 
             # 6) Update token count
             self.update_token_count()
@@ -860,35 +1483,31 @@ class FileSelectorGUI(tk.Tk):
         selected_files = self.get_selected_files()
         
         try:
-            with open(output_file, 'w', encoding='utf-8') as outfile:
-                # Presaved prompts
-                if self.selected_prompts_box.size() > 0:
-                    for fname in self.selected_prompts_box.get(0, tk.END):
-                        prompt_data = self.prompts_data.get(fname)
-                        if prompt_data:
-                            outfile.write(f"```\n{prompt_data['content']}\n```\n\n")
-                
-                # Directory structure
-                outfile.write("Directory Structure:\n")
-                outfile.write(get_directory_tree(self.base_path, self.excluded_paths))
-                
-                # Selected files
-                if selected_files:
-                    outfile.write("\nImportant Code Files:\n\n")
-                    for fp in selected_files:
-                        relative_path = os.path.relpath(fp, self.base_path)
-                        outfile.write(f"File: {relative_path}\n```\n")
-                        try:
-                            with open(fp, 'r', encoding='utf-8', errors='ignore') as ff:
-                                outfile.write(ff.read())
-                            outfile.write("\n```\n\n")
-                        except Exception as e:
-                            outfile.write(f"Error reading file: {e}\n```\n\n")
-                else:
-                    outfile.write("\nNo code files selected for inclusion\n")
+            prompt_texts = [
+                self.prompts_data[fname]["content"]
+                for fname in self.selected_prompts_box.get(0, tk.END)
+                if fname in self.prompts_data
+            ]
+            truncate = self.budget_plan["truncate"] if self.budget_plan is not None else None
+            transformer = None
+            if self.dedupe_var.get() or self.minify_var.get():
+                transformer = OutputTransformer.open_for(
+                    self.base_path, self.dedupe_var.get(), self.minify_var.get(), self.tokenizer
+                )
+            cache = OutputCache.open_for(self.base_path)
+            try:
+                stats = write_output(
+                    output_file, self.base_path, prompt_texts, selected_files, self.excluded_paths, truncate,
+                    transformer, self.ignore, self.fs_index, cache, self.changed_only_var.get()
+                )
+            finally:
+                if transformer is not None:
+                    transformer.close()
+                if cache is not None:
+                    cache.close()
 
             self.save_configuration()
-            messagebox.showinfo("Success", f"Output generated at:\n{output_file}")
+            messagebox.showinfo("Success", f"Output generated at:\n{output_file}\n\n{format_write_stats(stats)}")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to generate output: {str(e)}")
         self.destroy()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Benchmark the scandir/trie directory-tree renderer against the original
+os.walk + string concatenation implementation.
+
+Builds a synthetic tree (500k empty files by default) in a temp directory,
+checks both renderers produce identical output, and reports best-of-3 wall
+time and peak Python memory (traced separately) for each.
+
+Usage:
+    python benchmarks/bench_directory_tree.py [--files 500000] [--keep DIR]
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from context_engine import EXCLUDE_DIRS, get_directory_tree, iter_directory_tree
+
+
+def legacy_get_directory_tree(base_path, excluded_paths):
+    """The pre-trie implementation, kept verbatim for comparison."""
+    tree_str = ""
+    excluded_paths = {os.path.normpath(p) for p in excluded_paths}
+
+    for root, dirs, files in os.walk(base_path, topdown=True):
+        dirs[:] = [
+            d for d in dirs
+            if d not in EXCLUDE_DIRS and os.path.normpath(os.path.join(root, d)) not in excluded_paths
+        ]
+        files = [
+            f for f in files
+            if os.path.normpath(os.path.join(root, f)) not in excluded_paths
+        ]
+
+        root_norm = os.path.normpath(root)
+        if root_norm in excluded_paths:
+            dirs[:] = []
+            continue
+
+        level = root.replace(base_path, '').count(os.sep)
+        indent = ' ' * (4 * level)
+        tree_str += f"{indent}{os.path.basename(root)}/\n"
+
+        subindent = ' ' * (4 * (level + 1))
+        for f in files:
+            tree_str += f"{subindent}{f}\n"
+    return tree_str
+
+
+def build_tree(base, n_files, files_per_dir=50, dirs_per_dir=10):
+    """Create n_files empty files spread over a balanced directory tree."""
+    made = 0
+    queue = [base]
+    while made < n_files:
+        parent = queue.pop(0)
+        for d in range(dirs_per_dir):
+            path = os.path.join(parent, f"dir_{d:02d}")
+            os.mkdir(path)
+            queue.append(path)
+            for f in range(min(files_per_dir, n_files - made)):
+                open(os.path.join(path, f"file_{f:03d}.py"), "w").close()
+                made += 1
+            if made >= n_files:
+                break
+    return base
+
+
+@contextmanager
+def bench_tree(keep, prefix, n_files, setup=None):
+    """
+    The directory a benchmark runs in: keep (created if missing, built if
+    empty, and left in place), or a temporary one removed afterwards.
+    setup(base) runs after build_tree on a freshly built tree.
+    """
+    base = keep or tempfile.mkdtemp(prefix=prefix)
+    try:
+        os.makedirs(base, exist_ok=True)
+        if not os.listdir(base):
+            start = time.perf_counter()
+            build_tree(base, n_files)
+            if setup is not None:
+                setup(base)
+            print(f"Built {n_files} files in {time.perf_counter() - start:.1f}s at {base}")
+        yield base
+    finally:
+        if not keep:
+            shutil.rmtree(base, ignore_errors=True)
+
+
+def measure(label, fn, repeat=3):
+    """Best-of-N wall time untraced, then one traced run for peak memory."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<28} {best:8.2f}s   peak {peak / 1e6:8.1f} MB")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=500000)
+    parser.add_argument("--keep", default=None, help="Build (or reuse) the tree in this directory")
+    args = parser.parse_args()
+
+    with bench_tree(args.keep, "tree_bench_", args.files) as base:
+        # A few exclusions so both implementations have to check them
+        excluded = [os.path.join(base, "dir_03"), os.path.join(base, "dir_01", "dir_05")]
+
+        legacy = measure("legacy os.walk + str +=", lambda: legacy_get_directory_tree(base, excluded))
+        fast = measure("scandir + trie (string)", lambda: get_directory_tree(base, excluded))
+        with open(os.devnull, "w") as sink:
+            measure("scandir + trie (streamed)", lambda: sink.writelines(iter_directory_tree(base, excluded)))
+
+        print("identical output:", legacy == fast)
+        return 0 if legacy == fast else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
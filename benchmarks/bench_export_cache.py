@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Check and time the incremental Supabase export against a local Postgres.
+
+Creates --tables scratch tables (bench_cache_N, --rows rows each) in the
+public schema, then exports them cold, again with nothing changed, and once
+more after updating a single table. Every cached export is compared with a
+full export without the cache. The scratch tables are dropped afterwards.
+
+Usage:
+    python benchmarks/bench_export_cache.py --dsn postgresql://postgres@localhost/postgres \
+        [--tables 20] [--rows 20000] [--concurrency 4]
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import supabase_export
+from export_cache import ExportCache
+
+# pg_stat counters reach other sessions with a delay (up to ~1s)
+STATS_SETTLE_SECONDS = 2.0
+
+
+def create_tables(conn, names, rows):
+    with conn.cursor() as cur:
+        for name in names:
+            cur.execute(f"DROP TABLE IF EXISTS {name}")
+            cur.execute(f"CREATE TABLE {name} (id serial PRIMARY KEY, body text, updated_at timestamptz DEFAULT now())")
+            cur.execute(f"INSERT INTO {name} (body) SELECT md5(g::text) FROM generate_series(1, %s) g", (rows,))
+    conn.commit()
+
+
+def drop_tables(conn, names):
+    conn.rollback()
+    with conn.cursor() as cur:
+        for name in names:
+            cur.execute(f"DROP TABLE IF EXISTS {name}")
+    conn.commit()
+
+
+def run_export(dsn, names, json_file, concurrency, cache):
+    from psycopg2.pool import ThreadedConnectionPool
+    pool = ThreadedConnectionPool(1, concurrency, dsn)
+    try:
+        start = time.perf_counter()
+        stats = supabase_export.export_tables_parallel(
+            pool, names, json_file, concurrency=concurrency, cache=cache
+        )
+        return time.perf_counter() - start, stats
+    finally:
+        pool.closeall()
+
+
+def read(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dsn", required=True)
+    parser.add_argument("--tables", type=int, default=20)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    import psycopg2
+    conn = psycopg2.connect(args.dsn)
+    names = [f"bench_cache_{i}" for i in range(args.tables)]
+    workdir = tempfile.mkdtemp(prefix="export_cache_bench_")
+    cache_file = os.path.join(workdir, "cached.json")
+    full_file = os.path.join(workdir, "full.json")
+    ok = True
+    try:
+        create_tables(conn, names, args.rows)
+        time.sleep(STATS_SETTLE_SECONDS)
+
+        def step(label, expect_queried):
+            nonlocal ok
+            cache = ExportCache(os.path.join(workdir, "cache"))
+            seconds, stats = run_export(args.dsn, names, cache_file, args.concurrency, cache)
+            run_export(args.dsn, names, full_file, args.concurrency, None)
+            queried = sorted(t for t, s in stats.items() if not s["cached"])
+            same = read(cache_file) == read(full_file)
+            print(f"{label:<28} {seconds:7.2f}s  read {len(queried):>3} tables  identical: {same}")
+            if not same or (expect_queried is not None and queried != sorted(expect_queried)):
+                print("  unexpected tables read:", queried)
+                ok = False
+
+        step("cold (empty cache)", names)
+        step("warm (nothing changed)", [])
+
+        with conn.cursor() as cur:
+            cur.execute(f"UPDATE {names[0]} SET body = 'changed' WHERE id = 1")
+        conn.commit()
+        time.sleep(STATS_SETTLE_SECONDS)
+        step(f"after updating {names[0]}", [names[0]])
+        return 0 if ok else 1
+    finally:
+        drop_tables(conn, names)
+        conn.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
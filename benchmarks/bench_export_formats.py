@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Compare the JSON export path with the COPY-based CSV/TSV/Markdown paths.
+
+Creates a scratch table (bench_formats, --rows rows of mixed column types)
+in the public schema of a local Postgres, exports it once per format and
+reports output bytes, tokens and best-of-3 wall time. Pass --table to use an
+existing table instead; --tokenizer points at a tiktoken-format file for
+real token counts (default: the chars/4 heuristic).
+
+Usage:
+    python benchmarks/bench_export_formats.py --dsn postgresql://postgres@localhost/postgres \
+        [--rows 100000] [--table NAME] [--tokenizer cl100k_base.tiktoken]
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import supabase_export
+from token_counter import load_tokenizer
+
+SCRATCH_TABLE = "bench_formats"
+
+
+def create_table(conn, rows):
+    with conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {SCRATCH_TABLE}")
+        cur.execute(
+            f"CREATE TABLE {SCRATCH_TABLE} ("
+            " id serial PRIMARY KEY, email text NOT NULL, score numeric(10, 2),"
+            " active boolean DEFAULT true, tags text[], profile jsonb,"
+            " created_at timestamptz DEFAULT now())"
+        )
+        cur.execute(
+            f"INSERT INTO {SCRATCH_TABLE} (email, score, active, tags, profile)"
+            " SELECT 'user' || g || '@example.com', g * 1.5, g % 3 <> 0,"
+            " ARRAY['a', 'b' || g % 7], jsonb_build_object('plan', 'pro', 'seats', g % 50)"
+            " FROM generate_series(1, %s) g",
+            (rows,),
+        )
+    conn.commit()
+
+
+def file_tokens(path, tokenizer):
+    total = 0
+    with open(path, "r", encoding="utf-8") as f:
+        for chunk in iter(lambda: f.read(1 << 20), ""):
+            total += tokenizer.count(chunk)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dsn", required=True)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--table", default=None, help="Existing table to export instead of a scratch one")
+    parser.add_argument("--tokenizer", default=None)
+    args = parser.parse_args()
+
+    import psycopg2
+    conn = psycopg2.connect(args.dsn)
+    tokenizer = load_tokenizer(path=args.tokenizer)
+    table = args.table or SCRATCH_TABLE
+    workdir = tempfile.mkdtemp(prefix="export_formats_bench_")
+    try:
+        if not args.table:
+            create_table(conn, args.rows)
+        catalog = supabase_export.fetch_catalog(conn, [table])
+        conn.rollback()
+
+        print(f"{'format':<10} {'bytes':>14} {'tokens':>12} {'seconds':>9}")
+        baseline = None
+        for fmt in supabase_export.EXPORT_FORMATS:
+            out = os.path.join(workdir, "export." + fmt)
+            best = None
+            for _ in range(3):
+                start = time.perf_counter()
+                supabase_export.export_tables_to_file(conn, [table], out, tokenizer=tokenizer, catalog=catalog, fmt=fmt)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            size = os.path.getsize(out)
+            tokens = file_tokens(out, tokenizer)
+            baseline = baseline or (size, tokens, best)
+            print(
+                f"{fmt:<10} {size:>14,} {tokens:>12,} {best:>9.2f}"
+                f"   ({size / baseline[0]:.0%} bytes, {tokens / baseline[1]:.0%} tokens,"
+                f" {best / baseline[2]:.0%} time of json)"
+            )
+        return 0
+    finally:
+        if not args.table:
+            conn.rollback()
+            with conn.cursor() as cur:
+                cur.execute(f"DROP TABLE IF EXISTS {SCRATCH_TABLE}")
+            conn.commit()
+        conn.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark the shared filesystem index against walking the disk per operation.
+
+Builds a synthetic tree (200k empty files by default) in a temp directory and
+runs one session's worth of tree work both ways: the scan walk (list + stat
+every file), rendering the directory tree, expanding a selection of the root,
+expanding every directory row and an is-dir check per row. The disk side
+does what each walker did before the index; the index side builds it once
+(that walk is its scan) and answers everything else from memory. Results
+are checked for equality, and best-of-3 times plus the index's traced
+memory are reported.
+
+Usage:
+    python benchmarks/bench_fs_index.py [--files 200000] [--keep DIR]
+"""
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from context_engine import _walk_files, get_directory_tree, load_ignore
+from fs_index import FILE, FsIndex, dir_lister
+from selection_model import INCLUDE, SelectionModel
+from bench_directory_tree import bench_tree
+
+
+def disk_session(base, ignore, selection):
+    files = {path: st.st_size for path, st, _ in _walk_files(base, (), ignore, None)}
+    tree = get_directory_tree(base, [], ignore)
+    selected = selection.selected_files(ignore)
+    list_dir = dir_lister(ignore)
+    rows = _expand_all(base, list_dir, os.path.isdir)
+    return files, tree, selected, rows
+
+
+def index_session(base, ignore, selection):
+    index = FsIndex.build(base, ignore)
+    files = {path: index.size[node] for path, node in index.iter_files()}
+    tree = get_directory_tree(base, [], ignore, index)
+    selected = selection.selected_files(ignore, index)
+    rows = _expand_all(base, dir_lister(ignore, index), index.is_dir)
+    return files, tree, selected, rows
+
+
+def _expand_all(base, list_dir, is_dir):
+    """What the tree view does when every row is expanded: list, then is-dir per row."""
+    rows = 0
+    stack = [base]
+    while stack:
+        path = stack.pop()
+        prefix = os.path.join(path, "")
+        for name, kind in list_dir(path):
+            child = prefix + name
+            rows += 1
+            if is_dir(child) and kind != FILE:
+                stack.append(child)
+    return rows
+
+
+def measure(label, fn, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{label:<28} {best:8.2f}s")
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=200000)
+    parser.add_argument("--keep", default=None, help="Build (or reuse) the tree in this directory")
+    args = parser.parse_args()
+
+    with bench_tree(args.keep, "index_bench_", args.files) as base:
+        ignore = load_ignore(base)
+        selection = SelectionModel()
+        selection.set_rule(base, INCLUDE)
+
+        disk, disk_time = measure("walk the disk per operation", lambda: disk_session(base, ignore, selection))
+        indexed, index_time = measure("one index, then queries", lambda: index_session(base, ignore, selection))
+
+        tracemalloc.start()
+        index = FsIndex.build(base, ignore)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"index: {len(index)} nodes, peak {peak / 1e6:.1f} MB traced; "
+              f"speedup {disk_time / index_time:.1f}x")
+
+        same = disk == indexed
+        print("identical results:", same)
+        return 0 if same else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
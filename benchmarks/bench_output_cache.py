@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark incremental output regeneration against rewriting output.txt.
+
+Builds a synthetic project (20k files of about 4 KB by default) in a temp
+directory, selects all of it, and times Generate Output: without the
+output cache, the first cached run (which also records the blocks), a
+rerun after editing one file, and a "changed since last generation" run.
+Cached and uncached outputs are checked to be byte-identical. Page cache
+is warm throughout, so the reused side only saves the reads and writes
+of small files; the gap grows on cold caches and with dedupe/minify.
+
+Usage:
+    python benchmarks/bench_output_cache.py [--files 20000] [--keep DIR]
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import filecmp
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from context_engine import OUTPUT_FILENAME, load_ignore, write_output
+from fs_index import FsIndex
+from output_cache import OutputCache
+from selection_model import INCLUDE, SelectionModel
+from bench_directory_tree import bench_tree
+
+LINE = "def handler(request):  # a line of plausible source code\n"
+
+
+def fill(base, size):
+    body = LINE * (size // len(LINE))
+    for root, _, files in os.walk(base):
+        for name in files:
+            with open(os.path.join(root, name), "w", encoding="utf-8") as f:
+                f.write(f"# {name}\n{body}")
+
+
+def generate(base, output_file, cache_enabled, changed_only=False):
+    start = time.perf_counter()
+    ignore = load_ignore(base)
+    index = FsIndex.build(base, ignore)
+    selection = SelectionModel()
+    selection.set_rule(base, INCLUDE)
+    # The same file list for output.txt and the reference copy outside the project
+    files = [path for path in selection.selected_files(ignore, index) if os.path.basename(path) != OUTPUT_FILENAME]
+    cache = OutputCache.open_for(base) if cache_enabled else None
+    try:
+        stats = write_output(output_file, base, [], files, [], ignore=ignore, index=index, cache=cache,
+                             changed_only=changed_only)
+    finally:
+        if cache is not None:
+            cache.close()
+    return time.perf_counter() - start, stats
+
+
+def report(label, result):
+    seconds, stats = result
+    extra = f", {stats['reused']} reused" if "reused" in stats else ""
+    print(f"{label:<32} {seconds:7.2f}s  {stats['files']:6d} files written{extra}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=20000)
+    parser.add_argument("--size", type=int, default=4096, help="Approximate bytes per file")
+    parser.add_argument("--keep", default=None, help="Build (or reuse) the project in this directory")
+    args = parser.parse_args()
+
+    ref_dir = tempfile.mkdtemp(prefix="output_bench_ref_")
+    try:
+        with bench_tree(args.keep, "output_bench_", args.files, lambda base: fill(base, args.size)) as base:
+            output_file = os.path.join(base, OUTPUT_FILENAME)
+            reference = os.path.join(ref_dir, OUTPUT_FILENAME)
+
+            # Warm up the page cache and make output.txt part of the tree for both sides
+            generate(base, output_file, False)
+            report("full rewrite, no cache", generate(base, reference, False))
+            report("first cached run (records)", generate(base, output_file, True))
+            report("rerun, nothing changed", generate(base, output_file, True))
+
+            edited = os.path.join(base, "dir_00", "file_000.py")
+            with open(edited, "a", encoding="utf-8") as f:
+                f.write("# edited\n")
+            report("rerun after one edit", generate(base, output_file, True))
+            generate(base, reference, False)
+            same = filecmp.cmp(output_file, reference, shallow=False)
+
+            with open(edited, "a", encoding="utf-8") as f:
+                f.write("# edited again\n")
+            report("changed since last generation", generate(base, output_file, True, changed_only=True))
+            print("identical output:", same)
+            return 0 if same else 1
+    finally:
+        shutil.rmtree(ref_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
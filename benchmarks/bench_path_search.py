@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Benchmark the path search index on a synthetic repository layout.
+
+Generates relative file paths (200k by default, plus their directories;
+nothing is written to disk),
+builds the search once, and reports the time to first results for typical
+queries: a file name, a path fragment, a single letter, two terms, a fuzzy
+subsequence and a miss. It also times collecting every match, which is
+what the bulk Add / Exclude buttons do. Results are checked against a
+plain linear scan.
+
+Usage:
+    python benchmarks/bench_path_search.py [--paths 200000]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from path_search import SEARCH_REVEAL_LIMIT, PathSearch
+
+WORDS = ["src", "lib", "components", "utils", "api", "models", "views", "tests", "config", "core",
+         "auth", "billing", "search", "admin", "hooks", "store", "server", "client", "shared", "legacy"]
+EXTENSIONS = [".py", ".ts", ".tsx", ".js", ".css", ".md", ".json", ".sql"]
+
+
+def make_paths(n, seed=1):
+    rng = random.Random(seed)
+    paths = set()
+    while len(paths) < n:
+        depth = rng.randint(1, 6)
+        dirs = [rng.choice(WORDS) + ("" if rng.random() < 0.7 else f"_{rng.randint(0, 99)}") for _ in range(depth)]
+        name = f"{rng.choice(WORDS)}_{rng.choice(WORDS)}{rng.randint(0, 999)}{rng.choice(EXTENSIONS)}"
+        paths.add("/".join(dirs + [name]))
+    dirs = {p.rsplit("/", i)[0] for p in paths for i in range(1, p.count("/") + 1)}
+    return [(p, False) for p in paths] + [(d, True) for d in dirs]
+
+
+def linear_search(entries, query):
+    terms = query.lower().split()
+    return {rel for rel, _ in entries if all(t in rel.lower() for t in terms)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--paths", type=int, default=200000)
+    args = parser.parse_args()
+
+    entries = make_paths(args.paths)
+    start = time.perf_counter()
+    search = PathSearch("/project", entries)
+    print(f"indexed {len(search)} paths in {time.perf_counter() - start:.2f}s")
+
+    ok = True
+    for query in ["billing_auth12", "core/api", "s", "hooks store", "cmpnntstls", "zzzz"]:
+        start = time.perf_counter()
+        first, complete = search.search(query, SEARCH_REVEAL_LIMIT)
+        first_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        every, _ = search.search(query)
+        all_ms = (time.perf_counter() - start) * 1000
+        shown = f"{len(first)}" if complete else f"{len(first)}+"
+        print(f"{query!r:<18} first {shown:>5} in {first_ms:6.1f} ms   all {len(every):6d} in {all_ms:6.1f} ms")
+        expected = linear_search(entries, query)
+        if expected:
+            found = {os.path.relpath(p, "/project").replace(os.sep, "/") for p in every}
+            ok &= found == expected
+    print("matches agree with a linear scan:", ok)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
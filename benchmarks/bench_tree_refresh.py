@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Benchmark dirty-tracked row refresh against the recursive refresh_subtree.
+
+Loads 50k rows (1000 expanded folders of 49 files by default) into a
+ttk.Treeview and times common repaints both ways: selecting the root (every
+row changes), clear all with nothing selected (no row changes), toggling one
+folder, and selecting the root with most folders collapsed. Tk calls are
+counted for each. Both sides end with identical rows, which is checked.
+
+Without a display (no $DISPLAY, e.g. on CI) a stand-in Treeview is used:
+the call counts are the same, but the times then only measure the Python
+side. Run under xvfb-run to time real Tk calls.
+
+Usage:
+    python benchmarks/bench_tree_refresh.py [--dirs 1000] [--files 49]
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from row_refresh import RowRefresher
+from selection_model import EXCLUDE, INCLUDE, NEUTRAL, SelectionModel
+
+
+class StandInTree:
+    """The few Treeview methods the refresh code uses, backed by dicts."""
+
+    def __init__(self):
+        self.rows = {"": {"children": [], "open": True}}
+        self.next_id = 0
+
+    def insert(self, parent, index, text="", values=(), tags=(), open=False):
+        self.next_id += 1
+        iid = f"I{self.next_id:06d}"
+        self.rows[iid] = {"children": [], "open": open, "values": list(values), "tags": tags}
+        self.rows[parent]["children"].append(iid)
+        return iid
+
+    def get_children(self, item=""):
+        return tuple(self.rows[item]["children"])
+
+    def item(self, iid, option=None, **kw):
+        row = self.rows[iid]
+        if option is not None:
+            return row[option]
+        if "values" in kw:
+            row["values"] = list(kw.pop("values"))
+        row.update(kw)
+
+    def set(self, iid, column, value):
+        row = self.rows[iid]
+        row["values"][("add_code", "exclude", "tokens").index(column)] = value
+
+
+class CountingTree:
+    """Counts calls made to the wrapped tree (each one is a Tk round trip)."""
+
+    def __init__(self, tree):
+        self._tree = tree
+        self.calls = 0
+
+    def __getattr__(self, name):
+        method = getattr(self._tree, name)
+
+        def counted(*args, **kw):
+            self.calls += 1
+            return method(*args, **kw)
+        return counted
+
+
+def make_tree():
+    try:
+        import tkinter as tk
+        from tkinter import ttk
+        root = tk.Tk()
+        root.withdraw()
+        return ttk.Treeview(root, columns=("add_code", "exclude", "tokens")), "ttk.Treeview"
+    except Exception:
+        return StandInTree(), "stand-in Treeview (no display)"
+
+
+class Bench:
+    def __init__(self, n_dirs, n_files):
+        self.tree, self.kind = make_tree()
+        self.selection = SelectionModel()
+        self.paths = {}
+        self.tokens = {}
+        self.root = self.tree.insert("", "end", text="project", values=("Add", "Exclude", ""), open=True)
+        self.paths[self.root] = "/project"
+        self.dirs = []
+        for d in range(n_dirs):
+            dir_path = f"/project/dir_{d:04d}"
+            dir_id = self.tree.insert(self.root, "end", text=dir_path, values=("Add", "Exclude", ""), open=True)
+            self.paths[dir_id] = dir_path
+            self.dirs.append(dir_id)
+            for f in range(n_files):
+                path = f"{dir_path}/file_{f:03d}.py"
+                iid = self.tree.insert(dir_id, "end", text=path, values=("Add", "Exclude", 100), tags=("normal",))
+                self.paths[iid] = path
+                self.tokens[path] = 100
+        self.rows = len(self.paths)
+
+    # What update_item_appearance / row_state compute for a row
+    def state(self, item_id):
+        path = self.paths.get(item_id)
+        if path is None:
+            return None
+        rule = self.selection.effective_rule(path)
+        if rule == EXCLUDE:
+            tag, add, exclude = "excluded", "Add", "X"
+        elif rule == INCLUDE:
+            tag, add, exclude = "selected", "Yes", "Exclude"
+        else:
+            tag, add, exclude = "normal", "Add", "Exclude"
+        return (tag,), (add, exclude, self.tokens.get(path, ""))
+
+    # The recursive repaint being replaced, verbatim apart from the tree wrapper
+    def legacy_refresh_subtree(self, tree, item_id):
+        path = self.paths.get(item_id)
+        if path:
+            (tag,), (add, exclude, _) = self.state(item_id)
+            tree.item(item_id, tags=(tag,))
+            tree.set(item_id, "add_code", add)
+            tree.set(item_id, "exclude", exclude)
+        for child_id in tree.get_children(item_id):
+            self.legacy_refresh_subtree(tree, child_id)
+
+    def snapshot(self):
+        return {iid: (tuple(self.tree.item(iid, "tags")), tuple(map(str, self.tree.item(iid, "values"))))
+                for iid in self.paths}
+
+    def set_open(self, open_dirs, refresher=None):
+        for i, dir_id in enumerate(self.dirs):
+            self.tree.item(dir_id, open=i < open_dirs)
+            if refresher is not None:
+                (refresher.opened if i < open_dirs else refresher.closed)(dir_id)
+
+    def run(self, label, change, item_id, open_dirs=None):
+        """Apply change, then repaint from item_id both ways."""
+        self.set_open(len(self.dirs) if open_dirs is None else open_dirs)
+        results = []
+        for mode in ("legacy", "dirty"):
+            # Same starting point for both: every row painted for the baseline selection
+            self.selection.clear()
+            self.set_open(len(self.dirs))
+            refresher = RowRefresher(self.tree, self.state, lambda callback: None)
+            refresher.opened(self.root)
+            self.set_open(len(self.dirs), refresher)
+            refresher.mark_subtree("")
+            refresher.flush()
+            self.legacy_refresh_subtree(self.tree, "")
+            self.set_open(len(self.dirs) if open_dirs is None else open_dirs, refresher)
+            change()
+
+            counting = CountingTree(self.tree)
+            start = time.perf_counter()
+            if mode == "legacy":
+                self.legacy_refresh_subtree(counting, item_id)
+            else:
+                refresher.tree = counting
+                refresher.mark_subtree(item_id)
+                refresher.flush()
+            elapsed = time.perf_counter() - start
+            results.append((elapsed, counting.calls))
+            if open_dirs is None:
+                results[-1] += (self.snapshot(),)
+        (legacy_t, legacy_calls, *legacy_rows), (dirty_t, dirty_calls, *dirty_rows) = results
+        print(f"{label:<34} legacy {legacy_t * 1000:8.1f} ms {legacy_calls:7d} calls   "
+              f"dirty {dirty_t * 1000:8.1f} ms {dirty_calls:7d} calls")
+        return legacy_rows == dirty_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dirs", type=int, default=1000)
+    parser.add_argument("--files", type=int, default=49)
+    args = parser.parse_args()
+
+    bench = Bench(args.dirs, args.files)
+    print(f"{bench.rows} loaded rows in a {bench.kind}")
+    same = True
+    same &= bench.run("select the root (all rows change)",
+                      lambda: bench.selection.set_rule("/project", INCLUDE), bench.root)
+    same &= bench.run("clear all (nothing changes)", bench.selection.clear, "")
+    same &= bench.run("toggle one folder",
+                      lambda: bench.selection.set_rule("/project/dir_0007", EXCLUDE), bench.dirs[7])
+    bench.run("select the root, 10 folders open",
+              lambda: bench.selection.set_rule("/project", INCLUDE), bench.root, open_dirs=10)
+    bench.selection.set_rule("/project", NEUTRAL)
+    print("identical rows:", same)
+    return 0 if same else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,276 @@
+"""
+Token-budget optimizer: picks which files (and how much of them) fit a budget.
+
+Every counted file gets a value from the priority rules: path globs, recency
+and proximity to the files already chosen in the tree. Files are then taken
+in order of value per token until the budget is spent, and the first file that
+doesn't fit is cut at the remaining budget. Because a file may be cut, this
+greedy order is optimal for the knapsack (its fractional relaxation). Pinned
+files always go in whole. Per-file features are cached, and the cache is only
+dropped for paths that change, so a re-plan after a click only sorts scores.
+"""
+import os
+import re
+import time
+import fnmatch
+
+from selection_model import INCLUDE, NEUTRAL
+
+# A file is only cut if at least this many of its tokens fit
+MIN_TRUNCATE_TOKENS = 200
+# Value multiplier for files the user already selected in the tree
+SELECTED_WEIGHT = 4.0
+# Recency bonus halves every RECENCY_HALF_LIFE_DAYS since the last edit
+RECENCY_HALF_LIFE_DAYS = 14.0
+
+DEFAULT_RULES = {
+    "pinned_paths": [],
+    "priority_globs": {},
+    "recency_weight": 1.0,
+    "proximity_weight": 1.0,
+    "expand": True,
+}
+
+
+def rules_from_config(config):
+    """Budget and rules stored in ai_context.config (missing keys use defaults)."""
+    rules = dict(DEFAULT_RULES)
+    for key in DEFAULT_RULES:
+        if key in config:
+            rules[key] = config[key]
+    return config.get("token_budget"), rules
+
+
+def _compile_globs(priority_globs):
+    """[(regex, weight)] for {glob: weight}; globs match the posix relative path."""
+    return [
+        (re.compile(fnmatch.translate(pattern)), float(weight))
+        for pattern, weight in priority_globs.items()
+    ]
+
+
+class BudgetOptimizer:
+    def __init__(self, base_path, skip_names=()):
+        self.base_path = os.path.normpath(base_path)
+        # Counted files that are never worth picking (the config, output.txt)
+        self.skip_names = set(skip_names)
+        self._features_key = None
+        self._base_values = {}  # path -> glob weight x recency bonus
+        self._by_dir = {}       # dir -> [(path, name)] for counted files
+        self._indexed = None    # counts version (or len(file_tokens)) _by_dir was built from
+        self._min_tokens = 0    # smallest indexed file, to stop the fill early
+
+    def invalidate(self, paths=None):
+        """Forget cached features for paths (or everything)."""
+        if paths is None:
+            self._base_values.clear()
+        else:
+            for p in paths:
+                self._base_values.pop(p, None)
+        self._indexed = None
+
+    # ------------------------------------------------------------------
+    # Features
+    # ------------------------------------------------------------------
+    def _base_value(self, path, globs, recency_weight, now, index=None):
+        rel = os.path.relpath(path, self.base_path).replace(os.sep, "/")
+        value = 1.0
+        for regex, weight in globs:
+            if regex.match(rel):
+                value *= weight
+        if recency_weight and value > 0:
+            node = index.find(path) if index is not None else None
+            try:
+                mtime = index.mtime_ns[node] / 1e9 if node is not None else os.stat(path).st_mtime
+                age = max(0.0, now - mtime)
+            except OSError:
+                age = float("inf")
+            value *= 1 + recency_weight * 0.5 ** (age / (RECENCY_HALF_LIFE_DAYS * 86400.0))
+        return value
+
+    def _refresh(self, file_tokens, rules, index=None, version=None):
+        """
+        Bring cached per-file values and the per-directory index up to date.
+        The index holds parallel (paths, names, value per token, tokens) lists
+        for the files worth picking (counted tokens and a positive value).
+        version changes whenever a count does (TokenTotals.version); without
+        it the index is only rebuilt when the number of files changes.
+        """
+        fresh_key = len(file_tokens) if version is None else ("v", version)
+        key = (tuple(sorted(rules["priority_globs"].items())), float(rules["recency_weight"]))
+        if key != self._features_key:
+            self._base_values.clear()
+            self._features_key = key
+            self._indexed = None
+        if self._indexed == fresh_key:
+            return
+        globs = _compile_globs(rules["priority_globs"])
+        recency_weight = float(rules["recency_weight"])
+        now = time.time()
+        base_values = self._base_values
+        by_dir = {}
+        min_tokens = None
+        for path, tokens in file_tokens.items():
+            value = base_values.get(path)
+            if value is None:
+                value = base_values[path] = self._base_value(path, globs, recency_weight, now, index)
+            if tokens <= 0 or value <= 0:
+                continue
+            dir_path, name = os.path.split(path)
+            if name in self.skip_names:
+                continue
+            entry = by_dir.get(dir_path)
+            if entry is None:
+                entry = by_dir[dir_path] = ([], [], [], [])
+            entry[0].append(path)
+            entry[1].append(name)
+            entry[2].append(value / tokens)
+            entry[3].append(tokens)
+            if min_tokens is None or tokens < min_tokens:
+                min_tokens = tokens
+        self._by_dir = by_dir
+        self._min_tokens = min_tokens or 0
+        self._indexed = fresh_key
+
+    def _classify(self, selection):
+        """
+        Yield (dir, rule, paths, densities, tokens) runs of files sharing a rule.
+        Rules are resolved once per directory, then per file only where a file
+        in it carries its own rule.
+        """
+        for dir_path, (paths, names, densities, tokens) in self._by_dir.items():
+            dir_rule = selection.effective_rule(dir_path)
+            node = selection.node_for(dir_path)
+            children = node.children if node is not None else None
+            if not children:
+                yield dir_path, dir_rule, paths, densities, tokens
+                continue
+            by_rule = {}
+            for path, name, density, n in zip(paths, names, densities, tokens):
+                child = children.get(name)
+                rule = child.rule if child is not None and child.rule is not None else dir_rule
+                run = by_rule.setdefault(rule, ([], [], []))
+                run[0].append(path)
+                run[1].append(density)
+                run[2].append(n)
+            for rule, run in by_rule.items():
+                yield (dir_path, rule) + run
+
+    @staticmethod
+    def _proximity(selected_dirs):
+        """
+        proximity(dir): 1 / (1 + steps up to the nearest directory that holds
+        a selected file somewhere below it).
+        """
+        anchors = set()
+        for d in selected_dirs:
+            while d not in anchors:
+                anchors.add(d)
+                parent = os.path.dirname(d)
+                if parent == d:
+                    break
+                d = parent
+
+        def proximity(dir_path):
+            steps = 0
+            d = dir_path
+            while d not in anchors:
+                parent = os.path.dirname(d)
+                if parent == d:
+                    return 0.0
+                d = parent
+                steps += 1
+            return 1.0 / (1 + steps)
+        return proximity
+
+    # ------------------------------------------------------------------
+    # Planning
+    # ------------------------------------------------------------------
+    def plan(self, file_tokens, selection, budget, rules=None, index=None, version=None):
+        """
+        Choose files for a token budget. Returns a dict with "files" (sorted),
+        "truncate" ({path: (kept_tokens, tokens)} for the cut file), "tokens"
+        (planned total), "budget", "over_budget" (pinned files alone exceed
+        the budget) and "seconds". Modification times are read from index
+        (an fs_index.FsIndex) when given. Pass version (TokenTotals.version)
+        when file_tokens is updated in place between calls.
+        """
+        start = time.perf_counter()
+        rules = dict(DEFAULT_RULES, **(rules or {}))
+        self._refresh(file_tokens, rules, index, version)
+        proximity_weight = float(rules["proximity_weight"])
+        expand = rules["expand"]
+
+        remaining = budget
+        chosen = []
+        pinned = set()
+        for p in rules["pinned_paths"]:
+            p = os.path.normpath(p)
+            # Same filter as the candidates: uncounted (skipped) files and skip_names never go in
+            if file_tokens.get(p, 0) <= 0 or os.path.basename(p) in self.skip_names:
+                continue
+            if not selection.is_excluded(p):
+                pinned.add(p)
+                chosen.append(p)
+                remaining -= file_tokens[p]
+
+        # Candidates come in per-directory runs: the selection and proximity
+        # factors are shared by every file in a run
+        runs = []
+        selected_dirs = set()
+        for dir_path, rule, run_paths, run_densities, run_tokens in self._classify(selection):
+            if rule == INCLUDE:
+                selected_dirs.add(dir_path)
+                runs.append((dir_path, SELECTED_WEIGHT, run_paths, run_densities, run_tokens))
+            elif rule == NEUTRAL and expand:
+                runs.append((dir_path, 1.0, run_paths, run_densities, run_tokens))
+        proximity = self._proximity(selected_dirs) if proximity_weight and selected_dirs else None
+
+        paths = []
+        densities = []
+        sizes = []
+        for dir_path, factor, run_paths, run_densities, run_tokens in runs:
+            if proximity is not None:
+                factor *= 1 + proximity_weight * proximity(dir_path)
+            paths.extend(run_paths)
+            densities.extend([d * factor for d in run_densities])
+            sizes.extend(run_tokens)
+        order = sorted(range(len(paths)), key=densities.__getitem__, reverse=True)
+
+        truncate = {}
+        smallest = self._min_tokens
+        for i in order:
+            if remaining < smallest or remaining <= 0:
+                break
+            tokens = sizes[i]
+            if tokens > remaining and remaining < MIN_TRUNCATE_TOKENS:
+                continue
+            path = paths[i]
+            if path in pinned:
+                continue
+            if tokens <= remaining:
+                chosen.append(path)
+                remaining -= tokens
+            elif remaining >= MIN_TRUNCATE_TOKENS:
+                # The fractional knapsack optimum cuts the first misfit
+                chosen.append(path)
+                truncate[path] = (remaining, tokens)
+                remaining = 0
+
+        return {
+            "files": sorted(chosen),
+            "truncate": truncate,
+            "tokens": budget - remaining,
+            "budget": budget,
+            "over_budget": remaining < 0,
+            "seconds": time.perf_counter() - start,
+        }
+
+
+def format_plan_stats(plan):
+    text = f"{len(plan['files'])} files, {plan['tokens']} / {plan['budget']} tokens"
+    if plan["truncate"]:
+        text += f", {len(plan['truncate'])} truncated"
+    if plan["over_budget"]:
+        text += " (pinned files exceed the budget)"
+    return text
@@ -0,0 +1,773 @@
+#!/usr/bin/env python3
+"""
+Headless engine for AI Context Builder Pro.
+
+Everything needed to build output.txt without a GUI lives here: scanning the
+project, resolving a saved selection, rendering the directory tree, loading
+prompts and writing the final output. tkinter is never imported here, and
+psycopg2 is only loaded when a Supabase export is requested.
+
+Usage:
+    python context_engine.py --config ai_context.config --out output.txt
+"""
+import io
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import supabase_export
+from supabase_export import SUPABASE_JSON_FILENAME, load_supabase_prompt
+from export_cache import EXPORT_CACHE_DIRNAME, cache_key
+from selection_model import SelectionModel, split_path
+from ignore_rules import IgnoreMatcher
+from fs_index import DIR, FILE, FsIndex, dir_lister
+from token_cache import BINARY_TOKENS, TOKEN_CACHE_FILENAME, TokenCache
+from output_cache import OUTPUT_CACHE_DIRNAME, OutputCache
+from token_counter import HEURISTIC, TOKENIZER_FILENAME, load_tokenizer
+from budget_optimizer import BudgetOptimizer, format_plan_stats, rules_from_config
+from output_transform import MINIFY_VERSION, TRANSFORM_CACHE_FILENAME, OutputTransformer
+
+EXCLUDE_DIRS = {'node_modules', '.next', 'prompts', EXPORT_CACHE_DIRNAME, OUTPUT_CACHE_DIRNAME}
+# The tool's own sqlite caches, with the side files sqlite keeps next to them
+EXCLUDE_FILES = {
+    name + suffix
+    for name in (TOKEN_CACHE_FILENAME, TRANSFORM_CACHE_FILENAME)
+    for suffix in ("", "-journal", "-wal", "-shm")
+}
+CONTEXT_CONFIG_FILENAME = "ai_context.config"
+OUTPUT_FILENAME = "output.txt"
+PROMPTS_DIRNAME = "prompts"
+
+# Cache misses are tokenized in batches of at most this many files / chars
+TOKEN_BATCH_FILES = 64
+TOKEN_BATCH_CHARS = 8 * 1024 * 1024
+
+# Scan guard: files over LARGE_FILE_BYTES are skipped on stat alone, and
+# files whose first SNIFF_BYTES look binary are skipped after one small read
+LARGE_FILE_BYTES = 2 * 1024 * 1024
+SNIFF_BYTES = 8192
+BINARY = "binary"
+LARGE = "large"
+
+# Output streaming: chunk size, how many files are prefetched ahead, pool size
+OUTPUT_CHUNK_CHARS = 256 * 1024
+OUTPUT_PREFETCH_FILES = 8
+OUTPUT_PREFETCH_WORKERS = 4
+
+# --------------------------------------------------------------------------
+# Token estimation
+# --------------------------------------------------------------------------
+def estimate_tokens(text, tokenizer=None):
+    return (tokenizer or HEURISTIC).count(text)
+
+def estimate_prompt_tokens(prompt, tokenizer=None):
+    """Tokens for a prompt string, or a file-backed prompt counted chunk by chunk."""
+    if isinstance(prompt, str):
+        return estimate_tokens(prompt, tokenizer)
+    tokenizer = tokenizer or HEURISTIC
+    return sum(tokenizer.count(chunk) for chunk in prompt.iter_chunks())
+
+def read_text_file(full_path):
+    with open(full_path, 'r', encoding='utf-8', errors='ignore') as ff:
+        return ff.read()
+
+# Bytes that occur in text files (control characters other than these don't)
+_TEXT_BYTES = bytes({7, 8, 9, 10, 12, 13, 27} | set(range(0x20, 0x100)) - {0x7f})
+
+def looks_binary(head):
+    """NUL bytes or more than 30% control characters in the first bytes."""
+    if not head:
+        return False
+    if b"\0" in head:
+        return True
+    return len(head.translate(None, _TEXT_BYTES)) / len(head) > 0.3
+
+def read_for_count(full_path, st):
+    """(text, None) for a text file, or (None, BINARY / LARGE) for one to skip."""
+    if st.st_size > LARGE_FILE_BYTES:
+        return None, LARGE
+    with open(full_path, 'rb') as ff:
+        data = ff.read()
+    if looks_binary(data[:SNIFF_BYTES]):
+        return None, BINARY
+    text = data.decode('utf-8', errors='ignore')
+    if '\r' in text:
+        # Same newlines as a text-mode read
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text, None
+
+def classify_file(full_path):
+    """BINARY, LARGE or None (text), from a stat and at most SNIFF_BYTES read."""
+    try:
+        st = os.stat(full_path)
+        if st.st_size > LARGE_FILE_BYTES:
+            return LARGE
+        with open(full_path, 'rb') as ff:
+            return BINARY if looks_binary(ff.read(SNIFF_BYTES)) else None
+    except OSError:
+        return None
+
+def forced_file_tokens(size):
+    """Estimate for a forced binary or large file, from its size alone (it is never read to count)."""
+    return size // 4
+
+def count_file_tokens(full_path, tokenizer=None, skipped=None):
+    """Token count of a text file; binary and large files count 0 (and are put in skipped)."""
+    try:
+        text, kind = read_for_count(full_path, os.stat(full_path))
+    except Exception:
+        return 0
+    if kind is not None:
+        if skipped is not None:
+            skipped[full_path] = kind
+        return 0
+    return estimate_tokens(text, tokenizer)
+
+def _count_batch(batch, tokenizer, cache, index=None):
+    """Count a batch of (full_path, st, text, node) in one tokenizer call."""
+    counts = tokenizer.count_batch([text for _, _, text, _ in batch])
+    for (full_path, st, _, node), tokens in zip(batch, counts):
+        if cache is not None:
+            cache.store(full_path, st, tokens)
+        if node is not None:
+            index.set_tokens(node, tokens)
+        yield full_path, tokens
+
+def load_ignore(base_path):
+    """The project's compiled exclusions: EXCLUDE_DIRS, EXCLUDE_FILES and its ignore files."""
+    return IgnoreMatcher(base_path, EXCLUDE_DIRS, EXCLUDE_FILES)
+
+def _walk_files(base_path, skip_names, ignore, cancel_event):
+    """(full_path, st or None, None) for each file, walking the disk."""
+    for root, dirs, files in os.walk(base_path, topdown=True):
+        if cancel_event is not None and cancel_event.is_set():
+            return
+        dirs[:] = [d for d in dirs if not ignore.ignored(root, d, True)]
+        for f in files:
+            if f in skip_names or ignore.ignored(root, f, False):
+                continue
+            full_path = os.path.join(root, f)
+            try:
+                st = os.stat(full_path)
+            except OSError:
+                st = None
+            yield full_path, st, None
+
+def _index_files(index, base_path, skip_names, cancel_event):
+    """(full_path, st, node) for each file, from the index (no stat calls)."""
+    for full_path, node in index.iter_files(base_path, cancel_event):
+        if index.names[node] not in skip_names:
+            yield full_path, index.stat(node), node
+
+def iter_file_tokens(base_path, skip_names=(), cache=None, cancel_event=None, tokenizer=None, skipped=None,
+                     ignore=None, index=None):
+    """
+    Walk base_path and yield (full_path, estimated_tokens) as files are counted.
+    With a TokenCache, files whose stat matches the cached entry are not
+    reopened, and entries for files that disappeared are pruned once the walk
+    completes. Cache misses are read and counted in batches. Setting
+    cancel_event stops the walk early (nothing is pruned).
+    Binary and large files are yielded with 0 tokens and recorded in the
+    skipped dict ({full_path: BINARY or LARGE}) before they are yielded.
+    Ignored directories are pruned before the walk descends into them; pass
+    the project's matcher when base_path is a subdirectory. With an FsIndex
+    the files and their stat come from the index instead of the disk, and
+    the counts are written back to it.
+    """
+    tokenizer = tokenizer or HEURISTIC
+    if index is not None:
+        files = _index_files(index, base_path, skip_names, cancel_event)
+    else:
+        files = _walk_files(base_path, skip_names, ignore or load_ignore(base_path), cancel_event)
+    seen = set()
+    batch = []
+    batch_bytes = 0
+    try:
+        for full_path, st, node in files:
+            if st is None:
+                yield full_path, 0
+                continue
+            if st.st_size > LARGE_FILE_BYTES:
+                if skipped is not None:
+                    skipped[full_path] = LARGE
+                yield full_path, 0
+                continue
+            if cache is not None:
+                seen.add(full_path)
+                tokens = cache.lookup(full_path, st)
+                if tokens == BINARY_TOKENS:
+                    if skipped is not None:
+                        skipped[full_path] = BINARY
+                    yield full_path, 0
+                    continue
+                if tokens is not None:
+                    if node is not None:
+                        index.set_tokens(node, tokens)
+                    yield full_path, tokens
+                    continue
+            try:
+                text, kind = read_for_count(full_path, st)
+            except Exception:
+                yield full_path, 0
+                continue
+            if kind is not None:
+                if cache is not None:
+                    cache.store(full_path, st, BINARY_TOKENS)
+                if skipped is not None:
+                    skipped[full_path] = kind
+                yield full_path, 0
+                continue
+            batch.append((full_path, st, text, node))
+            batch_bytes += len(text)
+            if len(batch) >= TOKEN_BATCH_FILES or batch_bytes >= TOKEN_BATCH_CHARS:
+                yield from _count_batch(batch, tokenizer, cache, index)
+                batch = []
+                batch_bytes = 0
+        if cancel_event is not None and cancel_event.is_set():
+            return
+        yield from _count_batch(batch, tokenizer, cache, index)
+        if cache is not None:
+            cache.prune(base_path, seen)
+    finally:
+        if cache is not None:
+            cache.flush()
+
+def scan_file_tokens(base_path, skip_names=(), cache=None, tokenizer=None, skipped=None, ignore=None, index=None):
+    """Walk base_path and return {full_path: estimated_tokens}."""
+    return dict(iter_file_tokens(
+        base_path, skip_names, cache, tokenizer=tokenizer, skipped=skipped, ignore=ignore, index=index
+    ))
+
+# --------------------------------------------------------------------------
+# Prompts
+# --------------------------------------------------------------------------
+def load_prompts(base_path, tokenizer=None):
+    """Return {fname: {"path", "content", "tokens"}} for prompts/*.txt."""
+    prompts_data = {}
+    prompts_dir = os.path.join(base_path, PROMPTS_DIRNAME)
+    if not os.path.exists(prompts_dir):
+        return prompts_data
+    for fname in sorted(os.listdir(prompts_dir)):
+        if fname.endswith(".txt"):
+            full_path = os.path.join(prompts_dir, fname)
+            try:
+                with open(full_path, 'r', encoding="utf-8") as f:
+                    content = f.read()
+                prompts_data[fname] = {"path": full_path, "content": content, "tokens": estimate_tokens(content, tokenizer)}
+            except Exception:
+                continue
+    return prompts_data
+
+# --------------------------------------------------------------------------
+# Configuration (ai_context.config)
+# --------------------------------------------------------------------------
+def load_context_config(config_file):
+    with open(config_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_context_config(config_file, config):
+    with open(config_file, 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=4)
+
+def resolve_selected_files(config, ignore, index=None):
+    """
+    Expand a saved configuration into the sorted list of files to include,
+    using the same inherited include/exclude rules as the GUI. Binary and
+    large files are left out unless forced.
+    """
+    selection = SelectionModel.from_config(config)
+    return guard_selected_files(selection.selected_files(ignore, index), selection)[0]
+
+def guard_selected_files(selected_files, selection, kinds=None, known=None):
+    """
+    Split selected files into (kept, skipped). A file is skipped when it is
+    binary or large (per kinds, else classified from disk) and not forced.
+    With known (the paths kinds already covers, e.g. while a scan is still
+    running), other paths are classified from disk.
+    """
+    kept = []
+    skipped = []
+    for path in selected_files:
+        if kinds is None or (known is not None and path not in known):
+            kind = classify_file(path)
+        else:
+            kind = kinds.get(path)
+        if kind is not None and not selection.is_forced(path):
+            skipped.append(path)
+        else:
+            kept.append(path)
+    return kept, skipped
+
+# --------------------------------------------------------------------------
+# Generate a directory tree string with exclusions
+# --------------------------------------------------------------------------
+# Marks a trie node whose path is itself excluded (path parts are never None)
+_EXCLUDED = None
+
+def build_exclusion_trie(excluded_paths):
+    """Nested dicts keyed by path component; excluded nodes carry _EXCLUDED."""
+    trie = {}
+    for p in excluded_paths:
+        node = trie
+        for part in split_path(p):
+            node = node.setdefault(part, {})
+        node[_EXCLUDED] = True
+    return trie
+
+def iter_directory_tree(base_path, excluded_paths, ignore=None, index=None):
+    """
+    Yield the directory tree line by line (same layout as os.walk order).
+    Exclusions are checked by walking a prefix trie alongside the listing, so
+    no path is normalized per entry; ignored entries are left out. Listings
+    come from the FsIndex when one is given, else from scandir.
+    """
+    list_dir = dir_lister(ignore or load_ignore(base_path), index)
+    node = build_exclusion_trie(excluded_paths)
+    for part in split_path(base_path):
+        node = node.get(part) if node else None
+    if node and _EXCLUDED in node:
+        return
+
+    indents = [""]
+    stack = [(base_path, os.path.basename(base_path), 0, node)]
+    while stack:
+        path, name, level, node = stack.pop()
+        entries = list_dir(path)
+        if entries is None:
+            # os.walk silently skips directories it cannot list
+            continue
+
+        while len(indents) <= level + 1:
+            indents.append(" " * (4 * len(indents)))
+        yield f"{indents[level]}{name}/\n"
+
+        subindent = indents[level + 1]
+        prefix = os.path.join(path, "")
+        subdirs = []
+        for entry_name, kind in entries:
+            child = node.get(entry_name) if node else None
+            if child and _EXCLUDED in child:
+                continue
+            # Like os.walk(followlinks=False): symlinked dirs are not listed
+            if kind == DIR:
+                subdirs.append((prefix + entry_name, entry_name, level + 1, child))
+            elif kind == FILE:
+                yield f"{subindent}{entry_name}\n"
+        stack.extend(reversed(subdirs))
+
+def get_directory_tree(base_path, excluded_paths, ignore=None, index=None):
+    buf = io.StringIO()
+    buf.writelines(iter_directory_tree(base_path, excluded_paths, ignore, index))
+    return buf.getvalue()
+
+# --------------------------------------------------------------------------
+# Output
+# --------------------------------------------------------------------------
+def _prefetch_file(fp, transformer=None):
+    """
+    Open fp and read its first chunk; returns (handle, head, error). With a
+    transformer the whole file is read and transformed instead, and head is
+    the prepared dict (handle None); files it declines are opened as usual.
+    """
+    if transformer is not None:
+        try:
+            prepared = transformer.prepare(fp)
+        except Exception as e:
+            return None, "", e
+        if prepared is not None:
+            return None, prepared, None
+    try:
+        ff = open(fp, 'r', encoding='utf-8', errors='ignore')
+    except Exception as e:
+        return None, "", e
+    try:
+        return ff, ff.read(OUTPUT_CHUNK_CHARS), None
+    except Exception as e:
+        ff.close()
+        return None, "", e
+
+def _copy_truncated(outfile, ff, chunk, kept_tokens, tokens):
+    """Copy the first kept_tokens/tokens share of a file, cut at a line end."""
+    limit = int(os.fstat(ff.fileno()).st_size * kept_tokens / tokens)
+    text = chunk
+    while len(text) < limit:
+        more = ff.read(OUTPUT_CHUNK_CHARS)
+        if not more:
+            break
+        text += more
+    text = text[:limit]
+    cut = text.rfind("\n")
+    if cut > 0:
+        text = text[:cut]
+    outfile.write(text)
+    outfile.write(f"\n... [truncated: ~{kept_tokens} of {tokens} tokens]")
+
+def _block_mode(fp, truncate, transformer):
+    """How a file's block is rendered: a cached block is only reused in the same mode."""
+    if fp in truncate:
+        return "truncate:%d:%d" % truncate[fp]
+    if transformer is not None:
+        return f"transform:{MINIFY_VERSION}:{int(transformer.minify)}:{transformer.tokenizer.name}"
+    return "plain"
+
+def stream_files(outfile, base_path, selected_files, truncate=None, transformer=None, cache=None):
+    """
+    Write each selected file as a fenced block, strictly in order.
+    Upcoming files are opened and their first chunk read on a thread pool
+    (at most OUTPUT_PREFETCH_FILES ahead); the rest of each file is copied in
+    OUTPUT_CHUNK_CHARS pieces, so memory stays bounded regardless of file size.
+    Files in truncate ({path: (kept_tokens, tokens)}) are cut to that share.
+    With an OutputTransformer, other files are deduplicated and minified on
+    the prefetch threads (truncated files are copied as they are).
+    With an output_cache.OutputCache (begun on this output), files whose
+    block in the previous output is still valid are copied from there
+    without being opened, and every block written is recorded.
+    """
+    truncate = truncate or {}
+    pending = deque()
+    remaining = iter(selected_files)
+
+    with ThreadPoolExecutor(max_workers=OUTPUT_PREFETCH_WORKERS) as executor:
+        def submit_next():
+            fp = next(remaining, None)
+            if fp is None:
+                return
+            file_transformer = transformer if fp not in truncate else None
+            st = mode = block = None
+            if cache is not None:
+                mode = _block_mode(fp, truncate, transformer)
+                try:
+                    # Taken before the read: a file changing mid-write just misses next time
+                    st = os.stat(fp)
+                    block = cache.lookup(fp, st, mode)
+                except OSError:
+                    st = None
+            future = None if block is not None else executor.submit(_prefetch_file, fp, file_transformer)
+            pending.append((fp, file_transformer, future, st, mode, block))
+
+        for _ in range(OUTPUT_PREFETCH_FILES):
+            submit_next()
+        try:
+            while pending:
+                fp, file_transformer, future, st, mode, block = pending.popleft()
+                submit_next()
+                if block is not None:
+                    # A dedupe reference is only still right if the same copy comes first
+                    first = None
+                    if block.tokens is not None:
+                        relative_path = os.path.relpath(fp, base_path)
+                        first = transformer.reference(relative_path, block._asdict())
+                    if first == block.ref:
+                        if block.tokens is not None:
+                            transformer.record(relative_path, block._asdict(), first)
+                        cache.copy_block(outfile, fp, block)
+                        continue
+                    future = executor.submit(_prefetch_file, fp, file_transformer)
+                ff, chunk, error = future.result()
+
+                relative_path = os.path.relpath(fp, base_path)
+                # Copies from the previous output are queued: write them out first
+                start = cache.tell(outfile) if cache is not None else None
+                if ff is None and error is None:
+                    first = transformer.reference(relative_path, chunk)
+                    outfile.write(transformer.render(relative_path, chunk))
+                    if st is not None:
+                        cache.record(fp, st, mode, chunk["digest"], start, chunk["tokens"], chunk["tokens_after"], first)
+                    continue
+                outfile.write(f"File: {relative_path}\n```\n")
+                if error is not None:
+                    outfile.write(f"Error reading file: {error}\n```\n\n")
+                    continue
+                try:
+                    digest = None
+                    if fp in truncate:
+                        _copy_truncated(outfile, ff, chunk, *truncate[fp])
+                    else:
+                        h = hashlib.blake2b(digest_size=16) if st is not None else None
+                        while chunk:
+                            outfile.write(chunk)
+                            if h is not None:
+                                h.update(chunk.encode("utf-8", "surrogatepass"))
+                            chunk = ff.read(OUTPUT_CHUNK_CHARS)
+                        digest = h.hexdigest() if h is not None else None
+                    outfile.write("\n```\n\n")
+                    if st is not None:
+                        cache.record(fp, st, mode, digest, start)
+                except Exception as e:
+                    outfile.write(f"Error reading file: {e}\n```\n\n")
+                finally:
+                    ff.close()
+            if cache is not None:
+                cache.tell(outfile)
+        finally:
+            # Close handles that were prefetched but never written
+            for _, _, future, _, _, _ in pending:
+                ff = future.result()[0] if future is not None else None
+                if ff is not None:
+                    ff.close()
+
+def _write_tree(outfile, base_path, excluded_paths, ignore, index, cache):
+    """The directory structure, copied from the previous output if neither the tree nor the exclusions changed."""
+    if cache is None or index is None:
+        outfile.writelines(iter_directory_tree(base_path, excluded_paths, ignore, index))
+        return
+    key = cache_key(sorted(excluded_paths), index.structure_digest())
+    if not cache.copy_tree(outfile, key):
+        start = cache.tell(outfile)
+        outfile.writelines(iter_directory_tree(base_path, excluded_paths, ignore, index))
+        cache.record_tree(key, start, cache.tell(outfile))
+
+def write_output(output_file, base_path, prompt_texts, selected_files, excluded_paths, truncate=None,
+                 transformer=None, ignore=None, index=None, cache=None, changed_only=False):
+    """
+    Write prompts, the directory tree and the selected files to output_file.
+    truncate comes from a budget plan (see budget_optimizer), transformer is
+    an optional output_transform.OutputTransformer, and the tree is listed
+    from index (an fs_index.FsIndex) when one is given. With cache (an
+    output_cache.OutputCache) unchanged blocks are copied from the previous
+    output. With changed_only and a cache, only the selected files that
+    changed since the last generation are written (no prompts or tree), plus
+    a list of files no longer selected; without a cache there is nothing to
+    compare against, so the full output is written.
+    Returns {"files", "bytes", "seconds"} for the write, "reused" blocks with
+    a cache, "removed" with changed_only, plus the transformer's stats if
+    one was used.
+    """
+    start = time.perf_counter()
+    # Selecting the project root selects output_file too, which can't be read while it's written
+    output_path = os.path.abspath(output_file)
+    selected_files = [fp for fp in selected_files if fp != output_path]
+    changed_only = changed_only and cache is not None
+    # With a cache the output is written aside and moved into place when complete
+    write_path = output_file
+    if cache is not None:
+        write_path = cache.begin(output_file)
+        if not os.path.exists(output_file):
+            # Created up front so the tree lists it, as it does without a cache
+            open(output_file, 'a', encoding='utf-8').close()
+    removed = None
+    try:
+        with open(write_path, 'w', encoding='utf-8') as outfile:
+            if cache is not None:
+                # Text goes straight to the byte buffer, whose position locates each block
+                outfile.reconfigure(write_through=True)
+            if index is not None:
+                # The tree lists output_file itself, which may have just been created
+                index.refresh(output_file)
+            if changed_only:
+                selected_files, removed = cache.changes(selected_files)
+                if selected_files:
+                    outfile.write("Changed Files since last generation:\n\n")
+                    stream_files(outfile, base_path, selected_files, truncate, transformer)
+                else:
+                    outfile.write("No selected files changed since the last generation\n")
+                if removed:
+                    outfile.write("\nNo longer selected or removed since last generation:\n")
+                    outfile.writelines(f"{os.path.relpath(fp, base_path)}\n" for fp in removed)
+            else:
+                # Presaved prompts (file-backed ones are streamed, not loaded)
+                for content in prompt_texts:
+                    if isinstance(content, str):
+                        outfile.write(f"```\n{content}\n```\n\n")
+                    else:
+                        outfile.write("```\n")
+                        outfile.writelines(content.iter_chunks())
+                        outfile.write("\n```\n\n")
+
+                # Directory structure
+                outfile.write("Directory Structure:\n")
+                _write_tree(outfile, base_path, excluded_paths, ignore, index, cache)
+
+                # Selected files
+                if selected_files:
+                    outfile.write("\nImportant Code Files:\n\n")
+                    stream_files(outfile, base_path, selected_files, truncate, transformer, cache)
+                else:
+                    outfile.write("\nNo code files selected for inclusion\n")
+        if cache is not None:
+            cache.commit(output_file, full=not changed_only)
+    except BaseException:
+        if cache is not None:
+            cache.abort()
+        raise
+    stats = {
+        "files": len(selected_files),
+        "bytes": os.path.getsize(output_file),
+        "seconds": time.perf_counter() - start,
+    }
+    if cache is not None and not changed_only:
+        stats["reused"] = cache.reused
+    if removed is not None:
+        stats["removed"] = len(removed)
+    if transformer is not None:
+        stats.update(transformer.stats())
+    return stats
+
+def format_write_stats(stats):
+    seconds = stats["seconds"]
+    rate = stats["bytes"] / seconds if seconds > 0 else 0
+    text = (
+        f"{stats['files']} files, {stats['bytes'] / 1e6:.2f} MB written "
+        f"in {seconds:.2f}s ({rate / 1e6:.1f} MB/s)"
+    )
+    if "tokens_saved" in stats:
+        text += (
+            f"; {stats['duplicates']} duplicates, {stats['minified']} minified, "
+            f"~{stats['tokens_saved']} tokens saved"
+        )
+    if stats.get("reused"):
+        text += f"; {stats['reused']} unchanged files reused from the last output"
+    if "removed" in stats:
+        text += f"; changed since last generation only ({stats['removed']} no longer selected)"
+    return text
+
+# --------------------------------------------------------------------------
+# Headless build
+# --------------------------------------------------------------------------
+def plan_for_budget(base_path, config, token_budget, ignore=None, index=None):
+    """Count tokens (through the on-disk cache) and plan files for token_budget."""
+    tokenizer = load_tokenizer(base_path)
+    cache = TokenCache.open_for(base_path, tokenizer.name)
+    skipped = {}
+    try:
+        file_tokens = scan_file_tokens(
+            base_path, {TOKENIZER_FILENAME}, cache, tokenizer, skipped, ignore=ignore, index=index
+        )
+    finally:
+        if cache is not None:
+            cache.close()
+    _, rules = rules_from_config(config)
+    selection = SelectionModel.from_config(config)
+    # Forced binary / large files are estimated from their size, as in the GUI
+    for path in skipped:
+        if selection.is_forced(path):
+            try:
+                file_tokens[path] = forced_file_tokens(os.path.getsize(path))
+            except OSError:
+                pass
+    optimizer = BudgetOptimizer(base_path, {CONTEXT_CONFIG_FILENAME, OUTPUT_FILENAME})
+    return optimizer.plan(file_tokens, selection, token_budget, rules, index)
+
+def build_context(base_path, config, output_file, export_tables=None, sample_budget=None, export_concurrency=None,
+                  export_cache=True, export_format=None, token_budget=None, dedupe=None, minify=None,
+                  output_cache=True, changed_only=None):
+    """
+    Build output_file from a loaded ai_context.config without any GUI and
+    return the write stats. If export_tables is given, those Supabase tables are exported first using
+    the stored supabase_config.local credentials and sampling, within sample_budget tokens if given.
+    With token_budget (or "token_budget" in the config) files are picked by the budget optimizer.
+    dedupe / minify (default: the config's "dedupe" / "minify") enable the output transform stage.
+    Unchanged blocks are copied from the previous output unless output_cache is False, and
+    changed_only (default: the config's "changed_only") writes only the files changed since the last generation.
+    """
+    prompts_data = load_prompts(base_path)
+
+    if export_tables:
+        prompt, export_stats = supabase_export.export_to_file(
+            base_path, export_tables, token_budget=sample_budget, concurrency=export_concurrency,
+            use_cache=export_cache, fmt=export_format
+        )
+        print(supabase_export.format_export_stats(export_stats))
+        prompts_data[SUPABASE_JSON_FILENAME] = {"path": prompt.path, "content": prompt}
+    elif SUPABASE_JSON_FILENAME in config.get('selected_prompts', []):
+        prompt = load_supabase_prompt(base_path)
+        if prompt is not None:
+            prompts_data[SUPABASE_JSON_FILENAME] = {"path": prompt.path, "content": prompt}
+
+    prompt_texts = [
+        prompts_data[name]["content"]
+        for name in config.get('selected_prompts', [])
+        if name in prompts_data
+    ]
+    if export_tables and SUPABASE_JSON_FILENAME not in config.get('selected_prompts', []):
+        prompt_texts.append(prompts_data[SUPABASE_JSON_FILENAME]["content"])
+
+    # One walk of the project serves the budget scan, the selection and the tree
+    ignore = load_ignore(base_path)
+    index = FsIndex.build(base_path, ignore)
+    token_budget = token_budget or config.get('token_budget')
+    truncate = None
+    if token_budget:
+        plan = plan_for_budget(base_path, config, token_budget, ignore, index)
+        print(f"Budget plan: {format_plan_stats(plan)}")
+        selected_files, truncate = plan["files"], plan["truncate"]
+    else:
+        selected_files = resolve_selected_files(config, ignore, index)
+    dedupe = config.get('dedupe', False) if dedupe is None else dedupe
+    minify = config.get('minify', False) if minify is None else minify
+    changed_only = config.get('changed_only', False) if changed_only is None else changed_only
+    transformer = None
+    if dedupe or minify:
+        transformer = OutputTransformer.open_for(base_path, dedupe, minify, load_tokenizer(base_path))
+    cache = OutputCache.open_for(base_path) if output_cache else None
+    try:
+        return write_output(
+            output_file, base_path, prompt_texts, selected_files, config.get('excluded_paths', []), truncate,
+            transformer, ignore, index, cache, changed_only
+        )
+    finally:
+        if transformer is not None:
+            transformer.close()
+        if cache is not None:
+            cache.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build AI context output without the GUI.")
+    parser.add_argument("--base", default=None, help="Project root (default: directory of this script)")
+    parser.add_argument("--config", default=None, help=f"Saved selection (default: <base>/{CONTEXT_CONFIG_FILENAME})")
+    parser.add_argument("--out", default=None, help=f"Output file (default: <base>/{OUTPUT_FILENAME})")
+    parser.add_argument("--export-tables", default=None,
+                        help="Comma-separated Supabase tables to export before building")
+    parser.add_argument("--sample-budget", type=int, default=None,
+                        help="Token budget shared by the exported tables (overrides SUPABASE_TOKEN_BUDGET)")
+    parser.add_argument("--export-concurrency", type=int, default=None,
+                        help="Tables exported in parallel (overrides SUPABASE_EXPORT_CONCURRENCY, default 4)")
+    parser.add_argument("--export-format", choices=supabase_export.EXPORT_FORMATS, default=None,
+                        help="json, or a COPY-based csv/tsv/markdown table (overrides SUPABASE_EXPORT_FORMAT)")
+    parser.add_argument("--no-export-cache", action="store_true",
+                        help="Re-read every exported table instead of reusing unchanged ones from the last export")
+    parser.add_argument("--token-budget", type=int, default=None,
+                        help="Auto-select and trim files to fit this many tokens (overrides token_budget in the config)")
+    parser.add_argument("--dedupe", action="store_true", default=None,
+                        help="Write files whose content was already written as a reference to the first copy")
+    parser.add_argument("--minify", action="store_true", default=None,
+                        help="Strip comments and redundant whitespace for known languages")
+    parser.add_argument("--changed-only", action="store_true", default=None,
+                        help="Only write the selected files that changed since the last generation")
+    parser.add_argument("--no-output-cache", action="store_true",
+                        help="Re-read every selected file instead of reusing unchanged blocks of the last output")
+    args = parser.parse_args(argv)
+    if args.changed_only and args.no_output_cache:
+        parser.error("--changed-only needs the output cache to know what changed; drop --no-output-cache")
+
+    base_path = os.path.abspath(args.base or os.path.dirname(os.path.abspath(__file__)))
+    config_file = args.config or os.path.join(base_path, CONTEXT_CONFIG_FILENAME)
+    output_file = args.out or os.path.join(base_path, OUTPUT_FILENAME)
+    export_tables = [t.strip() for t in args.export_tables.split(",") if t.strip()] if args.export_tables else None
+
+    try:
+        config = load_context_config(config_file)
+    except Exception as e:
+        print(f"Failed to load configuration {config_file}: {e}", file=sys.stderr)
+        return 1
+
+    try:
+        stats = build_context(
+            base_path, config, output_file, export_tables, args.sample_budget, args.export_concurrency,
+            not args.no_export_cache, args.export_format, args.token_budget, args.dedupe, args.minify,
+            not args.no_output_cache, args.changed_only
+        )
+    except Exception as e:
+        print(f"Failed to generate output: {e}", file=sys.stderr)
+        return 1
+
+    print(f"Output generated at: {output_file} ({format_write_stats(stats)})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""
+Local snapshot cache for Supabase exports, stored next to supabase_config.local.
+
+Each exported table's JSON entry is kept as a fragment file together with the
+fingerprint it was exported under (database, table statistics, schema,
+sampling and token share). When the fingerprint is unchanged the next export copies the
+fragment instead of reading the table from Postgres.
+"""
+import os
+import json
+import shutil
+import hashlib
+import threading
+
+EXPORT_CACHE_DIRNAME = "ai_context.supabase_cache"
+EXPORT_CACHE_INDEX = "index.json"
+EXPORT_CACHE_VERSION = 1
+
+
+class ExportCache:
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self.index_path = os.path.join(cache_dir, EXPORT_CACHE_INDEX)
+        self._entries = {}
+        self._dirty = False
+        self._lock = threading.Lock()  # stores come from export worker threads
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            if index.get("version") == EXPORT_CACHE_VERSION:
+                self._entries = index.get("tables", {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print("Ignoring unreadable export cache index:", e)
+
+    @classmethod
+    def open_for(cls, base_path):
+        """Open the cache for a project, or return None if it can't be used."""
+        try:
+            return cls(os.path.join(base_path, EXPORT_CACHE_DIRNAME))
+        except OSError as e:
+            print("Failed to open export cache:", e)
+            return None
+
+    def fragment_path(self, table):
+        name = hashlib.blake2b(table.encode("utf-8"), digest_size=12).hexdigest()
+        return os.path.join(self.cache_dir, name + ".json")
+
+    def lookup(self, table, key):
+        """(fragment path, stats) if table was cached under key, else None."""
+        with self._lock:
+            entry = self._entries.get(table)
+        if entry is None or entry["key"] != key:
+            return None
+        path = self.fragment_path(table)
+        if not os.path.exists(path):
+            return None
+        return path, entry["stats"]
+
+    def open_fragment(self, table):
+        """Temporary file to export a table into; pass it to store() when complete."""
+        return open(self.fragment_path(table) + f".{threading.get_ident()}.tmp", "w+", encoding="utf-8")
+
+    def store(self, table, key, fragment, stats):
+        fragment.close()
+        os.replace(fragment.name, self.fragment_path(table))
+        with self._lock:
+            self._entries[table] = {"key": key, "stats": stats}
+            self._dirty = True
+
+    def discard(self, fragment):
+        fragment.close()
+        try:
+            os.remove(fragment.name)
+        except OSError:
+            pass
+
+    def flush(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            index = {"version": EXPORT_CACHE_VERSION, "tables": self._entries}
+            self._dirty = False
+        tmp = self.index_path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(index, f)
+            os.replace(tmp, self.index_path)
+        except OSError as e:
+            print("Failed to write export cache:", e)
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            self._dirty = False
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+
+def cache_key(*parts):
+    """Stable digest of JSON-serializable parts."""
+    text = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
@@ -0,0 +1,318 @@
+"""
+In-memory index of the project tree shared by every walker.
+
+The tree is walked once (scandir, pruned by the ignore matcher) into parallel
+arrays indexed by node id: parent, kind, size, mtime_ns, inode and tokens,
+with interned names and a {name: id} map per directory. The token scan,
+the tree view, the output directory tree and selection expansion then list
+directories and read stat data from here instead of going back to disk.
+The filesystem watcher keeps it current with refresh().
+
+Anything that needs a directory listing takes a lister: a function
+path -> [(name, kind)] or None when the path can't be listed. dir_lister()
+returns one backed by the index, with scandir as the fallback.
+"""
+import os
+import sys
+import hashlib
+import threading
+from array import array
+
+FILE = 0
+DIR = 1
+# A symlink to a directory: listed, but never descended into
+LINKED_DIR = 2
+_DETACHED = -2
+
+
+class IndexStat:
+    """The stat fields the token cache and scan guard use."""
+    __slots__ = ("st_size", "st_mtime_ns", "st_ino")
+
+    def __init__(self, size, mtime_ns, ino):
+        self.st_size = size
+        self.st_mtime_ns = mtime_ns
+        self.st_ino = ino
+
+
+def _entry_kind(e):
+    try:
+        if e.is_dir():
+            return LINKED_DIR if e.is_symlink() else DIR
+    except OSError:
+        pass
+    return FILE
+
+
+def scan_dir(path, ignore=None):
+    """[(name, kind)] for a directory straight from disk, or None if unreadable."""
+    try:
+        with os.scandir(path) as it:
+            entries = [(e.name, _entry_kind(e)) for e in it]
+    except OSError:
+        return None
+    if ignore is not None:
+        entries = [(name, kind) for name, kind in entries if not ignore.ignored(path, name, kind != FILE)]
+    return entries
+
+
+class FsIndex:
+    def __init__(self, base_path, ignore=None):
+        self.base_path = os.path.abspath(base_path)
+        self._prefix = os.path.join(self.base_path, "")
+        self.ignore = ignore
+        self.names = []
+        self.parent = array("i")
+        self.kind = bytearray()
+        self.size = array("q")
+        self.mtime_ns = array("q")
+        self.inode = array("Q")
+        self.tokens = array("q")  # -1 until counted
+        self.children = {}        # dir id -> {name: child id}
+        self._lock = threading.RLock()  # refreshed from the watcher thread
+        self.root = self._add(-1, self.base_path, DIR)
+        self._last_dir = (self.base_path, self.root)
+
+    @classmethod
+    def build(cls, base_path, ignore=None, cancel_event=None):
+        index = cls(base_path, ignore)
+        index._scan(index.root, index.base_path, cancel_event)
+        return index
+
+    def __len__(self):
+        return len(self.names)
+
+    def _add(self, parent, name, kind, size=0, mtime_ns=0, ino=0):
+        node = len(self.names)
+        self.names.append(sys.intern(name))
+        self.parent.append(parent)
+        self.kind.append(kind)
+        self.size.append(size)
+        self.mtime_ns.append(mtime_ns)
+        self.inode.append(ino)
+        self.tokens.append(-1)
+        if kind == DIR:
+            self.children[node] = {}
+        if parent >= 0:
+            self.children[parent][self.names[node]] = node
+        return node
+
+    def _scan(self, node, path, cancel_event=None):
+        """Add everything below an (empty) directory node."""
+        ignore = self.ignore
+        add = self._add
+        stack = [(node, path)]
+        while stack:
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            dir_node, dir_path = stack.pop()
+            try:
+                with os.scandir(dir_path) as it:
+                    entries = list(it)
+            except OSError:
+                continue
+            for e in entries:
+                kind = _entry_kind(e)
+                if ignore is not None and ignore.ignored(dir_path, e.name, kind != FILE):
+                    continue
+                if kind == FILE:
+                    try:
+                        st = e.stat()
+                    except OSError:
+                        continue
+                    add(dir_node, e.name, FILE, st.st_size, st.st_mtime_ns, st.st_ino)
+                else:
+                    child = add(dir_node, e.name, kind)
+                    if kind == DIR:
+                        stack.append((child, e.path))
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+    def find(self, path):
+        """Node id of path, or None if it isn't indexed."""
+        node = self._find(path)
+        if node is None:
+            # Relative, or with "." / ".." / doubled separators
+            norm = os.path.abspath(path)
+            if norm != path:
+                node = self._find(norm)
+        return node
+
+    def _find(self, path):
+        # Lock-free: single dict reads are atomic, and ids of detached nodes
+        # are never reused, so a racing refresh can only cause a miss
+        if path == self.base_path:
+            return self.root
+        parent_path, _, name = path.rpartition(os.sep)
+        last_path, last_node = self._last_dir
+        if parent_path == last_path:
+            entries = self.children.get(last_node)
+            if entries is not None:
+                return entries.get(name)
+        if not path.startswith(self._prefix):
+            return None
+        node = self.root
+        children = self.children
+        for part in parent_path[len(self._prefix):].split(os.sep) if parent_path != self.base_path else ():
+            entries = children.get(node)
+            if entries is None:
+                return None
+            node = entries.get(part)
+            if node is None:
+                return None
+        entries = children.get(node)
+        if entries is None:
+            return None
+        # Lookups tend to come in runs over one directory's entries
+        self._last_dir = (parent_path, node)
+        return entries.get(name)
+
+    def is_dir(self, path):
+        """True / False for indexed paths, else whatever the disk says."""
+        node = self.find(path)
+        if node is None:
+            return os.path.isdir(path)
+        return self.kind[node] != FILE
+
+    def list_dir(self, path):
+        """[(name, kind)] of an indexed directory, or None if it isn't one."""
+        node = self.find(path)
+        with self._lock:
+            children = self.children.get(node) if node is not None else None
+            if children is None:
+                return None
+            kind = self.kind
+            return [(name, kind[child]) for name, child in children.items()]
+
+    def stat(self, node):
+        return IndexStat(self.size[node], self.mtime_ns[node], self.inode[node])
+
+    def iter_files(self, path=None, cancel_event=None):
+        """
+        Yield (full_path, node) for every indexed file under path. The
+        listing is taken up front, so refreshes during iteration are safe.
+        """
+        top = self.find(path) if path is not None else self.root
+        if top is None:
+            return
+        # Paths are built on top of path as given, like os.walk does
+        top_path = self.base_path if path is None else path
+        files = []
+        with self._lock:
+            if top not in self.children:
+                files.append((top_path, top))
+                stack = []
+            else:
+                stack = [(top, top_path)]
+            while stack:
+                node, dir_path = stack.pop()
+                for name, child in self.children[node].items():
+                    kind = self.kind[child]
+                    if kind == FILE:
+                        files.append((dir_path + os.sep + name, child))
+                    elif kind == DIR:
+                        stack.append((child, dir_path + os.sep + name))
+        for i, item in enumerate(files):
+            if cancel_event is not None and i % 1024 == 0 and cancel_event.is_set():
+                return
+            yield item
+
+    def iter_dirs(self):
+        """Every indexed directory path (symlinked ones are not descended)."""
+        with self._lock:
+            dirs = []
+            stack = [(self.root, self.base_path)]
+            while stack:
+                node, dir_path = stack.pop()
+                dirs.append(dir_path)
+                for name, child in self.children[node].items():
+                    if self.kind[child] == DIR:
+                        stack.append((child, dir_path + os.sep + name))
+        return dirs
+
+    def structure_digest(self):
+        """Hash of every entry's name, kind and place in the tree (not sizes or times)."""
+        with self._lock:
+            h = hashlib.blake2b(self.base_path.encode("utf-8", "surrogateescape"), digest_size=16)
+            h.update(self.parent.tobytes())
+            h.update(bytes(self.kind))
+            h.update("\0".join(self.names).encode("utf-8", "surrogateescape"))
+        return h.hexdigest()
+
+    def set_tokens(self, node, tokens):
+        self.tokens[node] = tokens
+
+    # ------------------------------------------------------------------
+    # Updates (from the filesystem watcher)
+    # ------------------------------------------------------------------
+    def _detach(self, node):
+        parent = self.parent[node]
+        if parent >= 0:
+            self.children[parent].pop(self.names[node], None)
+        stack = [node]
+        while stack:
+            n = stack.pop()
+            self.parent[n] = _DETACHED
+            stack.extend(self.children.pop(n, {}).values())
+
+    def refresh(self, path):
+        """Bring path (a file, or a whole directory subtree) in line with the disk."""
+        path = os.path.abspath(path)
+        if path == self.base_path:
+            with self._lock:
+                self._rescan(self.root, path)
+            return
+        parent_path, name = os.path.split(path)
+        parent = self.find(parent_path)
+        if parent is None or self.kind[parent] != DIR:
+            # A new directory chain: re-list from the nearest indexed ancestor
+            if parent_path != path and parent_path.startswith(self._prefix):
+                self.refresh(parent_path)
+            return
+        try:
+            st = os.stat(path)
+            is_dir = os.path.isdir(path)
+            kind = (LINKED_DIR if os.path.islink(path) else DIR) if is_dir else FILE
+        except OSError:
+            st = None
+        with self._lock:
+            old = self.children[parent].get(name)
+            if st is None or (self.ignore is not None and self.ignore.ignored(parent_path, name, is_dir)):
+                if old is not None:
+                    self._detach(old)
+                return
+            if old is not None and self.kind[old] == kind:
+                # Updated in place, so the entry keeps its place in the listing
+                if kind == FILE:
+                    self.size[old] = st.st_size
+                    self.mtime_ns[old] = st.st_mtime_ns
+                    self.inode[old] = st.st_ino
+                    self.tokens[old] = -1
+                elif kind == DIR:
+                    self._rescan(old, path)
+                return
+            if old is not None:
+                self._detach(old)
+            if kind == FILE:
+                self._add(parent, name, FILE, st.st_size, st.st_mtime_ns, st.st_ino)
+            elif kind == DIR:
+                self._scan(self._add(parent, name, DIR), path)
+            else:
+                self._add(parent, name, LINKED_DIR)
+
+    def _rescan(self, node, path):
+        for child in list(self.children[node].values()):
+            self._detach(child)
+        self._scan(node, path)
+
+
+def dir_lister(ignore=None, index=None):
+    """A lister reading from index where it can, and from disk otherwise."""
+    if index is None:
+        return lambda path: scan_dir(path, ignore)
+
+    def lister(path):
+        entries = index.list_dir(path)
+        return entries if entries is not None else scan_dir(path, ignore)
+    return lister
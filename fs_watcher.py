@@ -0,0 +1,260 @@
+"""
+Filesystem watchers that report changed paths under a project root.
+
+On Linux the watcher uses inotify (through ctypes, no extra dependency) with
+one watch per directory; elsewhere, or if inotify is unavailable or runs out
+of watches, it falls back to polling mtimes. Both backends debounce: changed
+paths are collected until the tree has been quiet for DEBOUNCE_SECONDS (or
+MAX_LATENCY_SECONDS have passed), then delivered as one set to the callback,
+so a `git checkout` produces a handful of batches instead of thousands of
+updates. The callback runs on the watcher thread.
+
+A path in a batch may be a modified/created file, a deleted file or
+directory, or a directory that appeared (whose contents should be rescanned).
+Entries rejected by the ignore matcher (ignore_rules.IgnoreMatcher) are
+neither watched nor reported. Given an fs_index.FsIndex, the initial watch
+list (or poll snapshot) is taken from it instead of walking the tree again.
+"""
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import threading
+
+DEBOUNCE_SECONDS = 0.3
+MAX_LATENCY_SECONDS = 2.0
+POLL_INTERVAL_SECONDS = 3.0
+
+
+class _BaseWatcher:
+    def __init__(self, base_path, callback, ignore=None, skip_names=()):
+        self.base_path = base_path
+        self.callback = callback
+        self.ignore = ignore
+        self.skip_names = set(skip_names)
+        self._stop = threading.Event()
+        self._thread = None
+        self._pending = set()
+        self._first_event = None
+        self._last_event = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _skipped(self, path):
+        return os.path.basename(path) in self.skip_names
+
+    def _ignored(self, dir_path, name, is_dir):
+        return self.ignore is not None and self.ignore.ignored(dir_path, name, is_dir)
+
+    def _note(self, path):
+        if self._skipped(path):
+            return
+        now = time.monotonic()
+        if not self._pending:
+            self._first_event = now
+        self._last_event = now
+        self._pending.add(path)
+
+    def _maybe_flush(self):
+        if not self._pending:
+            return
+        now = time.monotonic()
+        if now - self._last_event >= DEBOUNCE_SECONDS or now - self._first_event >= MAX_LATENCY_SECONDS:
+            batch, self._pending = self._pending, set()
+            try:
+                self.callback(batch)
+            except Exception as e:
+                print("Filesystem watcher callback failed:", e)
+
+    def _iter_dirs(self, top):
+        for root, dirs, _ in os.walk(top, topdown=True):
+            dirs[:] = [d for d in dirs if not self._ignored(root, d, True)]
+            yield root
+
+
+# --------------------------------------------------------------------------
+# inotify (Linux)
+# --------------------------------------------------------------------------
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+    | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+)
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class InotifyUnavailable(Exception):
+    pass
+
+
+def _load_libc():
+    import ctypes
+    import ctypes.util
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    libc.inotify_init1.argtypes = [ctypes.c_int]
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return libc, ctypes
+
+
+class InotifyWatcher(_BaseWatcher):
+    def __init__(self, base_path, callback, ignore=None, skip_names=(), index=None):
+        super().__init__(base_path, callback, ignore, skip_names)
+        if not sys.platform.startswith("linux"):
+            raise InotifyUnavailable("inotify is Linux-only")
+        try:
+            self._libc, self._ctypes = _load_libc()
+            self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        except (OSError, AttributeError) as e:
+            raise InotifyUnavailable(str(e))
+        if self._fd < 0:
+            raise InotifyUnavailable(os.strerror(self._ctypes.get_errno()))
+        self._wd_paths = {}
+        try:
+            for d in index.iter_dirs() if index is not None else self._iter_dirs(base_path):
+                self._add_watch(d)
+        except InotifyUnavailable:
+            os.close(self._fd)
+            raise
+
+    def _add_watch(self, path):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = self._ctypes.get_errno()
+            if err == errno.ENOSPC:
+                raise InotifyUnavailable("inotify watch limit reached")
+            return  # vanished or unreadable; nothing to watch
+        self._wd_paths[wd] = path
+
+    def _forget_tree(self, path):
+        prefix = os.path.join(path, "")
+        for wd, p in list(self._wd_paths.items()):
+            if p == path or p.startswith(prefix):
+                self._libc.inotify_rm_watch(self._fd, wd)
+                del self._wd_paths[wd]
+
+    def _handle(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            # Events were dropped: ask for a rescan of the whole tree
+            self._note(self.base_path)
+            return
+        if mask & IN_IGNORED:
+            self._wd_paths.pop(wd, None)
+            return
+        parent = self._wd_paths.get(wd)
+        if parent is None or not name:
+            return
+        path = os.path.join(parent, name)
+        if self._ignored(parent, name, bool(mask & IN_ISDIR)):
+            return
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                try:
+                    for d in self._iter_dirs(path):
+                        self._add_watch(d)
+                except InotifyUnavailable:
+                    print("inotify watch limit reached; new directories are not watched")
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                self._forget_tree(path)
+        self._note(path)
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                ready, _, _ = select.select([self._fd], [], [], DEBOUNCE_SECONDS / 2)
+                if ready:
+                    try:
+                        data = os.read(self._fd, 64 * 1024)
+                    except BlockingIOError:
+                        data = b""
+                    offset = 0
+                    while offset + _EVENT_HEADER.size <= len(data):
+                        wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                        offset += _EVENT_HEADER.size
+                        name = data[offset:offset + length].rstrip(b"\0")
+                        offset += length
+                        self._handle(wd, mask, os.fsdecode(name))
+                self._maybe_flush()
+        finally:
+            os.close(self._fd)
+
+
+# --------------------------------------------------------------------------
+# mtime polling (fallback)
+# --------------------------------------------------------------------------
+class PollingWatcher(_BaseWatcher):
+    def __init__(self, base_path, callback, ignore=None, skip_names=(), interval=POLL_INTERVAL_SECONDS, index=None):
+        super().__init__(base_path, callback, ignore, skip_names)
+        self.interval = interval
+        if index is not None:
+            self._files = {
+                path: (index.mtime_ns[node], index.size[node]) for path, node in index.iter_files()
+            }
+            self._dirs = set(index.iter_dirs())
+        else:
+            self._files, self._dirs = self._snapshot()
+
+    def _snapshot(self):
+        files = {}
+        dirs = set()
+        for root, dirnames, filenames in os.walk(self.base_path, topdown=True):
+            dirnames[:] = [d for d in dirnames if not self._ignored(root, d, True)]
+            dirs.add(root)
+            for f in filenames:
+                if self._ignored(root, f, False):
+                    continue
+                path = os.path.join(root, f)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files[path] = (st.st_mtime_ns, st.st_size)
+        return files, dirs
+
+    def _run(self):
+        next_poll = time.monotonic() + self.interval
+        while not self._stop.wait(DEBOUNCE_SECONDS / 2):
+            if time.monotonic() >= next_poll:
+                files, dirs = self._snapshot()
+                for path in dirs.symmetric_difference(self._dirs):
+                    self._note(path)
+                for path, key in files.items():
+                    if self._files.get(path) != key:
+                        self._note(path)
+                for path in self._files.keys() - files.keys():
+                    self._note(path)
+                self._files, self._dirs = files, dirs
+                next_poll = time.monotonic() + self.interval
+            self._maybe_flush()
+
+
+def create_watcher(base_path, callback, ignore=None, skip_names=(), index=None):
+    """inotify where available, mtime polling otherwise."""
+    try:
+        return InotifyWatcher(base_path, callback, ignore, skip_names, index)
+    except InotifyUnavailable as e:
+        if sys.platform.startswith("linux"):
+            print("inotify unavailable, falling back to polling:", e)
+        return PollingWatcher(base_path, callback, ignore, skip_names, index=index)
@@ -0,0 +1,208 @@
+"""
+.gitignore-aware exclusion shared by every directory walk.
+
+IgnoreMatcher combines the built-in excluded directory and file names with
+the project's ignore files: .git/info/exclude, .gitignore (at the root and in
+any subdirectory) and the tool's own .aicontextignore at the root. Each file
+is compiled into a single regex whose alternatives are the file's rules in
+reverse order, so one fullmatch finds the last matching rule, which decides
+(negated "!" rules re-include). Rules from deeper directories win over
+shallower ones, as in git.
+
+Walkers ask ignored(dir_path, name, is_dir) for each entry before descending,
+so ignored directories are never listed. Nested .gitignore files are read
+the first time their directory is asked about.
+"""
+import os
+import re
+
+PROJECT_IGNORE_FILENAME = ".aicontextignore"
+GITIGNORE_FILENAME = ".gitignore"
+# A change to one of these (in the watched tree) means the rules must be reloaded
+IGNORE_FILENAMES = {GITIGNORE_FILENAME, PROJECT_IGNORE_FILENAME}
+# Never part of a project's context, whatever the ignore files say
+ALWAYS_IGNORED_DIRS = {".git"}
+
+
+def _glob_segment(segment):
+    """Regex for one path segment of a gitignore glob."""
+    out = []
+    i = 0
+    n = len(segment)
+    while i < n:
+        c = segment[i]
+        if c == "\\" and i + 1 < n:
+            out.append(re.escape(segment[i + 1]))
+            i += 2
+            continue
+        if c == "*":
+            while i + 1 < n and segment[i + 1] == "*":
+                i += 1
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            end = segment.find("]", i + 2)
+            if end == -1:
+                out.append(re.escape(c))
+            else:
+                body = segment[i + 1:end]
+                if body[0] in "!^":
+                    body = "^" + body[1:]
+                out.append("[" + body.replace("\\", "\\\\") + "]")
+                i = end
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
+def parse_rule(line):
+    """
+    (regex, negate, dir_only) for one gitignore line, or None for blank lines
+    and comments. The regex matches a '/'-separated path relative to the
+    directory holding the ignore file.
+    """
+    line = line.rstrip("\n\r")
+    # Trailing spaces are dropped unless escaped
+    while line.endswith(" ") and not line.endswith("\\ "):
+        line = line[:-1]
+    if not line or line.startswith("#"):
+        return None
+    negate = line.startswith("!")
+    if negate:
+        line = line[1:]
+    elif line.startswith("\\!") or line.startswith("\\#"):
+        line = line[1:]
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    if not line:
+        return None
+    # A slash anywhere but the end anchors the pattern to its directory
+    anchored = "/" in line
+    line = line.lstrip("/")
+
+    parts = line.split("/")
+    pieces = [] if anchored else ["(?:.*/)?"]
+    for i, part in enumerate(parts):
+        last = i == len(parts) - 1
+        if part == "**":
+            pieces.append(".*" if last else "(?:.*/)?")
+            continue
+        pieces.append(_glob_segment(part))
+        if not last:
+            pieces.append("/")
+    return "".join(pieces), negate, dir_only
+
+
+class RuleSet:
+    """The compiled rules of one ignore file."""
+
+    def __init__(self, base_dir, lines):
+        self.base_dir = base_dir
+        rules = [r for r in (parse_rule(line) for line in lines) if r is not None]
+        self.any_regex, self.any_negates = self._compile(rules)
+        self.file_regex, self.file_negates = self._compile([r for r in rules if not r[2]])
+
+    @staticmethod
+    def _compile(rules):
+        if not rules:
+            return None, ()
+        rules = rules[::-1]  # first alternative to match = last rule in the file
+        regex = re.compile("|".join(f"({pattern})" for pattern, _, _ in rules), re.DOTALL)
+        return regex, (None,) + tuple(negate for _, negate, _ in rules)
+
+    def match(self, rel_path, is_dir):
+        """True (ignored), False (re-included) or None (no rule matches)."""
+        if is_dir:
+            regex, negates = self.any_regex, self.any_negates
+        else:
+            regex, negates = self.file_regex, self.file_negates
+        if regex is None:
+            return None
+        m = regex.fullmatch(rel_path)
+        if m is None:
+            return None
+        return not negates[m.lastindex]
+
+    @classmethod
+    def from_file(cls, base_dir, path):
+        try:
+            with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                lines = f.readlines()
+        except OSError:
+            return None
+        rules = cls(base_dir, lines)
+        return rules if rules.any_regex is not None else None
+
+
+class IgnoreMatcher:
+    def __init__(self, base_path, skip_dirs=(), skip_files=()):
+        self.base_path = os.path.abspath(base_path)
+        self.skip_dirs = set(skip_dirs) | ALWAYS_IGNORED_DIRS
+        self.skip_files = set(skip_files)
+        self.reload()
+
+    def reload(self):
+        """Re-read every ignore file (after one of them changed)."""
+        root_rules = []
+        for path in (
+            os.path.join(self.base_path, ".git", "info", "exclude"),
+            os.path.join(self.base_path, GITIGNORE_FILENAME),
+            os.path.join(self.base_path, PROJECT_IGNORE_FILENAME),
+        ):
+            rules = RuleSet.from_file(self.base_path, path)
+            if rules is not None:
+                root_rules.append(rules)
+        # dir_path -> ((RuleSet, relative prefix of dir_path), ...), deepest first
+        self._dir_rules = {self.base_path: tuple((rules, "") for rules in reversed(root_rules))}
+
+    def _rules_for(self, dir_path):
+        rules = self._dir_rules.get(dir_path)
+        if rules is not None:
+            return rules
+        norm = os.path.abspath(dir_path)
+        rules = self._dir_rules.get(norm)
+        if rules is None:
+            parent, name = os.path.split(norm)
+            if parent == norm or not name:
+                rules = ()  # outside the project
+            else:
+                parent_rules = self._rules_for(parent)
+                if self._inside(parent):
+                    own = RuleSet.from_file(norm, os.path.join(norm, GITIGNORE_FILENAME))
+                    inherited = tuple((rs, prefix + name + "/") for rs, prefix in parent_rules)
+                    rules = ((own, ""),) + inherited if own is not None else inherited
+                else:
+                    rules = ()
+            self._dir_rules[norm] = rules
+        self._dir_rules[dir_path] = rules
+        return rules
+
+    def _inside(self, path):
+        return path == self.base_path or path.startswith(os.path.join(self.base_path, ""))
+
+    def ignored(self, dir_path, name, is_dir):
+        """Whether entry name of directory dir_path is ignored."""
+        if name in (self.skip_dirs if is_dir else self.skip_files):
+            return True
+        for rules, prefix in self._rules_for(dir_path):
+            result = rules.match(prefix + name, is_dir)
+            if result is not None:
+                return result
+        return False
+
+    def is_ignored(self, path, is_dir=None):
+        """Whether path, or any directory between it and base_path, is ignored."""
+        path = os.path.abspath(path)
+        if not self._inside(path) or path == self.base_path:
+            return False
+        rel = os.path.relpath(path, self.base_path).split(os.sep)
+        dir_path = self.base_path
+        for name in rel[:-1]:
+            if self.ignored(dir_path, name, True):
+                return True
+            dir_path = os.path.join(dir_path, name)
+        if is_dir is None:
+            is_dir = os.path.isdir(path)
+        return self.ignored(dir_path, rel[-1], is_dir)
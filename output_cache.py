@@ -0,0 +1,318 @@
+"""
+Block cache for incremental output regeneration, stored in ai_context.output_cache/.
+
+The last output.txt doubles as the cache. index.json records the byte range
+of every block in it: the directory tree, and each selected file's
+"File: ..." header with its fenced content. A file block is recorded with
+the source file's size, mtime_ns and inode, its content hash and the mode
+it was rendered in (transform settings, truncation). The tree is recorded
+with a key over the exclusion set and the index's structure. The next
+output is written to a temporary file and only renamed over the old one
+once it is complete, so a failed generation leaves the old output (and the
+cache) as they were. Blocks that are still valid are copied from the old
+output byte for byte, so only changed files are reopened. If the old output
+was edited or replaced since (its own size, mtime_ns or inode changed)
+nothing is reused. A changes-only output doesn't replace the store: the
+last full output is moved into the cache directory instead.
+
+The content hash and stat key of every file of the last generation are kept
+too, for the "changed since last generation" output mode.
+"""
+import os
+import json
+import hashlib
+from collections import namedtuple
+
+from token_cache import stat_key
+
+OUTPUT_CACHE_DIRNAME = "ai_context.output_cache"
+OUTPUT_CACHE_INDEX = "index.json"
+OUTPUT_CACHE_VERSION = 1
+PREVIOUS_OUTPUT_FILENAME = "previous_output.txt"
+NEXT_OUTPUT_FILENAME = "next_output.txt"
+COPY_CHUNK_BYTES = 1024 * 1024
+
+# key: (size, mtime_ns, inode) of the source file. digest is None for
+# truncated files, tokens / tokens_after are None unless the block went
+# through the transform stage, ref is the first copy a dedupe reference names.
+Block = namedtuple("Block", "key mode digest tokens tokens_after ref start end")
+
+
+def file_digest(path):
+    """Content hash of a file as the output reads it (matches output_transform.content_digest)."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        for chunk in iter(lambda: f.read(COPY_CHUNK_BYTES), ""):
+            h.update(chunk.encode("utf-8", "surrogatepass"))
+    return h.hexdigest()
+
+
+class OutputCache:
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self.index_path = os.path.join(cache_dir, OUTPUT_CACHE_INDEX)
+        self.previous_path = os.path.join(cache_dir, PREVIOUS_OUTPUT_FILENAME)
+        self._next_path = None
+        self._store_path = None
+        self._store_key = None
+        self._tree = None
+        self._blocks = {}
+        self._last = {}
+        self._dirty = False
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            if index.get("version") == OUTPUT_CACHE_VERSION:
+                if index["store"] is not None:
+                    self._store_path = index["store"]
+                    self._store_key = tuple(index["store_key"])
+                self._tree = index["tree"]
+                self._blocks = {path: Block(tuple(e[0]), *e[1:]) for path, e in index["blocks"].items()}
+                self._last = {path: (tuple(e[0]), e[1]) for path, e in index["last"].items()}
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print("Ignoring unreadable output cache index:", e)
+        self._store = None
+        self._run = None  # [old start, old end, new start] of the copy being coalesced
+        self._open_block = None  # recorded block that ends wherever the next tell() is
+        self._new_tree = None
+        self._new_blocks = {}
+        self._new_last = {}
+        self.reused = 0
+
+    @classmethod
+    def open_for(cls, base_path):
+        """Open the cache for a project, or return None if it can't be used."""
+        try:
+            return cls(os.path.join(base_path, OUTPUT_CACHE_DIRNAME))
+        except OSError as e:
+            print("Failed to open output cache:", e)
+            return None
+
+    # ------------------------------------------------------------------
+    # One generation: begin(), lookups / copies / records, commit() or abort()
+    # ------------------------------------------------------------------
+    def begin(self, output_file):
+        """
+        Open the last output for copying and return the path to write the
+        new one to. commit() renames it over output_file.
+        """
+        self._new_tree = None
+        self._new_blocks = {}
+        self._new_last = {}
+        self.reused = 0
+        try:
+            valid = self._store_path is not None and stat_key(os.stat(self._store_path)) == self._store_key
+        except OSError:
+            valid = False
+        try:
+            if valid:
+                self._store = open(self._store_path, "rb")
+        except OSError as e:
+            print("Not reusing the previous output:", e)
+            valid = False
+        if not valid:
+            self._tree = None
+            self._blocks = {}
+        self._next_path = self._temp_path(output_file)
+        return self._next_path
+
+    def _temp_path(self, output_file):
+        """In the cache directory (out of the project tree) if a rename can reach output_file from there."""
+        try:
+            if os.stat(os.path.dirname(os.path.abspath(output_file))).st_dev == os.stat(self.cache_dir).st_dev:
+                return os.path.join(self.cache_dir, NEXT_OUTPUT_FILENAME)
+        except OSError:
+            pass
+        return output_file + ".tmp"
+
+    def lookup(self, path, st, mode):
+        """The block of path in the previous output if the file and mode are unchanged, else None."""
+        block = self._blocks.get(path)
+        if self._store is None or block is None or block.mode != mode or block.key != stat_key(st):
+            return None
+        return block
+
+    def _copy(self, outfile, start, end):
+        """
+        Queue bytes start:end of the previous output for outfile; returns
+        their new range. Ranges that follow each other in the previous
+        output are copied in one go by tell().
+        """
+        run = self._run
+        if run is None or run[1] != start:
+            new_start = self.tell(outfile)
+            run = self._run = [start, start, new_start]
+        run[1] = end
+        new_start = run[2] + start - run[0]
+        return new_start, new_start + end - start
+
+    def tell(self, outfile):
+        """
+        Copy any queued range, then return outfile's byte position (call
+        before writing to it, and once after the last block). outfile must
+        be write-through, so the position is known without flushing every
+        block to disk.
+        """
+        run, self._run = self._run, None
+        if run is not None:
+            self._store.seek(run[0])
+            remaining = run[1] - run[0]
+            while remaining > 0:
+                data = self._store.read(min(remaining, COPY_CHUNK_BYTES))
+                if not data:
+                    raise OSError("previous output is shorter than its cache index")
+                outfile.buffer.write(data)
+                remaining -= len(data)
+        pos = outfile.buffer.tell()
+        if self._open_block is not None:
+            path, self._open_block = self._open_block, None
+            self._new_blocks[path] = self._new_blocks[path]._replace(end=pos)
+        return pos
+
+    def copy_block(self, outfile, path, block):
+        start, end = self._copy(outfile, block.start, block.end)
+        self._new_blocks[path] = block._replace(start=start, end=end)
+        self._new_last[path] = (block.key, block.digest)
+        self.reused += 1
+
+    def record(self, path, st, mode, digest, start, tokens=None, tokens_after=None, ref=None):
+        """A block just written to outfile from start up to the next tell()."""
+        key = stat_key(st)
+        self._new_blocks[path] = Block(key, mode, digest, tokens, tokens_after, ref, start, None)
+        self._new_last[path] = (key, digest)
+        self._open_block = path
+
+    def copy_tree(self, outfile, key):
+        """Copy the directory tree if it was rendered under key; returns whether it was."""
+        if self._store is None or self._tree is None or self._tree[0] != key:
+            return False
+        start, end = self._copy(outfile, self._tree[1], self._tree[2])
+        self.tell(outfile)
+        self._new_tree = [key, start, end]
+        return True
+
+    def record_tree(self, key, start, end):
+        self._new_tree = [key, start, end]
+
+    def changes(self, paths):
+        """
+        (changed, removed) since the last generation: the paths whose content
+        differs (new files included), and last generation's paths that are no
+        longer selected. Files whose stat is unchanged aren't reopened.
+        """
+        changed = []
+        for path in paths:
+            try:
+                key = stat_key(os.stat(path))
+            except OSError:
+                changed.append(path)
+                continue
+            last = self._last.get(path)
+            if last is not None and last[0] == key:
+                self._new_last[path] = last
+                continue
+            try:
+                digest = file_digest(path)
+            except OSError:
+                digest = None
+            if last is None or last[1] is None or last[1] != digest:
+                changed.append(path)
+            self._new_last[path] = (key, digest)
+        selected = set(paths)
+        removed = [path for path in self._last if path not in selected]
+        return changed, removed
+
+    def _end(self):
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+        self._run = None
+        self._open_block = None
+
+    def commit(self, output_file, full=True):
+        """
+        Finish a generation: move the new output over output_file. A full
+        output becomes the new block store; a changes-only output just moves
+        the "last generation" state forward.
+        """
+        self._end()
+        next_path = self._next_path
+        if full:
+            os.replace(next_path, output_file)
+            old_store = self._store_path
+            try:
+                self._store_key = stat_key(os.stat(output_file))
+                self._store_path = output_file
+                self._tree = self._new_tree
+                self._blocks = self._new_blocks
+            except OSError:
+                self._store_path = None
+                self._tree = None
+                self._blocks = {}
+            if old_store == self.previous_path:
+                try:
+                    os.remove(self.previous_path)
+                except OSError:
+                    pass
+        else:
+            if self._store_path is not None and os.path.abspath(self._store_path) == os.path.abspath(output_file):
+                # Keep the full output as the store. A rename keeps size,
+                # mtime and inode, so the stored key stays valid
+                os.replace(output_file, self.previous_path)
+                try:
+                    os.replace(next_path, output_file)
+                except OSError:
+                    os.replace(self.previous_path, output_file)
+                    raise
+                self._store_path = self.previous_path
+            else:
+                os.replace(next_path, output_file)
+        self._next_path = None
+        self._last = self._new_last
+        self._new_tree = None
+        self._new_blocks = {}
+        self._new_last = {}
+        self._dirty = True
+
+    def abort(self):
+        """Drop a failed generation; output_file and the cache stay as they were."""
+        self._end()
+        self._new_tree = None
+        self._new_blocks = {}
+        self._new_last = {}
+        next_path, self._next_path = self._next_path, None
+        if next_path is not None:
+            try:
+                os.remove(next_path)
+            except OSError:
+                pass
+
+    def flush(self):
+        if not self._dirty:
+            return
+        index = {
+            "version": OUTPUT_CACHE_VERSION,
+            "store": self._store_path,
+            "store_key": self._store_key,
+            "tree": self._tree,
+            "blocks": {path: [list(b.key), *b[1:]] for path, b in self._blocks.items()},
+            "last": {path: [list(key), digest] for path, (key, digest) in self._last.items()},
+        }
+        tmp = self.index_path + ".tmp"
+        try:
+            # dumps() runs in C; dump() encodes piece by piece in Python
+            text = json.dumps(index, separators=(",", ":"))
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp, self.index_path)
+            self._dirty = False
+        except OSError as e:
+            print("Failed to write output cache:", e)
+
+    def close(self):
+        if self._next_path is not None:
+            self.abort()
+        self.flush()
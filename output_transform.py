@@ -0,0 +1,378 @@
+"""
+Optional transform stage between reading a selected file and writing it out.
+
+OutputTransformer hashes each file's content. A file whose content was
+already written is emitted as a one-line reference to the first copy, and
+with minify enabled, comments and redundant whitespace are stripped for
+known languages. Transformed content and its token counts are cached by
+content hash in ai_context.transform.db, so unchanged files are only
+minified once. Per-write totals (duplicates, minified files, tokens saved)
+are kept on the transformer.
+"""
+import os
+import re
+import json
+import sqlite3
+import hashlib
+import threading
+import tokenize
+from bisect import bisect_right
+from itertools import accumulate
+
+from token_counter import HEURISTIC
+
+TRANSFORM_CACHE_FILENAME = "ai_context.transform.db"
+# Bump when a minifier changes so cached output is regenerated
+MINIFY_VERSION = "4"
+# Files larger than this are streamed verbatim (no hashing, no minifying)
+TRANSFORM_MAX_BYTES = 8 * 1024 * 1024
+# Least recently used cache entries beyond this are dropped on close
+TRANSFORM_CACHE_MAX_ENTRIES = 20000
+
+# --------------------------------------------------------------------------
+# Minifiers
+# --------------------------------------------------------------------------
+_C_LIKE = re.compile(
+    r'''("(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*'|`(?:\\.|[^`\\])*`)|(//[^\n]*|/\*.*?\*/)''',
+    re.DOTALL,
+)
+_BLOCK_ONLY = re.compile(r'''("(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')|(/\*.*?\*/)''', re.DOTALL)
+_HTML_COMMENT = re.compile(r"<!--.*?-->", re.DOTALL)
+_BLANK_RUNS = re.compile(r"\n{3,}")
+
+
+def _strip_code_comments(text, pattern):
+    """Drop comment matches (group 2) while leaving string literals (group 1) alone."""
+    def repl(m):
+        if m.group(1) is not None:
+            return m.group(1)
+        # Keep line structure of block comments so nothing gets joined
+        return "\n" * m.group(2).count("\n")
+    return pattern.sub(repl, text)
+
+
+def _drop_blank_lines(text, keep=frozenset()):
+    """
+    Strip trailing whitespace and drop blank lines, except on the rows in
+    keep (lines that end inside a string, whose whitespace is part of the value).
+    """
+    return "\n".join(
+        line if i in keep else line.rstrip()
+        for i, line in enumerate(text.splitlines())
+        if i in keep or line.strip()
+    )
+
+
+def _string_rows(text, pattern):
+    """Rows of text whose line break is inside a string literal (pattern's group 1)."""
+    ends = list(accumulate(len(line) for line in text.splitlines(True)))
+    rows = set()
+    for m in pattern.finditer(text):
+        literal = m.group(1)
+        if literal is not None and "\n" in literal:
+            rows.update(range(bisect_right(ends, m.start(1)), bisect_right(ends, m.end(1) - 1)))
+    return rows
+
+
+def _minify_python(text):
+    r"""
+    Comments go via the tokenizer, so "#" inside strings is left alone. A
+    shebang on the first line stays: it decides how the script runs.
+
+    >>> minify('a = 1  # set a\nb = 2\nif a:  # check\n    pass\n', 'python')
+    'a = 1\nb = 2\nif a:\n    pass'
+    >>> minify('#!/usr/bin/env python3\n# tool\nmain()\n', 'python')
+    '#!/usr/bin/env python3\nmain()'
+    >>> print(minify("s = '''a\n\n  b'''\n\n\nt = 1\n", 'python'))
+    s = '''a
+    <BLANKLINE>
+      b'''
+    t = 1
+    """
+    lines = text.splitlines(True)
+    cuts = {}
+    keep = set()
+    try:
+        for tok in tokenize.generate_tokens(iter(lines).__next__):
+            if tok.type == tokenize.COMMENT:
+                row, col = tok.start
+                if row == 1 and tok.string.startswith("#!"):
+                    continue
+                cuts[row - 1] = col
+            elif tok.end[0] > tok.start[0]:
+                # A multi-line string: its blank lines and whitespace are part of the value
+                keep.update(range(tok.start[0] - 1, tok.end[0] - 1))
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        # Can't tell strings from code: only collapse runs of blank lines
+        return _minify_text(text)
+    for row, col in cuts.items():
+        # Keep the line ending, or the next line would be joined onto this one
+        body = lines[row].splitlines()[0]
+        lines[row] = body[:col].rstrip() + lines[row][len(body):]
+    return _drop_blank_lines("".join(lines), keep)
+
+
+def _minify_c_like(text):
+    r"""
+    Comments go, string and template literals (blank lines included) stay.
+
+    >>> minify('const t = `a\n\n  b`;  // note\n\n\nf();\n', 'c-like')
+    'const t = `a\n\n  b`;\nf();'
+    """
+    text = _strip_code_comments(text, _C_LIKE)
+    return _drop_blank_lines(text, _string_rows(text, _C_LIKE))
+
+
+def _minify_css(text):
+    # `//` is not a comment in CSS (and appears in url(...))
+    return _drop_blank_lines(_strip_code_comments(text, _BLOCK_ONLY))
+
+
+def _line_comment_minifier(marker):
+    """Only whole-line comments are dropped: the marker may appear inside strings."""
+    def minify(text):
+        kept = []
+        for i, line in enumerate(text.splitlines()):
+            stripped = line.strip()
+            if not stripped:
+                continue
+            if stripped.startswith(marker) and not (i == 0 and stripped.startswith("#!")):
+                continue
+            kept.append(line.rstrip())
+        return "\n".join(kept)
+    return minify
+
+
+def _minify_markup(text):
+    return _drop_blank_lines(_HTML_COMMENT.sub("", text))
+
+
+def _minify_json(text):
+    try:
+        return json.dumps(json.loads(text), ensure_ascii=False, separators=(",", ":"))
+    except ValueError:
+        return _drop_blank_lines(text)
+
+
+def _minify_text(text):
+    """Unknown languages: trailing whitespace and runs of blank lines only."""
+    return _BLANK_RUNS.sub("\n\n", "\n".join(line.rstrip() for line in text.splitlines()))
+
+
+MINIFIERS = {
+    "python": _minify_python,
+    "c-like": _minify_c_like,
+    "css": _minify_css,
+    "hash": _line_comment_minifier("#"),
+    "sql": _line_comment_minifier("--"),
+    "markup": _minify_markup,
+    "json": _minify_json,
+    "text": _minify_text,
+}
+
+_EXTENSION_LANGUAGES = {
+    ".py": "python", ".pyi": "python",
+    ".css": "css", ".scss": "css", ".less": "css",
+    ".sh": "hash", ".bash": "hash", ".zsh": "hash", ".rb": "hash", ".pl": "hash",
+    ".yml": "hash", ".yaml": "hash", ".toml": "hash", ".cfg": "hash", ".ini": "hash",
+    ".sql": "sql",
+    ".html": "markup", ".htm": "markup", ".xml": "markup", ".svg": "markup", ".vue": "markup",
+    ".json": "json",
+}
+for _ext in (".js", ".jsx", ".mjs", ".cjs", ".ts", ".tsx", ".c", ".h", ".cc", ".cpp", ".hpp",
+             ".java", ".kt", ".go", ".rs", ".cs", ".swift", ".dart", ".php", ".scala"):
+    _EXTENSION_LANGUAGES[_ext] = "c-like"
+_NAME_LANGUAGES = {"Dockerfile": "hash", "Makefile": "hash", ".gitignore": "hash", ".env": "hash"}
+
+
+def language_for(path):
+    name = os.path.basename(path)
+    if name in _NAME_LANGUAGES:
+        return _NAME_LANGUAGES[name]
+    return _EXTENSION_LANGUAGES.get(os.path.splitext(name)[1].lower(), "text")
+
+
+def minify(text, language):
+    return MINIFIERS[language](text)
+
+# --------------------------------------------------------------------------
+# Cache
+# --------------------------------------------------------------------------
+class TransformCache:
+    """
+    sqlite cache of (content hash, language) -> transformed content and token
+    counts. content is NULL when the transform left the text unchanged.
+    Shared by the output prefetch threads, so access is serialized.
+    """
+
+    def __init__(self, db_path, estimator_id):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS blocks ("
+            " digest TEXT NOT NULL,"
+            " language TEXT NOT NULL,"
+            " content TEXT,"
+            " tokens INTEGER NOT NULL,"
+            " tokens_after INTEGER NOT NULL,"
+            " last_used INTEGER NOT NULL,"
+            " PRIMARY KEY (digest, language))"
+        )
+        meta = dict(self.conn.execute("SELECT key, value FROM meta"))
+        if meta.get("minify") != MINIFY_VERSION or meta.get("estimator") != estimator_id:
+            self.conn.execute("DELETE FROM blocks")
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                [("minify", MINIFY_VERSION), ("estimator", estimator_id)],
+            )
+            self.conn.commit()
+        row = self.conn.execute("SELECT COALESCE(MAX(last_used), 0) FROM blocks").fetchone()
+        self.generation = row[0] + 1
+
+    @classmethod
+    def open_for(cls, base_path, estimator_id):
+        """Open the cache for a project, or return None if it can't be used."""
+        try:
+            return cls(os.path.join(base_path, TRANSFORM_CACHE_FILENAME), estimator_id)
+        except sqlite3.Error as e:
+            print("Failed to open transform cache:", e)
+            return None
+
+    def lookup(self, digest, language):
+        """(content or None if unchanged, tokens, tokens_after), or None on a miss."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT content, tokens, tokens_after FROM blocks WHERE digest = ? AND language = ?",
+                (digest, language),
+            ).fetchone()
+            if row is not None:
+                self.conn.execute(
+                    "UPDATE blocks SET last_used = ? WHERE digest = ? AND language = ?",
+                    (self.generation, digest, language),
+                )
+        return row
+
+    def store(self, digest, language, content, tokens, tokens_after):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO blocks (digest, language, content, tokens, tokens_after, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (digest, language, content, tokens, tokens_after, self.generation),
+            )
+
+    def close(self):
+        try:
+            with self._lock, self.conn:
+                self.conn.execute(
+                    "DELETE FROM blocks WHERE rowid IN ("
+                    " SELECT rowid FROM blocks ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (TRANSFORM_CACHE_MAX_ENTRIES,),
+                )
+        except sqlite3.Error as e:
+            print("Failed to write transform cache:", e)
+        self.conn.close()
+
+# --------------------------------------------------------------------------
+# Transformer
+# --------------------------------------------------------------------------
+def content_digest(text):
+    return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).hexdigest()
+
+
+def _reference_block(relative_path, first):
+    return f"File: {relative_path}\n(identical to {first})\n\n"
+
+
+class OutputTransformer:
+    def __init__(self, dedupe=True, minify=True, tokenizer=None, cache=None):
+        self.dedupe = dedupe
+        self.minify = minify
+        self.tokenizer = tokenizer or HEURISTIC
+        self.cache = cache
+        self._first_seen = {}  # digest -> relative path of the first copy written
+        self.duplicates = 0
+        self.minified = 0
+        self.tokens_saved = 0
+
+    @classmethod
+    def open_for(cls, base_path, dedupe=True, minify=True, tokenizer=None):
+        tokenizer = tokenizer or HEURISTIC
+        return cls(dedupe, minify, tokenizer, TransformCache.open_for(base_path, tokenizer.name))
+
+    def close(self):
+        if self.cache is not None:
+            self.cache.close()
+            self.cache = None
+
+    def prepare(self, full_path):
+        """
+        Read and transform one file (safe to call from worker threads).
+        Returns {"digest", "text", "tokens", "tokens_after"}, or None for files
+        too large to transform, which are then streamed as they are.
+        """
+        if os.path.getsize(full_path) > TRANSFORM_MAX_BYTES:
+            return None
+        with open(full_path, 'r', encoding='utf-8', errors='ignore') as ff:
+            text = ff.read()
+        digest = content_digest(text)
+        language = language_for(full_path) if self.minify else ""
+
+        cached = self.cache.lookup(digest, language) if self.cache is not None else None
+        if cached is not None:
+            content, tokens, tokens_after = cached
+            return {"digest": digest, "text": text if content is None else content,
+                    "tokens": tokens, "tokens_after": tokens_after}
+
+        content = minify(text, language) if language else text
+        if content == text:
+            tokens = tokens_after = self.tokenizer.count(text)
+        else:
+            tokens, tokens_after = self.tokenizer.count_batch([text, content])
+        if self.cache is not None:
+            self.cache.store(digest, language, None if content == text else content, tokens, tokens_after)
+        return {"digest": digest, "text": content, "tokens": tokens, "tokens_after": tokens_after}
+
+    def reference(self, relative_path, prepared):
+        """
+        Relative path of the earlier copy a prepared file should refer to, or
+        None if it is new or the reference would cost as many tokens as the
+        (minified) content it replaces.
+        """
+        first = self._first_seen.get(prepared["digest"]) if self.dedupe else None
+        if first is None:
+            return None
+        if self.tokenizer.count(_reference_block(relative_path, first)) >= prepared["tokens_after"]:
+            return None
+        return first
+
+    def record(self, relative_path, prepared, first=None):
+        """
+        Update the dedupe state and totals for one block in output order:
+        a reference to first, or the file's own content if first is None.
+        """
+        if first is not None:
+            self.duplicates += 1
+            self.tokens_saved += prepared["tokens"] - self.tokenizer.count(_reference_block(relative_path, first))
+            return
+        self._first_seen.setdefault(prepared["digest"], relative_path)
+        if prepared["tokens_after"] != prepared["tokens"]:
+            self.minified += 1
+            self.tokens_saved += prepared["tokens"] - prepared["tokens_after"]
+
+    def render(self, relative_path, prepared):
+        """
+        The block to write for a prepared file, in output order: a reference
+        if the same content was already written, else the fenced content.
+        """
+        first = self.reference(relative_path, prepared)
+        self.record(relative_path, prepared, first)
+        if first is not None:
+            return _reference_block(relative_path, first)
+        return f"File: {relative_path}\n```\n{prepared['text']}\n```\n\n"
+
+    def stats(self):
+        return {"duplicates": self.duplicates, "minified": self.minified, "tokens_saved": self.tokens_saved}
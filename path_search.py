@@ -0,0 +1,115 @@
+"""
+Instant path search over the project's file index.
+
+PathSearch keeps every indexed path (relative, "/"-separated, directories
+with a trailing "/") as one lowercase string, one path per line, shortest
+paths first, plus a second string holding just the file names in the same
+line order. A query is split on whitespace and every term must appear in
+the path. The longest term is located with str.find, which runs in C,
+first in the names (those matches rank first), then in the full paths.
+The other terms are checked on the lines it hits. Because lines are
+already in rank order, a search stops as soon as it has `limit` results,
+so even one-letter queries answer in milliseconds. If nothing matches,
+the query falls back to a fuzzy subsequence match ("cfgldr" finds
+"config/loader.py") with one backtracking-free regex.
+
+The search is rebuilt from the fs_index.FsIndex whenever the index changes.
+"""
+import os
+import re
+from array import array
+from bisect import bisect_right
+
+# Matches revealed in the tree (the count and bulk actions cover all of them)
+SEARCH_REVEAL_LIMIT = 200
+
+
+class PathSearch:
+    def __init__(self, base_path, entries):
+        """entries: (relative path with "/" separators, is_dir) pairs."""
+        self.base_path = base_path
+        self.paths = sorted((rel + "/" if is_dir else rel for rel, is_dir in entries), key=lambda p: (len(p), p))
+        self.blob = "\n".join(self.paths).lower() + "\n"
+        self.names = "\n".join(p.rstrip("/").rsplit("/", 1)[-1] for p in self.paths).lower() + "\n"
+        self.starts = self._line_starts(self.blob)
+        self.name_starts = self._line_starts(self.names)
+
+    @staticmethod
+    def _line_starts(blob):
+        starts = array("l", [0])
+        pos = blob.find("\n")
+        while pos != -1:
+            starts.append(pos + 1)
+            pos = blob.find("\n", pos + 1)
+        return starts
+
+    @classmethod
+    def from_index(cls, index):
+        prefix_len = len(index.base_path) + 1
+        entries = [(path[prefix_len:].replace(os.sep, "/"), True) for path in index.iter_dirs()[1:]]
+        entries.extend((path[prefix_len:].replace(os.sep, "/"), False) for path, _ in index.iter_files())
+        return cls(index.base_path, entries)
+
+    def __len__(self):
+        return len(self.paths)
+
+    @staticmethod
+    def _iter_lines(blob, starts, term):
+        """Line numbers whose text contains term, in order."""
+        pos = blob.find(term)
+        while pos != -1:
+            i = bisect_right(starts, pos) - 1
+            yield i
+            # One hit per line: resume at the next line
+            pos = blob.find(term, starts[i + 1])
+
+    def _line(self, i):
+        return self.blob[self.starts[i]:self.starts[i + 1] - 1]
+
+    def _iter_matches(self, terms):
+        """Matching line numbers in rank order (file-name hits first)."""
+        first, rest = terms[0], terms[1:]
+        in_name = set()
+        names, name_starts = self.names, self.name_starts
+        for i in self._iter_lines(names, name_starts, first):
+            name = names[name_starts[i]:name_starts[i + 1] - 1]
+            if all(t in name for t in rest):
+                in_name.add(i)
+                yield i
+        for i in self._iter_lines(self.blob, self.starts, first):
+            if i not in in_name and (not rest or all(t in self._line(i) for t in rest)):
+                yield i
+
+    def _iter_fuzzy(self, terms):
+        # [^c\n]*c finds the next c without backtracking
+        chars = "".join(terms)
+        if not all(c in self.blob for c in set(chars)):
+            return
+        pattern = "(?m)^" + "".join(f"[^{re.escape(c)}\n]*{re.escape(c)}" for c in chars)
+        starts = self.starts
+        for m in re.finditer(pattern, self.blob):
+            yield bisect_right(starts, m.start()) - 1
+
+    def search(self, query, limit=None):
+        """
+        (paths, complete): up to `limit` matches (all if None) as full paths,
+        best first, and whether that is every match.
+        """
+        terms = query.lower().split()
+        if not terms:
+            return [], True
+        terms.sort(key=len, reverse=True)
+        lines = []
+        complete = True
+        for source in (self._iter_matches, self._iter_fuzzy):
+            for i in source(terms):
+                if limit is not None and len(lines) >= limit:
+                    complete = False
+                    break
+                lines.append(i)
+            if lines:
+                break
+        return [self.full_path(self.paths[i]) for i in lines], complete
+
+    def full_path(self, rel):
+        return os.path.join(self.base_path, *rel.rstrip("/").split("/"))
@@ -0,0 +1,94 @@
+"""
+Coalesced, dirty-tracked repainting of Treeview rows.
+
+State changes only mark rows dirty: mark() for single rows (a token count,
+a skipped file), mark_subtree() for everything loaded under a row (a rule
+change on a directory). The first mark in an event-loop tick schedules one
+flush (through after_idle), so a burst of changes costs one repaint.
+
+flush() recomputes each dirty row's (tags, values) with the row_state
+callback and compares it with what was last rendered. Only rows that
+actually changed cost a Tk call, and that is a single item() call setting
+tags and all values at once. Subtree walks don't descend into collapsed
+rows: nothing under them is visible, and the GUI marks a subtree dirty
+again when it is expanded. Which rows are expanded is tracked here (the GUI
+reports opened() / closed()), so a walk costs one get_children() call per
+expanded row and none per leaf.
+"""
+
+
+class RowRefresher:
+    def __init__(self, tree, row_state, schedule):
+        """
+        tree: the ttk.Treeview. row_state(item_id) -> (tags, values) for a
+        row, or None for rows it doesn't manage. schedule(callback) runs
+        callback once the event loop is idle (widget.after_idle).
+        """
+        self.tree = tree
+        self.row_state = row_state
+        self.schedule = schedule
+        self.rendered = {}          # item_id -> (tags, values) last written to Tk
+        self.open = {""}            # expanded rows ("" is the invisible root)
+        self.dirty = set()
+        self.dirty_subtrees = set()
+        self.scheduled = False
+
+    def rendered_as(self, item_id, state):
+        """Record the state a row was inserted with."""
+        self.rendered[item_id] = state
+
+    def opened(self, item_id):
+        self.open.add(item_id)
+
+    def closed(self, item_id):
+        self.open.discard(item_id)
+
+    def forget(self, item_id):
+        """A row was deleted: drop everything known about it."""
+        self.rendered.pop(item_id, None)
+        self.open.discard(item_id)
+        self.dirty.discard(item_id)
+        self.dirty_subtrees.discard(item_id)
+
+    def mark(self, item_id):
+        self.dirty.add(item_id)
+        self._schedule()
+
+    def mark_subtree(self, item_id):
+        self.dirty_subtrees.add(item_id)
+        self._schedule()
+
+    def _schedule(self):
+        if not self.scheduled:
+            self.scheduled = True
+            self.schedule(self.flush)
+
+    def _visible_subtree(self, item_id, out):
+        stack = [item_id]
+        is_open = self.open
+        while stack:
+            iid = stack.pop()
+            out.add(iid)
+            if iid in is_open:
+                stack.extend(self.tree.get_children(iid))
+
+    def flush(self):
+        """Repaint the dirty rows whose state changed. Returns how many were written."""
+        self.scheduled = False
+        items = self.dirty
+        self.dirty = set()
+        subtrees, self.dirty_subtrees = self.dirty_subtrees, set()
+        for item_id in subtrees:
+            self._visible_subtree(item_id, items)
+
+        written = 0
+        rendered = self.rendered
+        for item_id in items:
+            state = self.row_state(item_id)
+            if state is None or rendered.get(item_id) == state:
+                continue
+            tags, values = state
+            self.tree.item(item_id, tags=tags, values=values)
+            rendered[item_id] = state
+            written += 1
+        return written
@@ -0,0 +1,219 @@
+"""
+Rule-based selection state for the file tree.
+
+Instead of one flag per path, the model keeps a trie of path components where
+a node may carry a rule (INCLUDE, EXCLUDE or NEUTRAL). A path's state is the
+rule of its nearest ancestor-or-self that has one, so toggling a directory
+is a single rule write that drops any overrides beneath it, no matter how
+many files the directory holds. Binary and large files are only written
+when forced, which is tracked as a separate set of paths.
+"""
+import os
+
+from fs_index import DIR, FILE, dir_lister
+
+INCLUDE = "include"
+EXCLUDE = "exclude"
+NEUTRAL = "neutral"
+
+
+def split_path(path):
+    return os.path.normpath(path).split(os.sep)
+
+
+def join_parts(parts):
+    return os.sep.join(parts) or os.sep
+
+
+class _Node:
+    __slots__ = ("children", "rule")
+
+    def __init__(self):
+        self.children = {}
+        self.rule = None
+
+
+class SelectionModel:
+    def __init__(self):
+        self.root = _Node()
+        self.root.rule = NEUTRAL
+        self.forced = set()
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+    def effective_rule(self, path):
+        node = self.root
+        rule = node.rule
+        for part in split_path(path):
+            node = node.children.get(part)
+            if node is None:
+                break
+            if node.rule is not None:
+                rule = node.rule
+        return rule
+
+    def is_selected(self, path):
+        return self.effective_rule(path) == INCLUDE
+
+    def is_excluded(self, path):
+        return self.effective_rule(path) == EXCLUDE
+
+    def iter_rules(self):
+        """Yield (path, rule) for every node that carries its own rule."""
+        stack = [(self.root, [])]
+        while stack:
+            node, parts = stack.pop()
+            if node.rule is not None and parts:
+                yield join_parts(parts), node.rule
+            for name, child in node.children.items():
+                stack.append((child, parts + [name]))
+
+    def excluded_paths(self):
+        return {p for p, rule in self.iter_rules() if rule == EXCLUDE}
+
+    def is_forced(self, path):
+        return os.path.normpath(path) in self.forced
+
+    # ------------------------------------------------------------------
+    # Updates
+    # ------------------------------------------------------------------
+    def set_rule(self, path, rule):
+        """
+        Give path (and, by inheritance, everything below it) the given rule.
+        Overrides beneath path are dropped, and a rule equal to the inherited
+        one is not stored at all.
+        """
+        node = self.root
+        inherited = node.rule
+        trail = []
+        for part in split_path(path):
+            if node.rule is not None:
+                inherited = node.rule
+            trail.append((node, part))
+            node = node.children.setdefault(part, _Node())
+        node.children = {}
+        node.rule = None if rule == inherited else rule
+        # Prune nodes that no longer carry a rule or children
+        for parent, part in reversed(trail):
+            child = parent.children[part]
+            if child.rule is not None or child.children:
+                break
+            del parent.children[part]
+
+    def set_forced(self, path, forced):
+        """Force a binary / large file into the output (or stop forcing it)."""
+        if forced:
+            self.forced.add(os.path.normpath(path))
+        else:
+            self.forced.discard(os.path.normpath(path))
+
+    def _set_raw(self, path, rule):
+        node = self.root
+        for part in split_path(path):
+            node = node.children.setdefault(part, _Node())
+        node.rule = rule
+
+    def clear(self):
+        self.root = _Node()
+        self.root.rule = NEUTRAL
+        self.forced = set()
+
+    # ------------------------------------------------------------------
+    # Resolving selected files
+    # ------------------------------------------------------------------
+    def node_for(self, path):
+        node = self.root
+        for part in split_path(path):
+            node = node.children.get(part)
+            if node is None:
+                return None
+        return node
+
+    def iter_selected_files(self, ignore=None, index=None):
+        """
+        Yield every file whose effective rule is INCLUDE. Each INCLUDE rule on
+        a directory is expanded from the fs_index.FsIndex when one is given
+        (scandir otherwise); subtrees carrying their own rule are skipped
+        there and handled by that rule instead, and entries the ignore
+        matcher (ignore_rules.IgnoreMatcher) rejects are pruned.
+        """
+        list_dir = dir_lister(ignore, index)
+        is_dir = index.is_dir if index is not None else os.path.isdir
+        for path, rule in self.iter_rules():
+            if rule != INCLUDE:
+                continue
+            if not is_dir(path):
+                if (index is not None and index.find(path) is not None) or os.path.exists(path):
+                    yield path
+                continue
+            stack = [(path, self.node_for(path))]
+            while stack:
+                dir_path, node = stack.pop()
+                entries = list_dir(dir_path)
+                if entries is None:
+                    continue
+                prefix = os.path.join(dir_path, "")
+                for name, kind in entries:
+                    child = node.children.get(name) if node else None
+                    if child is not None and child.rule is not None:
+                        continue
+                    if kind == DIR:
+                        stack.append((prefix + name, child))
+                    elif kind == FILE:
+                        yield prefix + name
+
+    def selected_files(self, ignore=None, index=None):
+        return sorted(set(self.iter_selected_files(ignore, index)))
+
+    # ------------------------------------------------------------------
+    # ai_context.config round trip
+    # ------------------------------------------------------------------
+    def to_config(self, is_dir=os.path.isdir):
+        config = {'excluded_paths': [], 'selected_files': [], 'selected_dirs': [], 'unselected_paths': []}
+        for path, rule in sorted(self.iter_rules()):
+            if rule == EXCLUDE:
+                config['excluded_paths'].append(path)
+            elif rule == NEUTRAL:
+                config['unselected_paths'].append(path)
+            elif is_dir(path):
+                config['selected_dirs'].append(path)
+            else:
+                config['selected_files'].append(path)
+        config['forced_paths'] = sorted(self.forced)
+        return config
+
+    def load_config(self, config):
+        """
+        Replace the current rules with those from a saved config. Rules are
+        applied as stored (no subtree clearing), with exclusions last so they
+        win over a selection of the same path.
+        """
+        self.clear()
+        for p in config.get('selected_dirs', []):
+            self._set_raw(p, INCLUDE)
+        for p in config.get('selected_files', []):
+            self._set_raw(p, INCLUDE)
+        for p in config.get('unselected_paths', []):
+            self._set_raw(p, NEUTRAL)
+        for p in config.get('excluded_paths', []):
+            self._set_raw(p, EXCLUDE)
+        for p in config.get('forced_paths', []):
+            self.set_forced(p, True)
+        self._compact(self.root, self.root.rule)
+
+    def _compact(self, node, inherited):
+        """Drop rules that repeat the inherited one, and empty nodes."""
+        for name in list(node.children):
+            child = node.children[name]
+            if child.rule == inherited:
+                child.rule = None
+            self._compact(child, child.rule or inherited)
+            if child.rule is None and not child.children:
+                del node.children[name]
+
+    @classmethod
+    def from_config(cls, config):
+        model = cls()
+        model.load_config(config)
+        return model
@@ -0,0 +1,1059 @@
+"""
+Supabase (Postgres) export helpers shared by the GUI and the headless engine.
+
+psycopg2 is imported lazily so that the rest of the tool can run without it.
+"""
+import os
+import csv
+import json
+import codecs
+import time
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from token_counter import HEURISTIC
+from export_cache import ExportCache, cache_key
+
+SUPABASE_CONFIG_FILENAME = "supabase_config.local"
+SUPABASE_JSON_FILENAME = "supabases_tables.json"
+# Tabular (COPY-based) exports; the prompt keeps the SUPABASE_JSON_FILENAME key
+SUPABASE_TABLES_FILENAME = "supabases_tables.md"
+
+# --------------------------------------------------------------------------
+# Supabase config helpers
+# --------------------------------------------------------------------------
+def load_supabase_config(base_path):
+    config_file = os.path.join(base_path, SUPABASE_CONFIG_FILENAME)
+    if os.path.exists(config_file):
+        try:
+            with open(config_file, 'r', encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print("Failed to load supabase_config.local:", e)
+            return {}
+    return {}
+
+def save_supabase_config(base_path, config):
+    config_file = os.path.join(base_path, SUPABASE_CONFIG_FILENAME)
+    try:
+        with open(config_file, 'w', encoding="utf-8") as f:
+            json.dump(config, f, indent=4)
+    except Exception as e:
+        print("Failed to save supabase_config.local:", e)
+
+# --------------------------------------------------------------------------
+# Prompt
+# --------------------------------------------------------------------------
+SUPABASE_PROMPT_PREFIX = (
+    "## Supabase Database Context**\n"
+    "- Don't create SQL migrations in the XML output, only return sql commands for me to run on the supabase sql editor directly.\n"
+    "- If schema updates are needed, provide the SQL commands **before** the XML output.\n\n"
+    "See the relevant tables below:\n---\n"
+)
+SUPABASE_PROMPT_SUFFIX = "\n---"
+PROMPT_CHUNK_CHARS = 256 * 1024
+
+
+class FilePrompt:
+    """A prompt whose body is streamed from a file instead of held in memory."""
+
+    def __init__(self, prefix, path, suffix):
+        self.prefix = prefix
+        self.path = path
+        self.suffix = suffix
+
+    def iter_chunks(self, chunk_size=PROMPT_CHUNK_CHARS):
+        yield self.prefix
+        with open(self.path, 'r', encoding="utf-8") as f:
+            for chunk in iter(lambda: f.read(chunk_size), ""):
+                yield chunk
+        yield self.suffix
+
+
+def build_supabase_prompt(json_str):
+    return SUPABASE_PROMPT_PREFIX + json_str + SUPABASE_PROMPT_SUFFIX
+
+def supabase_file_prompt(json_file):
+    return FilePrompt(SUPABASE_PROMPT_PREFIX, json_file, SUPABASE_PROMPT_SUFFIX)
+
+def load_supabase_prompt(base_path):
+    """Reference the Supabase prompt from the most recent export (JSON or tabular), if any."""
+    newest = None
+    for name in (SUPABASE_JSON_FILENAME, SUPABASE_TABLES_FILENAME):
+        path = os.path.join(base_path, name)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            continue
+        if newest is None or mtime > newest[0]:
+            newest = (mtime, path)
+    return supabase_file_prompt(newest[1]) if newest else None
+
+# --------------------------------------------------------------------------
+# Database access
+# --------------------------------------------------------------------------
+# Rows fetched per round trip from the server-side cursor
+EXPORT_FETCH_SIZE = 2000
+# Cancel can't interrupt a connection attempt: an unreachable host fails after
+# this many seconds instead of the OS TCP timeout
+CONNECT_TIMEOUT_SECONDS = 10
+
+def connect(host, port, database, user, password):
+    import psycopg2
+    return psycopg2.connect(
+        host=host, port=port, database=database, user=user, password=password,
+        connect_timeout=CONNECT_TIMEOUT_SECONDS,
+    )
+
+def connect_from_config(config):
+    return connect(
+        config.get("SUPABASE_HOST"),
+        config.get("SUPABASE_PORT", "5432"),
+        config.get("SUPABASE_DB", "postgres"),
+        config.get("SUPABASE_USER", "postgres"),
+        config.get("SUPABASE_PASSWORD", ""),
+    )
+
+# One round trip for the whole catalog: every table in `public` (or only
+# those in %(tables)s) with its columns, primary key, foreign keys, indexes
+# and constraints, each aggregated to JSON on the server.
+CATALOG_QUERY = """
+    SELECT
+        c.relname AS table_name,
+        COALESCE((
+            SELECT json_agg(json_build_object(
+                'column_name', a.attname,
+                'data_type', format_type(a.atttypid, NULL),
+                'is_nullable', CASE WHEN a.attnotnull THEN 'NO' ELSE 'YES' END,
+                'column_default', pg_get_expr(d.adbin, d.adrelid)
+            ) ORDER BY a.attnum)
+            FROM pg_attribute a
+            LEFT JOIN pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+            WHERE a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+        ), '[]') AS columns,
+        COALESCE((
+            SELECT json_agg(a.attname ORDER BY array_position(i.indkey::int2[], a.attnum))
+            FROM pg_index i
+            JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+            WHERE i.indrelid = c.oid AND i.indisprimary
+        ), '[]') AS primary_key,
+        COALESCE((
+            SELECT json_agg(json_build_object(
+                'name', con.conname,
+                'columns', (
+                    SELECT json_agg(a.attname ORDER BY k.ord)
+                    FROM unnest(con.conkey) WITH ORDINALITY AS k(attnum, ord)
+                    JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum
+                ),
+                'references_table', con.confrelid::regclass::text,
+                'references_columns', (
+                    SELECT json_agg(a.attname ORDER BY k.ord)
+                    FROM unnest(con.confkey) WITH ORDINALITY AS k(attnum, ord)
+                    JOIN pg_attribute a ON a.attrelid = con.confrelid AND a.attnum = k.attnum
+                )
+            ) ORDER BY con.conname)
+            FROM pg_constraint con
+            WHERE con.conrelid = c.oid AND con.contype = 'f'
+        ), '[]') AS foreign_keys,
+        COALESCE((
+            SELECT json_agg(json_build_object(
+                'name', ic.relname,
+                'unique', i.indisunique,
+                'definition', pg_get_indexdef(i.indexrelid)
+            ) ORDER BY ic.relname)
+            FROM pg_index i
+            JOIN pg_class ic ON ic.oid = i.indexrelid
+            WHERE i.indrelid = c.oid
+        ), '[]') AS indexes,
+        COALESCE((
+            SELECT json_agg(json_build_object(
+                'name', con.conname,
+                'definition', pg_get_constraintdef(con.oid)
+            ) ORDER BY con.conname)
+            FROM pg_constraint con
+            WHERE con.conrelid = c.oid AND con.contype IN ('p', 'u', 'c', 'x')
+        ), '[]') AS constraints
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = 'public'
+      AND c.relkind IN ('r', 'p', 'v', 'm', 'f')
+      AND has_table_privilege(c.oid, 'SELECT')
+      AND (%(tables)s::text[] IS NULL OR c.relname = ANY(%(tables)s))
+    ORDER BY c.relname;
+"""
+CATALOG_KEYS = ("primary_key", "foreign_keys", "indexes", "constraints")
+
+def fetch_catalog(conn, tables=None):
+    """
+    {table: {"columns", "primary_key", "foreign_keys", "indexes", "constraints"}}
+    for the given tables (all of `public` if None), in one query.
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute(CATALOG_QUERY, {"tables": list(tables) if tables is not None else None})
+        catalog = {}
+        for table_name, columns, primary_key, foreign_keys, indexes, constraints in cur.fetchall():
+            catalog[table_name] = {
+                "columns": columns,
+                "primary_key": primary_key,
+                "foreign_keys": foreign_keys,
+                "indexes": indexes,
+                "constraints": constraints,
+            }
+        return catalog
+    finally:
+        cur.close()
+
+def table_json_header(entry):
+    """The keys written before "rows" for one table in the export JSON."""
+    header = {"schema": entry["columns"]}
+    for key in CATALOG_KEYS:
+        if entry[key]:
+            header[key] = entry[key]
+    return header
+
+# Cheap per-table change detection for the export cache. The insert/update/
+# delete counters only grow, and relfilenode changes on TRUNCATE, VACUUM
+# FULL and REFRESH MATERIALIZED VIEW; the analyze counter covers profiles
+# built from pg_stats. Views, partitioned parents and foreign tables have no
+# counters of their own and are always re-exported.
+FINGERPRINT_QUERY = """
+    SELECT c.relname, c.relkind, c.relfilenode, s.n_tup_ins, s.n_tup_upd, s.n_tup_del,
+           s.analyze_count + s.autoanalyze_count
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+    WHERE n.nspname = 'public' AND c.relname = ANY(%s);
+"""
+
+def fetch_table_fingerprints(conn, tables):
+    """{table: fingerprint or None} for the given tables, in one query."""
+    cur = conn.cursor()
+    try:
+        cur.execute(FINGERPRINT_QUERY, (list(tables),))
+        fingerprints = dict.fromkeys(tables)
+        for relname, relkind, relfilenode, ins, upd, dele, analyzed in cur.fetchall():
+            if relkind in ("r", "m") and ins is not None:
+                fingerprints[relname] = f"{relfilenode}:{ins}:{upd}:{dele}:{analyzed}"
+        return fingerprints
+    finally:
+        cur.close()
+
+# --------------------------------------------------------------------------
+# Row sampling
+# --------------------------------------------------------------------------
+# A sampling spec is a dict: {"mode": ..., "limit": N, "percent": P, "column": C}
+#   all        every row (the default)
+#   first      first `limit` rows ordered by primary key
+#   system     TABLESAMPLE SYSTEM (percent), optionally capped at `limit`
+#   bernoulli  TABLESAMPLE BERNOULLI (percent), optionally capped at `limit`
+#   recent     newest `limit` rows by `column` (default: a timestamp column)
+#   profile    no row scan: planner statistics per column plus `limit` rows
+SAMPLE_MODES = ("all", "first", "system", "bernoulli", "recent", "profile")
+DEFAULT_SAMPLE = {"mode": "all"}
+RECENT_COLUMN_CANDIDATES = ("updated_at", "modified_at", "created_at", "inserted_at")
+
+def sample_spec_for(sampling, table):
+    """Per-table spec from a {"*": default, table: spec} mapping."""
+    if not sampling:
+        return DEFAULT_SAMPLE
+    return sampling.get(table) or sampling.get("*") or DEFAULT_SAMPLE
+
+def pick_recent_column(schema):
+    names = [c["column_name"] for c in schema]
+    for candidate in RECENT_COLUMN_CANDIDATES:
+        if candidate in names:
+            return candidate
+    for c in schema:
+        if c["data_type"].startswith(("timestamp", "date")):
+            return c["column_name"]
+    return None
+
+def build_rows_query(table, spec, schema=(), primary_key=()):
+    """SELECT for one table according to its sampling spec (psycopg2.sql)."""
+    from psycopg2 import sql
+    mode = spec.get("mode", "all")
+    if mode not in SAMPLE_MODES:
+        raise ValueError(f"Unknown sampling mode for {table}: {mode}")
+    query = sql.SQL("SELECT * FROM {}").format(sql.Identifier("public", table))
+    limit = spec.get("limit")
+
+    if mode in ("system", "bernoulli"):
+        query += sql.SQL(" TABLESAMPLE {} ({})").format(
+            sql.SQL(mode.upper()), sql.Literal(float(spec.get("percent", 10)))
+        )
+    elif mode == "first" and primary_key:
+        query += sql.SQL(" ORDER BY {}").format(sql.SQL(", ").join(sql.Identifier(c) for c in primary_key))
+    elif mode == "recent":
+        column = spec.get("column") or pick_recent_column(schema)
+        if column is None:
+            raise ValueError(f"No timestamp column found for 'recent' sampling of {table}")
+        query += sql.SQL(" ORDER BY {} DESC NULLS LAST").format(sql.Identifier(column))
+
+    if mode == "profile":
+        limit = limit or PROFILE_SAMPLE_ROWS
+    if limit and mode != "all":
+        query += sql.SQL(" LIMIT {}").format(sql.Literal(int(limit)))
+    return query
+
+def describe_sample(table, spec, schema=(), primary_key=()):
+    mode = spec.get("mode", "all")
+    limit = spec.get("limit")
+    if mode == "first":
+        by = ", ".join(primary_key) if primary_key else "table order"
+        return f"first {limit} rows by {by}" if limit else f"all rows ordered by {by}"
+    if mode in ("system", "bernoulli"):
+        text = f"TABLESAMPLE {mode.upper()} ({spec.get('percent', 10)}%)"
+        return f"{text}, at most {limit} rows" if limit else text
+    if mode == "recent":
+        column = spec.get("column") or pick_recent_column(schema)
+        return f"most recent {limit} rows by {column}" if limit else f"all rows, newest first by {column}"
+    if mode == "profile":
+        return f"data profile from planner statistics with up to {limit or PROFILE_SAMPLE_ROWS} example rows"
+    return None
+
+# --------------------------------------------------------------------------
+# Data profiles
+# --------------------------------------------------------------------------
+# "profile" describes a table from the statistics ANALYZE already keeps
+# (pg_class.reltuples and pg_stats) instead of scanning it, so it costs the
+# same for ten rows or a billion.
+PROFILE_SAMPLE_ROWS = 5
+PROFILE_MAX_VALUES = 10
+PROFILE_VALUE_CHARS = 60
+
+PROFILE_QUERY = """
+    SELECT c.relname, c.reltuples::bigint, s.attname, s.inherited, s.null_frac, s.n_distinct,
+           (s.most_common_vals::text)::text[], s.most_common_freqs,
+           (s.histogram_bounds::text)::text[]
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    LEFT JOIN pg_stats s ON s.schemaname = n.nspname AND s.tablename = c.relname
+    WHERE n.nspname = 'public' AND c.relname = ANY(%s)
+    ORDER BY c.relname, s.attname, s.inherited;
+"""
+
+def _short_value(value):
+    if not isinstance(value, str):
+        value = json.dumps(value, default=str)
+    if len(value) > PROFILE_VALUE_CHARS:
+        return value[:PROFILE_VALUE_CHARS - 3] + "..."
+    return value
+
+def _thin(values, limit=PROFILE_MAX_VALUES):
+    """At most `limit` evenly spaced values, always keeping the first and last."""
+    if len(values) <= limit:
+        return values
+    step = (len(values) - 1) / (limit - 1)
+    return [values[round(i * step)] for i in range(limit)]
+
+def fetch_table_profiles(conn, tables):
+    """
+    {table: {"estimated_rows", "columns": {column: stats}}} for the given
+    tables, in one query. Tables that were never analyzed have no column
+    stats and an estimated_rows of None.
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute(PROFILE_QUERY, (list(tables),))
+        profiles = {}
+        for (relname, reltuples, attname, inherited, null_frac, n_distinct,
+             common_vals, common_freqs, histogram) in cur.fetchall():
+            profile = profiles.setdefault(relname, {
+                "estimated_rows": reltuples if reltuples is not None and reltuples >= 0 else None,
+                "columns": {},
+            })
+            if attname is None or attname in profile["columns"]:
+                continue  # prefer the non-inherited row of a partitioned table
+            rows = profile["estimated_rows"] or 0
+            stats = {"null_frac": round(null_frac, 3)}
+            if n_distinct is not None:
+                # Negative n_distinct is a fraction of the row count
+                stats["distinct"] = int(n_distinct if n_distinct >= 0 else round(-n_distinct * rows))
+            if common_vals:
+                stats["most_common"] = [
+                    [_short_value(v), round(f, 3)]
+                    for v, f in list(zip(common_vals, common_freqs or []))[:PROFILE_MAX_VALUES]
+                ]
+            if histogram:
+                stats["histogram"] = [_short_value(v) for v in _thin(histogram)]
+            profile["columns"][attname] = stats
+        return profiles
+    finally:
+        cur.close()
+
+def order_profile(profile, columns):
+    """The profile with its columns in table order."""
+    ordered = {c["column_name"]: profile["columns"][c["column_name"]]
+               for c in columns if c["column_name"] in profile["columns"]}
+    return {"estimated_rows": profile["estimated_rows"], "columns": ordered}
+
+def format_profile_lines(profile):
+    """Compact text form of a profile for the tabular export formats."""
+    rows = profile["estimated_rows"]
+    lines = [f"estimated rows: {rows:,}" if rows is not None else "estimated rows: unknown (not analyzed)"]
+    for name, stats in profile["columns"].items():
+        parts = [f"nulls {stats['null_frac']:.1%}"]
+        if "distinct" in stats:
+            parts.append(f"~{stats['distinct']:,} distinct")
+        if "most_common" in stats:
+            parts.append("most common: " + ", ".join(f"{v} ({f:.0%})" for v, f in stats["most_common"]))
+        if "histogram" in stats:
+            parts.append("distribution: " + " | ".join(stats["histogram"]))
+        lines.append(f"- {name}: " + "; ".join(parts))
+    return lines
+
+def iter_table_rows(conn, query, fetch_size=EXPORT_FETCH_SIZE):
+    """Yield rows as dicts through a named (server-side) cursor."""
+    import psycopg2.extras
+    cur = conn.cursor(name="ai_context_export", cursor_factory=psycopg2.extras.RealDictCursor)
+    try:
+        cur.itersize = fetch_size
+        cur.execute(query)
+        while True:
+            rows = cur.fetchmany(fetch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        cur.close()
+
+# --------------------------------------------------------------------------
+# Cancellation
+# --------------------------------------------------------------------------
+# Rows between progress callbacks
+EXPORT_PROGRESS_ROWS = 500
+
+class ExportCancelled(Exception):
+    pass
+
+class CancelToken:
+    """
+    Shared between the UI and export threads. cancel() makes the export stop
+    at the next row and sends a cancel request for every query in flight on
+    a tracked connection, so a long-running statement stops on the server too.
+    """
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._conns = set()
+        self._children = []
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set():
+            raise ExportCancelled("Export cancelled")
+
+    @contextmanager
+    def track(self, conn):
+        with self._lock:
+            self.check()
+            self._conns.add(conn)
+        try:
+            yield conn
+        finally:
+            with self._lock:
+                self._conns.discard(conn)
+
+    def child(self):
+        """A token that is cancelled with this one, and can also be cancelled on its own."""
+        token = CancelToken()
+        with self._lock:
+            self._children.append(token)
+            cancelled = self._event.is_set()
+        if cancelled:
+            token.cancel()
+        return token
+
+    def cancel(self):
+        with self._lock:
+            self._event.set()
+            conns = list(self._conns)
+            children = list(self._children)
+        for child in children:
+            child.cancel()
+        for conn in conns:
+            try:
+                conn.cancel()
+            except Exception as e:
+                print("Failed to cancel query:", e)
+
+@contextmanager
+def _tracked(cancel, conn):
+    if cancel is None:
+        yield conn
+    else:
+        with cancel.track(conn):
+            yield conn
+
+@contextmanager
+def _replace_on_success(path):
+    """Write to a temporary file that only replaces path once complete."""
+    tmp = path + ".tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            yield f
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+# --------------------------------------------------------------------------
+# Streaming JSON export
+# --------------------------------------------------------------------------
+def _dump_nested(obj, level):
+    """json.dumps(indent=4) for a value nested `level` spaces deep."""
+    return json.dumps(obj, indent=4, default=str).replace("\n", "\n" + " " * level)
+
+def _table_stats(rows, tokens, truncated, started):
+    return {
+        "rows": rows, "tokens": tokens, "truncated": truncated,
+        "seconds": time.perf_counter() - started, "cached": False,
+    }
+
+def _truncation_note(note, rows):
+    note = f"{note}, " if note else ""
+    return note + f"truncated to {rows} rows by the token budget"
+
+def _write_table_json(f, table, header, rows, note, share, tokenizer, progress=None, cancel=None):
+    """
+    Write one `"table": {...}` entry; stop reading rows once share tokens are
+    used. progress(table, rows, done) is called every EXPORT_PROGRESS_ROWS rows
+    and when the table is complete.
+    """
+    started = time.perf_counter()
+    f.write(json.dumps(table) + ": {\n")
+    table_tokens = 0
+    for key, value in header.items():
+        text = _dump_nested(value, 8)
+        f.write(f"        {json.dumps(key)}: {text},\n")
+        table_tokens += tokenizer.count(text)
+    f.write('        "rows": [')
+
+    n = 0
+    truncated = False
+    try:
+        for row in rows:
+            if cancel is not None:
+                cancel.check()
+            row_text = _dump_nested(row, 12)
+            row_tokens = tokenizer.count(row_text)
+            if share is not None and table_tokens + row_tokens > share:
+                truncated = True
+                break
+            f.write(",\n            " if n else "\n            ")
+            f.write(row_text)
+            table_tokens += row_tokens
+            n += 1
+            if progress is not None and n % EXPORT_PROGRESS_ROWS == 0:
+                progress(table, n, False)
+    finally:
+        if hasattr(rows, "close"):
+            rows.close()
+    f.write("\n        ]" if n else "]")
+
+    if truncated:
+        note = _truncation_note(note, n)
+    if note:
+        f.write(',\n        "sample": ' + json.dumps(note))
+    f.write("\n    }")
+    if progress is not None:
+        progress(table, n, True)
+    return _table_stats(n, table_tokens, truncated, started)
+
+# --------------------------------------------------------------------------
+# COPY export with compact tabular rendering
+# --------------------------------------------------------------------------
+# "json" streams RealDictCursor rows through json.dumps; the other formats
+# read `COPY (SELECT ...) TO STDOUT WITH CSV HEADER` and print each table
+# as a short schema summary followed by a header-once table.
+EXPORT_FORMATS = ("json", "csv", "tsv", "markdown")
+
+def export_filename(fmt):
+    return SUPABASE_JSON_FILENAME if fmt == "json" else SUPABASE_TABLES_FILENAME
+
+def _column_text(column):
+    text = f"{column['column_name']} {column['data_type']}"
+    if column.get("is_nullable") == "NO":
+        text += " not null"
+    if column.get("column_default") is not None:
+        text += f" default {column['column_default']}"
+    return text
+
+def format_table_summary(table, entry, profile=None):
+    """Schema summary (and data profile) printed above a table's rows in the tabular formats."""
+    lines = [f"## {table}", "columns: " + ", ".join(_column_text(c) for c in entry["columns"])]
+    if entry["primary_key"]:
+        lines.append("primary key: " + ", ".join(entry["primary_key"]))
+    for fk in entry["foreign_keys"]:
+        lines.append(
+            f"foreign key: ({', '.join(fk['columns'] or [])}) -> "
+            f"{fk['references_table']}({', '.join(fk['references_columns'] or [])})"
+        )
+    for index in entry["indexes"]:
+        lines.append("index: " + index["definition"])
+    for constraint in entry["constraints"]:
+        if not constraint["definition"].startswith("PRIMARY KEY"):
+            lines.append(f"constraint {constraint['name']}: {constraint['definition']}")
+    if profile is not None:
+        lines.extend(format_profile_lines(profile))
+    return "\n".join(lines)
+
+def _tsv_record(fields):
+    return "\t".join(
+        v.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r") for v in fields
+    )
+
+def _markdown_record(fields):
+    return "| " + " | ".join(v.replace("|", "\\|").replace("\r", "").replace("\n", "<br>") for v in fields) + " |"
+
+def render_record(fmt, record, is_header=False):
+    """Output lines for one CSV record; CSV records pass through untouched."""
+    if fmt == "csv":
+        return [record]
+    fields = next(csv.reader([record]), [])
+    if fmt == "tsv":
+        return [_tsv_record(fields)]
+    lines = [_markdown_record(fields)]
+    if is_header:
+        lines.append("|" + " --- |" * len(fields))
+    return lines
+
+class _CopySink:
+    """
+    Write target for copy_expert that splits the CSV stream into records
+    (newlines inside quoted fields stay in their record) and hands each one
+    to emit(). Once emit returns False the rest of the stream is ignored.
+    """
+    def __init__(self, emit):
+        self.emit = emit
+        self.stopped = False
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._pending = ""
+        self._scan = 0
+        self._quotes = 0
+
+    def write(self, data):
+        if self.stopped:
+            return
+        if isinstance(data, bytes):
+            data = self._decoder.decode(data)
+        self._pending += data
+        while True:
+            nl = self._pending.find("\n", self._scan)
+            if nl < 0:
+                self._quotes += self._pending.count('"', self._scan)
+                self._scan = len(self._pending)
+                return
+            self._quotes += self._pending.count('"', self._scan, nl)
+            self._scan = nl + 1
+            if self._quotes % 2:
+                continue  # newline inside a quoted field
+            record = self._pending[:nl].rstrip("\r")
+            self._pending = self._pending[nl + 1:]
+            self._scan = 0
+            self._quotes = 0
+            if not self.emit(record):
+                self.stopped = True
+                return
+
+def _write_table_tabular(f, conn, table, entry, query, note, share, tokenizer, fmt, progress=None, cancel=None,
+                         profile=None):
+    """
+    Write one table in a tabular format by streaming COPY ... TO STDOUT.
+    When the token share is spent (or the export is cancelled) the COPY is
+    cancelled on the server, so the rest of the table is never sent.
+    """
+    from psycopg2 import sql, extensions
+    started = time.perf_counter()
+    summary = format_table_summary(table, entry, profile)
+    f.write(summary)
+    # rows starts at -1: the first record is the CSV header, which is always written
+    state = {"rows": -1, "tokens": tokenizer.count(summary), "truncated": False}
+
+    def emit(record):
+        if cancel is not None and cancel.cancelled:
+            return False
+        is_header = state["rows"] < 0
+        text = "".join("\n" + line for line in render_record(fmt, record, is_header))
+        tokens = tokenizer.count(text)
+        if not is_header and share is not None and state["tokens"] + tokens > share:
+            state["truncated"] = True
+            conn.cancel()
+            return False
+        f.write(text)
+        state["tokens"] += tokens
+        state["rows"] += 1
+        if progress is not None and state["rows"] and state["rows"] % EXPORT_PROGRESS_ROWS == 0:
+            progress(table, state["rows"], False)
+        return True
+
+    sink = _CopySink(emit)
+    cur = conn.cursor()
+    try:
+        cur.copy_expert(sql.SQL("COPY ({}) TO STDOUT WITH CSV HEADER").format(query), sink)
+    except extensions.QueryCanceledError:
+        if not sink.stopped:
+            raise
+        conn.rollback()
+    finally:
+        cur.close()
+    if cancel is not None:
+        cancel.check()
+
+    rows = max(0, state["rows"])
+    if state["truncated"]:
+        note = _truncation_note(note, rows)
+    if note:
+        f.write(f"\n(sample: {note})")
+    if progress is not None:
+        progress(table, rows, True)
+    return _table_stats(rows, state["tokens"], state["truncated"], started)
+
+# --------------------------------------------------------------------------
+# Export driver
+# --------------------------------------------------------------------------
+# (opening, first separator, separator, closing, closing when empty)
+_JSON_LAYOUT = ("{", "\n    ", ",\n    ", "\n}", "}")
+_TABULAR_LAYOUT = ("", "", "\n\n", "\n", "")
+
+def _layout(fmt):
+    return _JSON_LAYOUT if fmt == "json" else _TABULAR_LAYOUT
+
+def _cached_stats(stats):
+    return dict(stats, seconds=0.0, cached=True)
+
+def _write_table_cached(f, table, write, conn, share, cache, key, progress=None):
+    """write(f, conn, share), served from / saved to the export cache when key is set."""
+    if cache is None or key is None:
+        return write(f, conn, share)
+    hit = cache.lookup(table, key)
+    if hit is not None:
+        # write() never ran, so no query has been sent for this table
+        path, stats = hit
+        with open(path, "r", encoding="utf-8") as src:
+            shutil.copyfileobj(src, f)
+        if progress is not None:
+            progress(table, stats["rows"], True)
+        return _cached_stats(stats)
+    fragment = cache.open_fragment(table)
+    try:
+        stats = write(fragment, conn, share)
+        fragment.seek(0)
+        shutil.copyfileobj(fragment, f)
+    except BaseException:
+        cache.discard(fragment)
+        raise
+    cache.store(table, key, fragment, stats)
+    return stats
+
+def _write_document(f, fmt, writers, conn=None, table_count=None, token_budget=None, cache=None, cache_keys=None,
+                    progress=None):
+    """
+    Write every (table, write) pair into f. With a token_budget, each table
+    gets an equal share of what is left, so unused tokens carry over to
+    later tables.
+    """
+    opening, first_sep, sep, closing, empty_closing = _layout(fmt)
+    stats = {}
+    spent = 0
+    f.write(opening)
+    for i, (table, write) in enumerate(writers):
+        f.write(sep if i else first_sep)
+        share = None
+        if token_budget is not None:
+            share = (token_budget - spent) // max(1, (table_count or i + 1) - i)
+        key = None
+        if cache is not None and cache_keys and cache_keys.get(table):
+            key = cache_key(cache_keys[table], share)
+        stats[table] = _write_table_cached(f, table, write, conn, share, cache, key, progress)
+        spent += stats[table]["tokens"]
+    f.write(closing if stats else empty_closing)
+    return stats
+
+def write_export_json(f, tables, table_count=None, token_budget=None, tokenizer=None, progress=None, cancel=None):
+    """
+    Write {table: {"schema": [...], ..., "rows": [...]}} to f incrementally,
+    in the same layout as json.dumps(indent=4). `tables` yields
+    (table, header, rows, note): header is a dict of the keys written before
+    "rows", rows may be any iterable and note (if not None) is recorded as
+    the table's "sample" description.
+
+    With a token_budget, each table gets an equal share of what is left
+    (unused tokens carry over to later tables); once a table's share is
+    spent its rows iterator is closed, which stops reading from Postgres.
+    Returns {table: {"rows", "tokens", "truncated", "seconds", "cached"}}.
+    """
+    tokenizer = tokenizer or HEURISTIC
+
+    def writers():
+        for table, header, rows, note in tables:
+            def write(f, conn, share, table=table, header=header, rows=rows, note=note):
+                return _write_table_json(f, table, header, rows, note, share, tokenizer, progress, cancel)
+            yield table, write
+
+    return _write_document(f, "json", writers(), None, table_count, token_budget, progress=progress)
+
+def _complete_catalog(conn, tables, catalog):
+    """catalog plus entries for any of tables it lacks, fetched in one query."""
+    catalog = dict(catalog or {})
+    missing = [t for t in tables if t not in catalog]
+    if missing:
+        catalog.update(fetch_catalog(conn, missing))
+    unknown = [t for t in tables if t not in catalog]
+    if unknown:
+        raise ValueError(f"Tables not found in the public schema: {', '.join(unknown)}")
+    return catalog
+
+def _database_identity(conn):
+    """(host, port, database) the connection points at, so projects with the same schema don't share entries."""
+    params = conn.get_dsn_parameters()
+    return params.get("host"), params.get("port"), params.get("dbname")
+
+def _table_cache_keys(conn, tables, catalog, sampling, tokenizer, fmt):
+    """Per-table cache key (without the token share); None where a table can't be cached."""
+    database = _database_identity(conn)
+    keys = {}
+    for table, fingerprint in fetch_table_fingerprints(conn, tables).items():
+        if fingerprint is not None:
+            keys[table] = cache_key(
+                database, fingerprint, catalog[table], sample_spec_for(sampling, table), tokenizer.name, fmt
+            )
+    return keys
+
+def _table_plan(table, entry, sampling):
+    """(header, rows query, sample note) for one table."""
+    spec = sample_spec_for(sampling, table)
+    query = build_rows_query(table, spec, entry["columns"], entry["primary_key"])
+    note = describe_sample(table, spec, entry["columns"], entry["primary_key"])
+    return table_json_header(entry), query, note
+
+def _table_writer(table, entry, sampling, fmt, tokenizer, progress=None, cancel=None, profile=None):
+    """write(f, conn, share) for one table in the given format."""
+    header, query, note = _table_plan(table, entry, sampling)
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    if profile is not None:
+        profile = order_profile(profile, entry["columns"])
+        header["profile"] = profile
+
+    def write(f, conn, share):
+        if fmt == "json":
+            rows = iter_table_rows(conn, query)
+            return _write_table_json(f, table, header, rows, note, share, tokenizer, progress, cancel)
+        return _write_table_tabular(
+            f, conn, table, entry, query, note, share, tokenizer, fmt, progress, cancel, profile
+        )
+    return write
+
+def _profile_tables(conn, tables, sampling):
+    """Profiles for the tables exported in "profile" mode, in one query."""
+    wanted = [t for t in tables if sample_spec_for(sampling, t).get("mode") == "profile"]
+    return fetch_table_profiles(conn, wanted) if wanted else {}
+
+def export_tables_to_file(conn, tables, export_file, sampling=None, token_budget=None, tokenizer=None, catalog=None,
+                          cache=None, progress=None, cancel=None, fmt="json"):
+    """
+    Stream the schema and (sampled) rows of each table into export_file
+    without holding any table in memory; returns per-table stats. Catalog
+    entries (e.g. from the listbox's fetch_catalog) are reused, and any that
+    are missing are fetched together in a single query. With an ExportCache,
+    tables whose fingerprint is unchanged are copied from the last export.
+    export_file is only replaced once the export completes; a CancelToken
+    aborts it with ExportCancelled.
+    """
+    tokenizer = tokenizer or HEURISTIC
+    try:
+        with _tracked(cancel, conn):
+            catalog = _complete_catalog(conn, tables, catalog)
+            cache_keys = _table_cache_keys(conn, tables, catalog, sampling, tokenizer, fmt) if cache else None
+            profiles = _profile_tables(conn, tables, sampling)
+            writers = (
+                (table, _table_writer(
+                    table, catalog[table], sampling, fmt, tokenizer, progress, cancel, profiles.get(table)
+                ))
+                for table in tables
+            )
+            with _replace_on_success(export_file) as f:
+                return _write_document(
+                    f, fmt, writers, conn, len(tables), token_budget, cache, cache_keys, progress
+                )
+    finally:
+        # End the read transaction the named cursors ran in
+        conn.rollback()
+        if cache is not None:
+            cache.flush()
+
+# --------------------------------------------------------------------------
+# Parallel export
+# --------------------------------------------------------------------------
+EXPORT_CONCURRENCY = 4
+
+def connect_pool(config, size=EXPORT_CONCURRENCY):
+    """ThreadedConnectionPool of up to `size` connections from the stored credentials."""
+    from psycopg2.pool import ThreadedConnectionPool
+    return ThreadedConnectionPool(
+        1, size,
+        host=config.get("SUPABASE_HOST"),
+        port=config.get("SUPABASE_PORT", "5432"),
+        database=config.get("SUPABASE_DB", "postgres"),
+        user=config.get("SUPABASE_USER", "postgres"),
+        password=config.get("SUPABASE_PASSWORD", ""),
+        connect_timeout=CONNECT_TIMEOUT_SECONDS,
+    )
+
+def export_tables_parallel(pool, tables, export_file, sampling=None, token_budget=None, tokenizer=None,
+                           catalog=None, concurrency=EXPORT_CONCURRENCY, cache=None, progress=None, cancel=None,
+                           fmt="json"):
+    """
+    Like export_tables_to_file, but up to `concurrency` tables are read at
+    once, each on its own pooled connection. Every table is spooled to a
+    temporary file and appended to export_file in table order, so the output
+    is the same as a sequential export. A token budget is split evenly up
+    front (there is no carry-over between tables running at the same time).
+    """
+    tokenizer = tokenizer or HEURISTIC
+    conn = pool.getconn()
+    try:
+        with _tracked(cancel, conn):
+            catalog = _complete_catalog(conn, tables, catalog)
+            cache_keys = _table_cache_keys(conn, tables, catalog, sampling, tokenizer, fmt) if cache else {}
+            profiles = _profile_tables(conn, tables, sampling)
+    finally:
+        conn.rollback()
+        pool.putconn(conn)
+    share = token_budget // max(1, len(tables)) if token_budget is not None else None
+    # Stops the other tables when one fails, without marking the caller's token cancelled
+    workers = cancel.child() if cancel is not None else CancelToken()
+
+    def export_one(table):
+        key = cache_key(cache_keys[table], share) if table in cache_keys else None
+        hit = cache.lookup(table, key) if key else None
+        if hit is not None:
+            path, stats = hit
+            if progress is not None:
+                progress(table, stats["rows"], True)
+            return open(path, "r", encoding="utf-8"), _cached_stats(stats)
+
+        write = _table_writer(table, catalog[table], sampling, fmt, tokenizer, progress, workers, profiles.get(table))
+        fragment = cache.open_fragment(table) if key else tempfile.TemporaryFile("w+", encoding="utf-8")
+        conn = pool.getconn()
+        try:
+            with _tracked(workers, conn):
+                stats = write(fragment, conn, share)
+        except BaseException:
+            if key:
+                cache.discard(fragment)
+            else:
+                fragment.close()
+            raise
+        finally:
+            conn.rollback()
+            pool.putconn(conn)
+        if key:
+            cache.store(table, key, fragment, stats)
+            return open(cache.fragment_path(table), "r", encoding="utf-8"), stats
+        return fragment, stats
+
+    def stop_on_error(future):
+        # Output is written in table order, so a later table's error would only surface after the earlier ones
+        if not future.cancelled() and future.exception() is not None:
+            workers.cancel()
+
+    opening, first_sep, sep, closing, empty_closing = _layout(fmt)
+    stats = {}
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = [executor.submit(export_one, table) for table in tables]
+        for future in futures:
+            future.add_done_callback(stop_on_error)
+        try:
+            with _replace_on_success(export_file) as f:
+                f.write(opening)
+                for i, (table, future) in enumerate(zip(tables, futures)):
+                    fragment, stats[table] = future.result()
+                    with fragment:
+                        fragment.seek(0)
+                        f.write(sep if i else first_sep)
+                        shutil.copyfileobj(fragment, f)
+                f.write(closing if stats else empty_closing)
+        except BaseException as e:
+            workers.cancel()
+            for future in futures:
+                future.cancel()
+            # Close the fragments of tables that finished (or finish while stopping)
+            wait(futures)
+            finished = [future for future in futures if not future.cancelled()]
+            for future in finished:
+                if future.exception() is None:
+                    future.result()[0].close()
+            if isinstance(e, ExportCancelled) and not (cancel is not None and cancel.cancelled):
+                # Stopped because another table failed: report that failure
+                for future in finished:
+                    error = future.exception()
+                    if error is not None and not isinstance(error, ExportCancelled):
+                        raise error from None
+            raise
+        finally:
+            if cache is not None:
+                cache.flush()
+    return stats
+
+def format_export_stats(stats):
+    """One line per table: rows, tokens and time."""
+    lines = []
+    for table, s in stats.items():
+        line = f"{table}: {s['rows']} rows, {s['tokens']} tokens, {s['seconds']:.2f}s"
+        if s["truncated"]:
+            line += " (truncated)"
+        if s.get("cached"):
+            line += " (unchanged, from cache)"
+        lines.append(line)
+    return "\n".join(lines)
+
+def export_to_file(base_path, tables, conn=None, token_budget=None, tokenizer=None, concurrency=None,
+                   use_cache=True, fmt=None):
+    """
+    Export tables using the stored credentials (or conn) and the sampling
+    stored under SUPABASE_SAMPLING in supabase_config.local; returns the
+    prompt and the per-table stats. Without a conn, more than one table is
+    exported over a pool of SUPABASE_EXPORT_CONCURRENCY connections.
+    Unchanged tables are reused from the export cache unless use_cache is False.
+    fmt defaults to SUPABASE_EXPORT_FORMAT (or "json").
+    """
+    config = load_supabase_config(base_path)
+    fmt = fmt or config.get("SUPABASE_EXPORT_FORMAT") or "json"
+    export_file = os.path.join(base_path, export_filename(fmt))
+    sampling = config.get("SUPABASE_SAMPLING")
+    if token_budget is None:
+        token_budget = config.get("SUPABASE_TOKEN_BUDGET")
+    if concurrency is None:
+        concurrency = int(config.get("SUPABASE_EXPORT_CONCURRENCY") or EXPORT_CONCURRENCY)
+    cache = ExportCache.open_for(base_path) if use_cache else None
+
+    if conn is None and concurrency > 1 and len(tables) > 1:
+        pool = connect_pool(config, min(concurrency, len(tables)))
+        try:
+            stats = export_tables_parallel(pool, tables, export_file, sampling, token_budget, tokenizer,
+                                           concurrency=concurrency, cache=cache, fmt=fmt)
+        finally:
+            pool.closeall()
+        return supabase_file_prompt(export_file), stats
+
+    own_conn = conn is None
+    if own_conn:
+        conn = connect_from_config(config)
+    try:
+        stats = export_tables_to_file(conn, tables, export_file, sampling, token_budget, tokenizer, cache=cache, fmt=fmt)
+    finally:
+        if own_conn:
+            conn.close()
+    return supabase_file_prompt(export_file), stats
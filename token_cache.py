@@ -0,0 +1,133 @@
+"""
+Persistent token-count cache stored next to ai_context.config.
+
+Each entry is keyed by path and validated against the file's size, mtime_ns
+and inode, so unchanged files never have to be reopened on startup (files
+sniffed as binary are stored as BINARY_TOKENS). Entries for files that no
+longer exist are pruned after every full scan, and the whole cache is
+dropped when the token estimator changes.
+"""
+import os
+import sqlite3
+
+TOKEN_CACHE_FILENAME = "ai_context.tokens.db"
+CACHE_SCHEMA_VERSION = "2"
+# Stored instead of a count for files sniffed as binary
+BINARY_TOKENS = -1
+
+
+def stat_key(st):
+    return (st.st_size, st.st_mtime_ns, st.st_ino)
+
+
+class TokenCache:
+    def __init__(self, db_path, estimator_id, load=True):
+        self.db_path = db_path
+        self.estimator_id = estimator_id
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS tokens ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " inode INTEGER NOT NULL,"
+            " tokens INTEGER NOT NULL)"
+        )
+        meta = dict(self.conn.execute("SELECT key, value FROM meta"))
+        if meta.get("schema") != CACHE_SCHEMA_VERSION or meta.get("estimator") != estimator_id:
+            # Counts produced by another estimator (or layout) are meaningless.
+            self.conn.execute("DELETE FROM tokens")
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                [("schema", CACHE_SCHEMA_VERSION), ("estimator", estimator_id)],
+            )
+            self.conn.commit()
+
+        # Load everything up front: one query instead of one per file.
+        # Without load, only what load_under() asks for is read.
+        self._entries = {}
+        if load:
+            self._entries = {
+                path: ((size, mtime_ns, inode), tokens)
+                for path, size, mtime_ns, inode, tokens in self.conn.execute(
+                    "SELECT path, size, mtime_ns, inode, tokens FROM tokens"
+                )
+            }
+        self._dirty = {}
+
+    @classmethod
+    def open_for(cls, base_path, estimator_id, load=True):
+        """Open the cache for a project, or return None if it can't be used."""
+        try:
+            return cls(os.path.join(base_path, TOKEN_CACHE_FILENAME), estimator_id, load)
+        except sqlite3.Error as e:
+            print("Failed to open token cache:", e)
+            return None
+
+    def load_under(self, dir_path):
+        """Load the entries below dir_path (one range scan of the primary key)."""
+        prefix = os.path.join(dir_path, "")
+        # Every path starting with prefix sorts between it and prefix with the separator bumped
+        end = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        try:
+            rows = self.conn.execute(
+                "SELECT path, size, mtime_ns, inode, tokens FROM tokens WHERE path >= ? AND path < ?",
+                (prefix, end),
+            ).fetchall()
+        except sqlite3.Error as e:
+            print("Failed to read token cache:", e)
+            return
+        for path, size, mtime_ns, inode, tokens in rows:
+            if path not in self._dirty:
+                self._entries[path] = ((size, mtime_ns, inode), tokens)
+
+    def lookup(self, path, st):
+        entry = self._entries.get(path)
+        if entry is not None and entry[0] == stat_key(st):
+            return entry[1]
+        return None
+
+    def store(self, path, st, tokens):
+        entry = (stat_key(st), tokens)
+        self._entries[path] = entry
+        self._dirty[path] = entry
+
+    def invalidate(self, path):
+        self._entries.pop(path, None)
+        self._dirty[path] = None
+
+    def prune(self, base_path, seen_paths):
+        """Drop entries under base_path that were not seen in the last scan."""
+        prefix = os.path.join(base_path, "")
+        for path in list(self._entries):
+            if path.startswith(prefix) and path not in seen_paths:
+                self.invalidate(path)
+
+    def flush(self):
+        if not self._dirty:
+            return
+        upserts = []
+        deletes = []
+        for path, entry in self._dirty.items():
+            if entry is None:
+                deletes.append((path,))
+            else:
+                (size, mtime_ns, inode), tokens = entry
+                upserts.append((path, size, mtime_ns, inode, tokens))
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO tokens (path, size, mtime_ns, inode, tokens) VALUES (?, ?, ?, ?, ?)",
+                    upserts,
+                )
+                self.conn.executemany("DELETE FROM tokens WHERE path = ?", deletes)
+            self._dirty = {}
+        except sqlite3.Error as e:
+            print("Failed to write token cache:", e)
+
+    def close(self):
+        self.flush()
+        self.conn.close()
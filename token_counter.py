@@ -0,0 +1,143 @@
+"""
+Token counters used for every estimate in the tool.
+
+HeuristicTokenizer is the fast default (1 token ~ 4 chars). BPETokenizer loads
+a byte-level BPE vocabulary from a local tiktoken-format file (one
+"<base64 token> <rank>" pair per line, e.g. cl100k_base.tiktoken) and counts
+real tokens. Counting is done in batches, and results are memoized by content
+hash so recounting unchanged text is nearly free.
+"""
+import os
+import re
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+
+TOKENIZER_FILENAME = "tokenizer.tiktoken"
+TOKENIZER_ENV_VAR = "AI_CONTEXT_TOKENIZER"
+
+# Approximation of the cl100k pre-tokenizer using only the stdlib `re`
+# module (\p{L} becomes [^\W\d_], \p{N} becomes \d).
+PRETOKENIZE_PATTERN = re.compile(
+    r"""'(?i:[sdmt]|ll|ve|re)"""
+    r"""|(?:[^\r\n\w]|_)?[^\W\d_]+"""
+    r"""|\d{1,3}"""
+    r"""| ?(?:[^\s\w]|_)+[\r\n]*"""
+    r"""|\s*[\r\n]+"""
+    r"""|\s+(?!\S)"""
+    r"""|\s+"""
+)
+# Pieces longer than this are merged in chunks to keep BPE roughly linear
+MAX_PIECE_BYTES = 512
+MEMO_SIZE = 100000
+
+
+class HeuristicTokenizer:
+    name = "chars/4"
+
+    def count(self, text):
+        # Rough estimate: 1 token ~ 4 chars
+        return len(text) // 4
+
+    def count_batch(self, texts):
+        return [len(t) // 4 for t in texts]
+
+
+class BPETokenizer:
+    def __init__(self, ranks, name):
+        self.ranks = ranks
+        self.name = name
+        self._piece_counts = {}
+        self._memo = OrderedDict()  # content hash -> token count
+        self._memo_lock = threading.Lock()  # counted from scan and export threads
+
+    @classmethod
+    def from_file(cls, path):
+        ranks = {}
+        with open(path, "rb") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                token, rank = line.split()
+                ranks[base64.b64decode(token)] = int(rank)
+        st = os.stat(path)
+        return cls(ranks, f"bpe:{os.path.basename(path)}:{st.st_size}")
+
+    def _merge_count(self, piece):
+        ranks = self.ranks
+        if piece in ranks:
+            return 1
+        parts = [piece[i:i + 1] for i in range(len(piece))]
+        while len(parts) > 1:
+            best = None
+            best_rank = None
+            for i in range(len(parts) - 1):
+                rank = ranks.get(parts[i] + parts[i + 1])
+                if rank is not None and (best_rank is None or rank < best_rank):
+                    best = i
+                    best_rank = rank
+            if best is None:
+                break
+            parts[best:best + 2] = [parts[best] + parts[best + 1]]
+        return len(parts)
+
+    def _count_uncached(self, text):
+        piece_counts = self._piece_counts
+        total = 0
+        for match in PRETOKENIZE_PATTERN.finditer(text):
+            piece = match.group().encode("utf-8")
+            n = piece_counts.get(piece)
+            if n is None:
+                n = 0
+                for i in range(0, len(piece), MAX_PIECE_BYTES):
+                    n += self._merge_count(piece[i:i + MAX_PIECE_BYTES])
+                if len(piece_counts) < MEMO_SIZE:
+                    piece_counts[piece] = n
+            total += n
+        return total
+
+    def count(self, text):
+        return self.count_batch([text])[0]
+
+    def count_batch(self, texts):
+        """Count many texts at once; identical contents are only counted once."""
+        memo = self._memo
+        keys = [hashlib.blake2b(t.encode("utf-8", "surrogatepass"), digest_size=16).digest() for t in texts]
+        results = []
+        for key, text in zip(keys, texts):
+            with self._memo_lock:
+                n = memo.get(key)
+                if n is not None:
+                    memo.move_to_end(key)
+            if n is None:
+                n = self._count_uncached(text)
+                with self._memo_lock:
+                    memo[key] = n
+                    if len(memo) > MEMO_SIZE:
+                        memo.popitem(last=False)
+            results.append(n)
+        return results
+
+
+HEURISTIC = HeuristicTokenizer()
+
+
+def load_tokenizer(base_path=None, path=None):
+    """
+    Pick the tokenizer: an explicit path, then $AI_CONTEXT_TOKENIZER, then
+    <base_path>/tokenizer.tiktoken. Falls back to the chars/4 heuristic.
+    """
+    if path and not os.path.isfile(path):
+        print(f"Tokenizer file not found: {path}")
+    candidates = [path, os.environ.get(TOKENIZER_ENV_VAR)]
+    if base_path:
+        candidates.append(os.path.join(base_path, TOKENIZER_FILENAME))
+    for candidate in candidates:
+        if candidate and os.path.isfile(candidate):
+            try:
+                return BPETokenizer.from_file(candidate)
+            except Exception as e:
+                print(f"Failed to load tokenizer {candidate}:", e)
+    return HEURISTIC
@@ -0,0 +1,102 @@
+"""
+Incrementally maintained token totals.
+
+TokenTotals keeps per-file counts, per-directory aggregates (every directory
+between a file and base_path) and the running total of selected tokens. A
+selection change only looks at the rule nodes under the toggled path, so an
+update costs the same whether the directory holds ten files or 100k.
+"""
+import os
+
+from selection_model import INCLUDE
+
+
+class TokenTotals:
+    def __init__(self, base_path):
+        self.base_path = os.path.normpath(base_path)
+        self.file_tokens = {}
+        self.dir_totals = {}
+        self.selected_total = 0
+        self.version = 0  # bumped whenever a file's count changes
+
+    def _ancestors(self, path):
+        """Directories from path's parent up to (and including) base_path."""
+        parent = os.path.dirname(path)
+        while True:
+            yield parent
+            if parent == self.base_path:
+                return
+            next_parent = os.path.dirname(parent)
+            if next_parent == parent:
+                return
+            parent = next_parent
+
+    def total_under(self, path):
+        tokens = self.file_tokens.get(path)
+        if tokens is not None:
+            return tokens
+        return self.dir_totals.get(path, 0)
+
+    # ------------------------------------------------------------------
+    # File count updates
+    # ------------------------------------------------------------------
+    def set_file_tokens(self, path, tokens, selection):
+        """Record (or replace) a file's count; returns the directories touched."""
+        old = self.file_tokens.get(path)
+        if old != tokens:
+            self.version += 1
+        delta = tokens - (old or 0)
+        self.file_tokens[path] = tokens
+        return self._apply_delta(path, delta, selection)
+
+    def remove_file(self, path, selection):
+        if path not in self.file_tokens:
+            return []
+        self.version += 1
+        delta = -self.file_tokens.pop(path)
+        return self._apply_delta(path, delta, selection)
+
+    def _apply_delta(self, path, delta, selection):
+        if not delta:
+            return []
+        if selection.is_selected(path):
+            self.selected_total += delta
+        dirs = list(self._ancestors(path))
+        dir_totals = self.dir_totals
+        for d in dirs:
+            dir_totals[d] = dir_totals.get(d, 0) + delta
+        return dirs
+
+    # ------------------------------------------------------------------
+    # Selection updates
+    # ------------------------------------------------------------------
+    def _selected_under(self, path, node, inherited):
+        """Selected tokens under path, given its rule-trie node (or None)."""
+        rule = inherited
+        if node is not None and node.rule is not None:
+            rule = node.rule
+        total = self.total_under(path) if rule == INCLUDE else 0
+        if node is not None:
+            for name, child in node.children.items():
+                child_path = os.path.join(path, name)
+                # Swap the child's uniform share for its actual one
+                if rule == INCLUDE:
+                    total -= self.total_under(child_path)
+                total += self._selected_under(child_path, child, rule)
+        return total
+
+    def selected_under(self, selection, path):
+        parent_rule = selection.effective_rule(os.path.dirname(path))
+        return self._selected_under(path, selection.node_for(path), parent_rule)
+
+    def apply_rule(self, selection, path, rule):
+        """selection.set_rule(path, rule), keeping selected_total in step."""
+        before = self.selected_under(selection, path)
+        selection.set_rule(path, rule)
+        after = self.total_under(path) if selection.is_selected(path) else 0
+        self.selected_total += after - before
+
+    def recompute(self, selection):
+        """Full recompute after bulk rule changes (clear, load)."""
+        self.selected_total = self.selected_under(selection, self.base_path)
+        return self.selected_total